@@ -0,0 +1,117 @@
+import numpy as np
+
+# ------------------------------------------------------------
+# Vectorized version of main._calculate_team_points_from_sets.
+#
+# A whole group's (or season's) sets are packed into flat arrays:
+#   match_idx[k], games1[k], games2[k]  - one entry per valid set
+#   n_sets[m]                           - len(sets) of match m, as the scalar
+#                                         clean-sweep check counts it
+# and scored in one pass. Results are identical to the scalar function.
+# ------------------------------------------------------------
+
+# points by the loser's games in the set: 0, 1, 2, 3, 4, anything else
+_WIN_POINTS = np.array([6, 5, 4, 3, 2, 1], dtype=np.int64)
+_LOSE_POINTS = np.array([0, 0, 1, 1, 1, 3], dtype=np.int64)
+
+WINNER_NONE, WINNER_TEAM1, WINNER_TEAM2 = 0, 1, 2
+
+# games beyond this are left to the scalar scorer: they would overflow
+# int64 (or lose precision in the float bincount sums)
+MAX_GAMES = 10 ** 9
+
+def pack_sets(sets_per_match):
+    """
+    Pack a list of per-match set lists ([[6, 4], [3, 6], ...]) into arrays.
+    Entries that are not [games, games] pairs are skipped, as the scalar
+    scorer skips them. Raises ValueError for games that are not plain ints
+    or lie outside +-MAX_GAMES (callers then fall back to the scalar scorer).
+    """
+    match_idx, games1, games2 = [], [], []
+    n_sets = np.zeros(len(sets_per_match), dtype=np.int64)
+    for m, sets in enumerate(sets_per_match):
+        n_sets[m] = len(sets)
+        for s in sets:
+            if not (isinstance(s, list) and len(s) == 2):
+                continue
+            g1, g2 = s
+            if type(g1) is not int or type(g2) is not int:
+                raise ValueError(f"non-integer games in match {m}: {s!r}")
+            if not (-MAX_GAMES <= g1 <= MAX_GAMES and -MAX_GAMES <= g2 <= MAX_GAMES):
+                raise ValueError(f"games out of range in match {m}: {s!r}")
+            match_idx.append(m)
+            games1.append(g1)
+            games2.append(g2)
+    return (
+        np.asarray(match_idx, dtype=np.int64),
+        np.asarray(games1, dtype=np.int64),
+        np.asarray(games2, dtype=np.int64),
+        n_sets,
+    )
+
+def _table_index(loser_games):
+    return np.where((loser_games >= 0) & (loser_games <= 4), loser_games, 5)
+
+def score_packed(match_idx, games1, games2, n_sets):
+    """
+    Score packed sets. Returns a dict of per-match int64 arrays:
+    team1_points, team2_points, team1_sets, team2_sets, winner
+    (winner: 0 = none, 1 = team1, 2 = team2).
+    """
+    n = len(n_sets)
+    t1_won = games1 > games2
+    t2_won = games2 > games1
+
+    loser = np.where(t1_won, games2, games1)
+    idx = _table_index(loser)
+    win_pts = _WIN_POINTS[idx] + 3
+    lose_pts = _LOSE_POINTS[idx]
+
+    t1_set_pts = np.where(t1_won, win_pts, np.where(t2_won, lose_pts, 0))
+    t2_set_pts = np.where(t2_won, win_pts, np.where(t1_won, lose_pts, 0))
+
+    def per_match(values):
+        return np.bincount(match_idx, weights=values, minlength=n).astype(np.int64)
+
+    team1_sets = np.bincount(match_idx, weights=t1_won, minlength=n).astype(np.int64)
+    team2_sets = np.bincount(match_idx, weights=t2_won, minlength=n).astype(np.int64)
+    team1_points = per_match(t1_set_pts)
+    team2_points = per_match(t2_set_pts)
+
+    winner = np.where(team1_sets > team2_sets, WINNER_TEAM1,
+                      np.where(team2_sets > team1_sets, WINNER_TEAM2, WINNER_NONE)).astype(np.int64)
+
+    # +3 match win bonus
+    team1_points += np.where(winner == WINNER_TEAM1, 3, 0)
+    team2_points += np.where(winner == WINNER_TEAM2, 3, 0)
+
+    # clean sweep bonus: won every entry of `sets` and more than 6 games in total
+    team1_games = per_match(games1)
+    team2_games = per_match(games2)
+    has_sets = n_sets > 0
+    team1_points += np.where(has_sets & (team1_sets == n_sets) & (team1_games > 6), 3, 0)
+    team2_points += np.where(has_sets & (team2_sets == n_sets) & (team2_games > 6), 3, 0)
+
+    return {
+        "team1_points": team1_points,
+        "team2_points": team2_points,
+        "team1_sets": team1_sets,
+        "team2_sets": team2_sets,
+        "winner": winner,
+    }
+
+_WINNER_NAMES = {WINNER_NONE: None, WINNER_TEAM1: "team1", WINNER_TEAM2: "team2"}
+
+def score_sets_many(sets_per_match):
+    """
+    Batch equivalent of [_calculate_team_points_from_sets(s) for s in sets_per_match],
+    returning the same 5-tuples.
+    """
+    scored = score_packed(*pack_sets(sets_per_match))
+    return [
+        (int(p1), int(p2), int(s1), int(s2), _WINNER_NAMES[int(w)])
+        for p1, p2, s1, s2, w in zip(
+            scored["team1_points"], scored["team2_points"],
+            scored["team1_sets"], scored["team2_sets"], scored["winner"],
+        )
+    ]
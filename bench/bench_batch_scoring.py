@@ -0,0 +1,63 @@
+"""
+Batch scorer benchmark.
+
+Times batch_scoring.score_packed against a loop over
+main._calculate_team_points_from_sets on synthetic matches. The equivalence of
+the two scorers is tested in tests/test_batch_scoring.py.
+
+    python bench/bench_batch_scoring.py [--matches 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import batch_scoring
+from main import _calculate_team_points_from_sets
+
+
+def synthetic_packed(n, seed):
+    rng = np.random.default_rng(seed)
+    n_sets = rng.choice([1, 2, 3], size=n, p=[0.2, 0.6, 0.2])
+    match_idx = np.repeat(np.arange(n), n_sets)
+    total = len(match_idx)
+    winner_games = rng.choice([6, 7], size=total, p=[0.85, 0.15])
+    loser_games = np.where(winner_games == 7, rng.integers(5, 7, size=total), rng.integers(0, 5, size=total))
+    flip = rng.random(total) < 0.5
+    games1 = np.where(flip, loser_games, winner_games)
+    games2 = np.where(flip, winner_games, loser_games)
+    return match_idx, games1, games2, n_sets.astype(np.int64)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--matches", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    packed = synthetic_packed(args.matches, args.seed)
+    start = time.perf_counter()
+    batch_scoring.score_packed(*packed)
+    batch_s = time.perf_counter() - start
+
+    match_idx, games1, games2, n_sets = packed
+    bounds = np.concatenate([[0], np.cumsum(n_sets)])
+    g1, g2 = games1.tolist(), games2.tolist()
+    sets_lists = [[[g1[k], g2[k]] for k in range(bounds[m], bounds[m + 1])] for m in range(args.matches)]
+    start = time.perf_counter()
+    for sets in sets_lists:
+        _calculate_team_points_from_sets(sets)
+    scalar_s = time.perf_counter() - start
+
+    print(f"matches      {args.matches:,} ({len(match_idx):,} sets)")
+    print(f"batch        {batch_s:.3f} s")
+    print(f"scalar loop  {scalar_s:.3f} s  (x{scalar_s / batch_s:.1f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
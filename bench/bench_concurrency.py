@@ -0,0 +1,87 @@
+"""
+Throughput of the async handlers under parallel load.
+
+Runs /couple_ratings and /last_games against the in-memory stand-in with a
+simulated PostgREST latency and reports requests/second at increasing
+concurrency. With db.py offloading every round-trip to its thread pool the
+throughput should grow with concurrency instead of staying flat.
+
+    python bench/bench_concurrency.py [--latency 0.02] [--requests 64]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from fake_supabase import FakeSupabase
+
+
+def _setup(latency):
+    import main
+    fake = FakeSupabase(latency=latency)
+    main.supabase = fake
+    import web_api
+    web_api.supabase = fake
+
+    group_id = "bench-group"
+    fake.tables["players"] = [
+        {"id": i, "name": f"P{i}", "group_id": group_id, "total_points": 0,
+         "sets_won": 0, "matches_played": 0, "matches_won": 0}
+        for i in range(8)
+    ]
+    fake.tables["couples"] = [
+        {"id": 100 + i, "player1": f"p{i}", "player2": f"p{i + 1}", "group_id": group_id, "total_points": i}
+        for i in range(7)
+    ]
+    fake.tables["matches"] = [
+        {"id": 1000 + i, "group_id": group_id, "match_date": f"2024-01-{i % 28 + 1:02d}",
+         "team1": ["P0", "P1"], "team2": ["P2", "P3"], "sets": [[6, 4], [6, 3]]}
+        for i in range(20)
+    ]
+    return web_api.app, group_id
+
+
+async def _throughput(app, group_id, concurrency, total):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            path = "/couple_ratings" if i % 2 else "/last_games"
+            async with sem:
+                r = await client.get(path, params={"group_id": group_id})
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return total / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated round-trip seconds")
+    parser.add_argument("--requests", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    app, group_id = _setup(args.latency)
+    results = {}
+    for concurrency in (1, 4, 16):
+        results[concurrency] = asyncio.run(_throughput(app, group_id, concurrency, args.requests))
+        print(f"concurrency={concurrency:>3}  {results[concurrency]:8.1f} req/s")
+
+    # Fail loudly if parallel load does not raise throughput (event loop blocked)
+    if results[16] < results[1] * 2:
+        print("FAIL: throughput did not scale with concurrency")
+        return 1
+    print(f"OK: x{results[16] / results[1]:.1f} throughput at concurrency 16")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
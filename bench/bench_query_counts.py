@@ -0,0 +1,80 @@
+"""
+Query counts of the fan-out endpoints.
+
+Builds a user who belongs to many groups in the in-memory stand-in and
+counts the PostgREST round-trips of /view_groups and /set_nickname. With
+the request-scoped loaders both stay constant in the number of groups;
+the script exits non-zero if a count goes over its bound.
+
+    python bench/bench_query_counts.py [--groups 50]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+from fake_supabase import FakeSupabase
+
+VIEW_GROUPS_MAX_QUERIES = 2   # user_groups + groups
+SET_NICKNAME_MAX_QUERIES = 7  # users x2, user_groups, groups, players update, data_version tokens (+ slack)
+
+
+def _setup(n_groups):
+    import main
+    fake = FakeSupabase()
+    main.supabase = fake
+    import web_api
+    web_api.supabase = fake
+
+    username = "bench@example.com"
+    fake.tables["users"] = [{"id": 1, "username": username, "nickname": "Bench"}]
+    fake.tables["groups"] = [
+        {"id": f"g{i}", "name": f"Group {i}", "player_refs_migrated": True} for i in range(n_groups)
+    ]
+    fake.tables["user_groups"] = [{"id": i, "username": username, "group_id": f"g{i}"} for i in range(n_groups)]
+    fake.tables["players"] = [
+        {"id": i, "name": "Bench", "group_id": f"g{i}", "total_points": 0,
+         "sets_won": 0, "matches_played": 0, "matches_won": 0}
+        for i in range(n_groups)
+    ]
+    return TestClient(web_api.app), fake, username
+
+
+def _count(fake, call):
+    import data_version
+    before = dict(fake.calls_by_table)
+    response = call()
+    response.raise_for_status()
+    data_version.wait_written()  # the background groups.data_version write counts too
+    used = {t: n - before.get(t, 0) for t, n in fake.calls_by_table.items() if n != before.get(t, 0)}
+    return response, sum(used.values()), used
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--groups", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    client, fake, username = _setup(args.groups)
+    ok = True
+
+    r, total, used = _count(fake, lambda: client.get("/view_groups", params={"username": username}))
+    groups = r.json()["groups"]
+    print(f"/view_groups   groups={len(groups):>4}  queries={total}  {used}")
+    ok &= len(groups) == args.groups and total <= VIEW_GROUPS_MAX_QUERIES
+
+    r, total, used = _count(fake, lambda: client.post("/set_nickname", json={"username": username, "nickname": "Renamed"}))
+    renamed = sum(1 for p in fake.tables["players"] if p["name"] == "Renamed")
+    print(f"/set_nickname  renamed={renamed:>3}  queries={total}  {used}")
+    ok &= renamed == args.groups and total <= SET_NICKNAME_MAX_QUERIES
+
+    print("OK" if ok else "FAIL: query count not bounded")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Session scheduler benchmark: a 32-player, 8-court, 8-round plan.
+
+    python bench/bench_scheduler.py [--players 32] [--courts 8] [--rounds 8] [--budget 1.0]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--players", type=int, default=32)
+    parser.add_argument("--courts", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds")
+    parser.add_argument("--mode", default="americano", choices=["americano", "mexicano"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    players = [f"player{i}" for i in range(args.players)]
+    player_points = {p: rnd.randint(0, 60) for p in players}
+    couple_points = {}
+    for i, a in enumerate(players):
+        for b in players[i + 1:]:
+            if rnd.random() < 0.3:
+                couple_points[(a, b)] = couple_points[(b, a)] = rnd.randint(0, 150)
+
+    start = time.perf_counter()
+    plan = scheduler.schedule_session(
+        players, args.courts, args.rounds, player_points, couple_points,
+        mode=args.mode, time_budget=args.budget, seed=args.seed,
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.players} players, {args.courts} courts, {args.rounds} rounds ({args.mode})")
+    print(f"elapsed      {elapsed:.3f} s  (budget {args.budget:.1f} s)")
+    print(f"restarts     {plan['restarts']}  iterations {plan['iterations']}")
+    print(f"cost         {plan['cost']}")
+    for k, v in plan["summary"].items():
+        print(f"{k:<24} {v}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Cold start: import to first response.
+
+Starts a fresh interpreter per run (so nothing is imported yet), imports
+web_api, enters the app lifespan and times the first /healthz and the
+first group read, with the background warm-up on (WARMUP=1, the read is
+made once the warm-up is done) and off (WARMUP=0, the read pays for the
+client, connections and snapshot itself).
+
+By default the app runs on a seeded SQLite file; --backend supabase
+uses the configured project and --group picks the group to read.
+
+    python bench/bench_startup.py [--runs 3] [--backend sqlite|supabase] [--group <id>]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, ROOT)
+import web_api
+t_import = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(web_api.app) as client:
+    t_started = time.perf_counter()
+    client.get("/healthz")
+    t_health = time.perf_counter()
+    if WAIT_READY:
+        while client.get("/readyz").status_code != 200:
+            time.sleep(0.005)
+    t_ready = time.perf_counter()
+    if WAIT_READY:
+        while web_api.warmup.state["finished_at"] is None:  # snapshots preloaded too
+            time.sleep(0.005)
+    t_warm = time.perf_counter()
+    response = client.get("/all_results", params={"group_id": GROUP, "limit": 20})
+    assert response.status_code == 200, response.text
+    t_read = time.perf_counter()
+print(json.dumps({
+    "import": t_import - t0,
+    "lifespan": t_started - t_import,
+    "first_health": t_health - t0,
+    "ready": t_ready - t0,
+    "warm": t_warm - t0,
+    "first_read": t_read - t0,
+    "read_latency": t_read - t_warm,
+}))
+"""
+
+
+def _seed_sqlite(path, groups=20, players=12, matches=400):
+    import sqlite_store
+    client = sqlite_store.SQLiteClient(path)
+    rnd = random.Random(7)
+    for g in range(groups):
+        group_id = f"bench-{g}"
+        client.table("groups").insert({"id": group_id, "name": f"Bench {g}", "player_refs_migrated": True}).execute()
+        ids = [r["id"] for r in client.table("players").insert(
+            [{"name": f"P{g}-{i}", "group_id": group_id} for i in range(players)]).execute().data]
+        rows = []
+        for m in range(matches):
+            four = rnd.sample(ids, 4)
+            rows.append({"group_id": group_id, "match_date": f"2024-{m % 12 + 1:02d}-{m % 28 + 1:02d}",
+                         "team1": sorted(four[:2]), "team2": sorted(four[2:]), "mode": "bench",
+                         "sets": [[6, rnd.randint(0, 4)], [rnd.randint(0, 6), 6]]})
+        client.table("matches").insert(rows).execute()
+    client.close()
+    return "bench-0"
+
+
+def _run(env, group, wait_ready):
+    code = f"ROOT = {ROOT!r}\nGROUP = {group!r}\nWAIT_READY = {wait_ready!r}\n" + CHILD
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--backend", choices=["sqlite", "supabase"], default="sqlite")
+    parser.add_argument("--group", default=None)
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, STORAGE_BACKEND=args.backend)
+    group = args.group
+    if args.backend == "sqlite":
+        env["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+        group = _seed_sqlite(env["SQLITE_PATH"])
+        env["WARMUP_GROUPS"] = group
+    elif not group:
+        parser.error("--group is required with --backend supabase")
+
+    print(f"backend={args.backend} group={group} runs={args.runs} (seconds, median)")
+    keys = ["import", "lifespan", "first_health", "ready", "warm", "first_read", "read_latency"]
+    print(f"{'mode':<12}" + "".join(f"{k:>14}" for k in keys))
+    for mode, warm in (("WARMUP=0", "0"), ("WARMUP=1", "1")):
+        runs = [_run(dict(env, WARMUP=warm), group, wait_ready=(warm == "1")) for _ in range(args.runs)]
+        print(f"{mode:<12}" + "".join(f"{statistics.median(r[k] for r in runs):>14.4f}" for k in keys))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
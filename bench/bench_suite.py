@@ -0,0 +1,208 @@
+"""
+Benchmark suite for the scoring and API hot paths.
+
+Seeds the in-memory stand-in with synthetic groups (bench/synthetic.py)
+and times:
+    scoring            main._calculate_team_points_from_sets over every match
+    update_ratings     main.update_ratings_for_group (full replay of a group)
+    propose_teams_N    /propose_teams with 8, 12 and 16 registered players
+    matches_paged      /matches_paged, first page and a player filter
+    set_nickname       /set_nickname (renames in every group of the user)
+    link_user_to_player
+Each case reports latency percentiles (ms), PostgREST round-trips per call
+and the peak memory of one call (tracemalloc, measured in a separate run so
+it does not slow the timed ones). The report is written as JSON.
+
+    python bench/bench_suite.py [--groups 4 --players 16 --matches 2000] [--out report.json]
+    python bench/bench_suite.py --compare baseline.json [--threshold 0.2] [--min-delta-ms 0.5]
+
+With --compare, a case regresses when its p50 is more than --threshold
+(a fraction) and at least --min-delta-ms slower than in the baseline, or
+when it makes more round-trips; the script then exits 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+import synthetic
+from fake_supabase import FakeSupabase
+
+
+def _setup(args):
+    import main
+    import recompute
+    import web_api
+    recompute.DEBOUNCE_SECONDS = 0.01
+    fake = FakeSupabase(latency=args.latency)
+    main.supabase = fake
+    web_api.supabase = fake
+    latency, fake.latency = fake.latency, 0.0  # seeding is not measured
+    groups = synthetic.generate(fake, args.groups, args.players, args.matches, args.seed)
+    for group_id in groups:
+        main.update_ratings_for_group(group_id)
+    fake.latency = latency
+    return fake, TestClient(web_api.app), groups
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _measure(fake, call, runs, warmup=1):
+    for _ in range(warmup):
+        call()
+    times, trips = [], []
+    for _ in range(runs):
+        before = fake.calls
+        started = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - started) * 1000)
+        trips.append(fake.calls - before)
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "runs": runs,
+        "p50_ms": round(_percentile(times, 0.50), 3),
+        "p95_ms": round(_percentile(times, 0.95), 3),
+        "p99_ms": round(_percentile(times, 0.99), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3),
+        "round_trips": round(statistics.fmean(trips), 2),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def _ok(response):
+    response.raise_for_status()
+    body = response.json()
+    if isinstance(body, dict) and "error" in body:
+        raise RuntimeError(body["error"])
+    return body
+
+
+def _cases(fake, api, groups, args):
+    import main
+    group_id = groups[0]
+    matches = [m for m in fake.tables["matches"] if m["group_id"] == group_id]
+    name = next(p["name"] for p in fake.tables["players"] if p["group_id"] == group_id and p["name"] != synthetic.NICKNAME)
+
+    def scoring():
+        for m in matches:
+            main._calculate_team_points_from_sets(m["sets"])
+
+    cases = {
+        "scoring": scoring,
+        "update_ratings": lambda: main.update_ratings_for_group(group_id),
+    }
+    for size in synthetic.NEXT_MATCH_SIZES:
+        if size <= args.players:
+            cases[f"propose_teams_{size}"] = lambda size=size: _ok(api.get(
+                "/propose_teams", params={"group_id": group_id, "match_date": synthetic.next_match_date(size)}))
+    cases["matches_paged"] = lambda: _ok(api.get("/matches_paged", params={"group_id": group_id, "limit": 20}))
+    cases["matches_paged_player"] = lambda: _ok(api.get(
+        "/matches_paged", params={"group_id": group_id, "limit": 20, "player_name": name}))
+
+    nicknames = [synthetic.NICKNAME, synthetic.NICKNAME + "2"]
+    turn = {"set_nickname": 0}
+
+    def set_nickname():
+        turn["set_nickname"] += 1
+        _ok(api.post("/set_nickname", json={"username": synthetic.USERNAME,
+                                            "nickname": nicknames[turn["set_nickname"] % 2]}))
+
+    def link_user_to_player():
+        # renames the user's player in one group back and forth
+        current = next(p["name"] for p in fake.tables["players"]
+                       if p["group_id"] == group_id and p["name"] in nicknames)
+        new = nicknames[1] if current == nicknames[0] else nicknames[0]
+        _ok(api.post("/link_user_to_player", json={"group_id": group_id, "player_name": current,
+                                                   "username": synthetic.USERNAME, "nickname": new}))
+
+    cases["set_nickname"] = set_nickname
+    cases["link_user_to_player"] = link_user_to_player
+    return cases
+
+
+def compare(report, baseline, threshold, min_delta_ms=0.0):
+    regressions = []
+    for case, now in report["cases"].items():
+        before = baseline.get("cases", {}).get(case)
+        if not before:
+            continue
+        slower = now["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        flag = ""
+        if slower > threshold and now["p50_ms"] - before["p50_ms"] > min_delta_ms:
+            flag = "SLOWER"
+        if now["round_trips"] > before["round_trips"]:
+            flag = (flag + " MORE-ROUND-TRIPS").strip()
+        print(f"{case:<22} p50 {before['p50_ms']:>10.3f} -> {now['p50_ms']:>10.3f} ms ({slower:+.0%})"
+              f"  trips {before['round_trips']:g} -> {now['round_trips']:g}  {flag}")
+        if flag:
+            regressions.append(case)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--players", type=int, default=16)
+    parser.add_argument("--matches", type=int, default=2000, help="per group")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per round-trip")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--only", action="append", help="run only these cases")
+    parser.add_argument("--out", default="bench_report.json")
+    parser.add_argument("--compare", help="baseline report to check against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown (fraction)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="smaller p50 changes are noise")
+    args = parser.parse_args(argv)
+
+    fake, api, groups = _setup(args)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {k: getattr(args, k) for k in ("groups", "players", "matches", "runs", "latency", "seed")},
+        "cases": {},
+    }
+    print(f"{'case':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'trips':>8}{'peak KB':>10}")
+    for case, call in _cases(fake, api, groups, args).items():
+        if args.only and case not in args.only:
+            continue
+        result = report["cases"][case] = _measure(fake, call, args.runs)
+        print(f"{case:<22}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+              f"{result['round_trips']:>8g}{result['peak_kb']:>10.1f}")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("report written to", args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != report["params"]:
+            print("note: baseline was run with", baseline.get("params"))
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        print("FAIL: regressions in " + ", ".join(regressions) if regressions else "OK: no regressions")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Storage backend check.
+
+Runs one API scenario (groups, players, results, edits, deletes, bulk
+import, next-match registration, a nickname change, paging, export,
+ratings) against each backend and checks that they agree: the same
+ratings, the same results, the same pages. Ids differ between backends,
+so results are compared by name.
+
+    python bench/check_storage.py                      # in-memory stand-in + SQLite
+    python bench/check_storage.py --backend sqlite
+    python bench/check_storage.py --backend supabase   # the configured project; makes
+                                                       # and deletes a throwaway group
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+NAMES = ["Nikos", "Maria", "Kostas", "Eleni", "Anna", "Yannis"]
+
+
+def _client(backend):
+    import main
+    import storage
+    import web_api
+    if backend == "memory":
+        from fake_supabase import FakeSupabase
+        client = FakeSupabase()
+    elif backend == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "padel.db")
+        client = storage.create_client("sqlite")
+    else:
+        client = storage.create_client("supabase")
+    main.supabase = client
+    web_api.supabase = client
+    return client, TestClient(web_api.app)
+
+
+def _settle(api, group_id):
+    # wait for the background recompute of everything written so far
+    version = api.get("/ratings_status", params={"group_id": group_id}).json()["version"]
+    status = api.get("/ratings_status", params={"group_id": group_id, "version": version, "wait": 10}).json()
+    assert status["ready"] and not status["error"], status
+
+
+def _scenario(backend):
+    import recompute
+    recompute.DEBOUNCE_SECONDS = 0.01
+    client, api = _client(backend)
+    username = f"check-{uuid.uuid4().hex[:8]}@example.com"
+    client.table("users").insert({"username": username, "nickname": "Nikos"}).execute()
+
+    group_id = api.post("/create_group", json={"group_name": "Check", "username": username}).json()["id"]
+    try:
+        for name in NAMES[1:]:
+            api.post("/add_player_to_group", json={"group_id": group_id, "nickname": name})
+        results = [
+            ("2024-03-01", ["Nikos", "Maria"], ["Kostas", "Eleni"], [[6, 4], [6, 3]]),
+            ("2024-03-01", ["Anna", "Yannis"], ["Nikos", "Kostas"], [[2, 6], [6, 7]]),
+            ("2024-03-08", ["Nikos", "Eleni"], ["Maria", "Anna"], [[6, 1], [4, 6], [7, 5]]),
+            ("2024-03-15", ["Kostas", "Yannis"], ["Maria", "Eleni"], [[6, 0]]),
+        ]
+        for date, team1, team2, sets in results:
+            r = api.post("/register_match_result", json={
+                "group_id": group_id, "match_date": date, "mode": "check", "couples": [team1, team2],
+                "results": [{"team1": team1, "team2": team2, "sets": sets}]}).json()
+            assert "message" in r, r
+        dup = api.post("/register_match_result", json={
+            "group_id": group_id, "match_date": "2024-03-01", "mode": "check", "couples": [["Maria", "Nikos"], ["Eleni", "Kostas"]],
+            "results": [{"team1": ["Maria", "Nikos"], "team2": ["Eleni", "Kostas"], "sets": [[6, 0]]}]}).json()
+        assert "error" in dup, dup
+
+        csv_body = "match_date,team1_a,team1_b,team2_a,team2_b,sets\n" \
+                   "2024-03-22,Anna,Eleni,Nikos,Yannis,\"6-4, 6-4\"\n" \
+                   "2024-03-22,Eleni,Anna,Yannis,Nikos,6-0\n" \
+                   "2024-03-29,Maria,Kostas,Anna,Yannis,\"3-6, 6-3, 10-8\"\n"
+        report = api.post("/import_matches", params={"group_id": group_id}, content=csv_body).json()
+        assert report["imported"] == 2 and report["duplicates"] == 1, report
+        _settle(api, group_id)
+
+        games = api.get("/all_results", params={"group_id": group_id, "limit": 100}).json()["games"]
+        by_date = {g["date"][:10]: g for g in games}
+        api.post("/edit_result", json={"group_id": group_id, "match_id": by_date["2024-03-15"]["id"],
+                                       "team1": ["Kostas", "Yannis"], "team2": ["Maria", "Eleni"], "sets": [[3, 6], [2, 6]]})
+        api.post("/delete_result", json={"group_id": group_id, "match_id": by_date["2024-03-08"]["id"]})
+
+        api.post("/create_next_match", json={"group_id": group_id, "match_date": "2024-04-05"})
+        for name in ["Nikos", "Maria", "Anna", "Kostas"]:
+            api.post("/add_player_to_next_match", json={"group_id": group_id, "match_date": "2024-04-05", "username": name})
+        api.post("/remove_player_from_next_match", json={"group_id": group_id, "match_date": "2024-04-05", "username": "Anna"})
+
+        r = api.post("/set_nickname", json={"username": username, "nickname": "Nick"}).json()
+        assert "message" in r, r
+        _settle(api, group_id)
+
+        verify = api.get("/verify_ratings", params={"group_id": group_id}).json()
+        assert verify.get("consistent"), verify
+
+        players = api.get("/players", params={"group_id": group_id}).json()
+        couples = api.get("/couple_ratings", params={"group_id": group_id}).json()["couples"]
+        games = api.get("/all_results", params={"group_id": group_id, "limit": 100}).json()["games"]
+        nexts = api.get("/next_matches", params={"group_id": group_id}).json()
+        export = api.get("/export_matches", params={"group_id": group_id}).text.splitlines()
+
+        pages, cursor = [], None
+        while True:
+            params = {"group_id": group_id, "limit": 2, "player_name": "nick", **({"cursor": cursor} if cursor else {})}
+            page = api.get("/matches_paged", params=params).json()
+            pages.append([m["date"][:10] for m in page["matches"]])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+        return {
+            "players": sorted((p["name"], p["total_points"], p["matches_played"], p["matches_won"], p["sets_won"]) for p in players),
+            "couples": sorted((tuple(sorted([c["player1_name"], c["player2_name"]])), c["total_points"], c["matches_played"]) for c in couples),
+            "games": [(g["date"][:10], sorted(g["team1"]), sorted(g["team2"]), g["sets_string"]) for g in games],
+            "next_matches": json.dumps(nexts, sort_keys=True, default=str).count("Nick"),
+            "export_lines": len(export),
+            "pages": pages,
+        }
+    finally:
+        api.post("/delete_group", json={"group_id": group_id})
+        client.table("users").delete().eq("username", username).execute()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", action="append", choices=["memory", "sqlite", "supabase"])
+    args = parser.parse_args(argv)
+    backends = args.backend or ["memory", "sqlite"]
+
+    outcomes = {}
+    for backend in backends:
+        started = time.perf_counter()
+        outcomes[backend] = _scenario(backend)
+        print(f"{backend:<9} ok  {time.perf_counter() - started:.2f}s  "
+              f"players={len(outcomes[backend]['players'])} games={len(outcomes[backend]['games'])}")
+
+    first, *rest = backends
+    ok = True
+    for backend in rest:
+        for section, value in outcomes[first].items():
+            if outcomes[backend][section] != value:
+                ok = False
+                print(f"MISMATCH {section}: {first}={value!r} {backend}={outcomes[backend][section]!r}")
+    print("OK" if ok else "FAIL: backends disagree")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+In-memory stand-in for the subset of the supabase / postgrest client used
+by main.py and web_api.py (table().select/insert/upsert/update/delete with
+eq/in_/order/limit/range filters, rpc). Used by the benchmarks only.
+"""
+import copy
+import datetime
+import itertools
+import threading
+import time
+
+
+class _Resp:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _cmp_key(v):
+    return (v is None, v if v is not None else 0)
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.cols = "*"
+        self.filters = []
+        self.orders = []
+        self._limit = None
+        self._offset = 0
+        self.payload = None
+        self.on_conflict = ""
+        self.count = None
+
+    # --- verbs
+    def select(self, cols="*", count=None):
+        self.op = "select"; self.cols = cols; self.count = count
+        return self
+
+    def insert(self, payload, **kw):
+        self.op = "insert"; self.payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict="", **kw):
+        self.op = "upsert"; self.payload = payload; self.on_conflict = on_conflict
+        return self
+
+    def update(self, payload, **kw):
+        self.op = "update"; self.payload = payload
+        return self
+
+    def delete(self, **kw):
+        self.op = "delete"
+        return self
+
+    # --- filters
+    def eq(self, c, v):
+        self.filters.append(lambda r: str(r.get(c)) == str(v) if v is not None else r.get(c) is None)
+        return self
+
+    def neq(self, c, v):
+        self.filters.append(lambda r: str(r.get(c)) != str(v))
+        return self
+
+    def in_(self, c, vals):
+        s = {str(v) for v in vals}
+        self.filters.append(lambda r: str(r.get(c)) in s)
+        return self
+
+    def gt(self, c, v):
+        self.filters.append(lambda r: r.get(c) is not None and r.get(c) > v); return self
+
+    def gte(self, c, v):
+        self.filters.append(lambda r: r.get(c) is not None and r.get(c) >= v); return self
+
+    def lt(self, c, v):
+        self.filters.append(lambda r: r.get(c) is not None and r.get(c) < v); return self
+
+    def lte(self, c, v):
+        self.filters.append(lambda r: r.get(c) is not None and r.get(c) <= v); return self
+
+    def or_(self, expr):
+        # supports "a.lt.X,and(a.eq.X,b.lt.Y)" style keyset filters
+        def parse_atom(atom):
+            col, op, val = atom.split(".", 2)
+            def f(r):
+                x = r.get(col)
+                if x is None:
+                    return False
+                y = type(x)(val) if isinstance(x, int) else val
+                return {"lt": x < y, "gt": x > y, "eq": x == y, "lte": x <= y, "gte": x >= y}[op]
+            return f
+
+        def split_top(s):
+            parts, depth, cur = [], 0, ""
+            for ch in s:
+                if ch == "(":
+                    depth += 1
+                elif ch == ")":
+                    depth -= 1
+                if ch == "," and depth == 0:
+                    parts.append(cur); cur = ""
+                else:
+                    cur += ch
+            parts.append(cur)
+            return parts
+
+        def parse(s):
+            if s.startswith("and(") and s.endswith(")"):
+                subs = [parse(p) for p in split_top(s[4:-1])]
+                return lambda r: all(f(r) for f in subs)
+            return parse_atom(s)
+
+        subs = [parse(p) for p in split_top(expr)]
+        self.filters.append(lambda r: any(f(r) for f in subs))
+        return self
+
+    def order(self, c, desc=False, **kw):
+        self.orders.append((c, desc)); return self
+
+    def limit(self, n, **kw):
+        self._limit = n; return self
+
+    def range(self, a, b, **kw):
+        self._offset = a; self._limit = b - a + 1; return self
+
+    # --- exec
+    def _match(self, r):
+        return all(f(r) for f in self.filters)
+
+    def _project(self, r):
+        if self.cols.strip() == "*":
+            return copy.deepcopy(r)
+        cols = [c.strip() for c in self.cols.split(",")]
+        return {c: copy.deepcopy(r.get(c)) for c in cols}
+
+    def execute(self):
+        if self.db.latency:
+            time.sleep(self.db.latency)  # simulated PostgREST round-trip, outside the lock
+        with self.db.lock:
+            self.db.calls += 1
+            self.db.calls_by_table[self.table] = self.db.calls_by_table.get(self.table, 0) + 1
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.op == "select":
+                out = [r for r in rows if self._match(r)]
+                total = len(out)
+                for c, desc in reversed(self.orders):
+                    out.sort(key=lambda r: _cmp_key(r.get(c)), reverse=desc)
+                out = out[self._offset:]
+                if self._limit is not None:
+                    out = out[: self._limit]
+                return _Resp([self._project(r) for r in out], total if self.count else None)
+            if self.op in ("insert", "upsert"):
+                payload = self.payload if isinstance(self.payload, list) else [self.payload]
+                res = []
+                keys = [k.strip() for k in self.on_conflict.split(",") if k.strip()]
+                by_key, by_id = {}, {}
+                if self.op == "upsert":
+                    # one pass over the table, then a dict lookup per row (first match wins)
+                    for r in rows:
+                        if keys:
+                            by_key.setdefault(tuple(str(r.get(k)) for k in keys), r)
+                        by_id.setdefault(r.get("id"), r)
+                for p in payload:
+                    p = copy.deepcopy(p)
+                    if self.op == "upsert":
+                        hit = by_key.get(tuple(str(p.get(k)) for k in keys)) if keys else None
+                        if hit is None and "id" in p:
+                            hit = by_id.get(p["id"])
+                        if hit is not None:
+                            hit.update(p); res.append(copy.deepcopy(hit)); continue
+                    p.setdefault("id", next(self.db.ids))
+                    p.setdefault("created_at", self.db.now())
+                    rows.append(p)
+                    if self.op == "upsert":
+                        if keys:
+                            by_key.setdefault(tuple(str(p.get(k)) for k in keys), p)
+                        by_id.setdefault(p["id"], p)
+                    res.append(copy.deepcopy(p))
+                return _Resp(res)
+            if self.op == "update":
+                res = []
+                for r in rows:
+                    if self._match(r):
+                        r.update(copy.deepcopy(self.payload)); res.append(copy.deepcopy(r))
+                return _Resp(res)
+            if self.op == "delete":
+                keep, gone = [], []
+                for r in rows:
+                    (gone if self._match(r) else keep).append(r)
+                rows[:] = keep
+                return _Resp(gone)
+
+
+class FakeSupabase:
+    def __init__(self, latency=0.0):
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.calls = 0
+        self.calls_by_table = {}
+        self.latency = latency
+        self._tick = itertools.count()
+        self.rpcs = {}
+
+    def now(self):
+        base = datetime.datetime(2024, 1, 1)
+        return (base + datetime.timedelta(microseconds=next(self._tick))).isoformat()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        fn = self.rpcs[name]
+        db = self
+
+        class _R:
+            def execute(self_inner):
+                if db.latency:
+                    time.sleep(db.latency)
+                with db.lock:
+                    db.calls += 1
+                return _Resp(fn(db, params or {}))
+        return _R()
@@ -0,0 +1,73 @@
+"""
+Synthetic data for the benchmarks.
+
+Fills a client (the in-memory stand-in, or anything with the same builder
+API) with N groups of M players and K matches each: realistic set scores
+(mostly 6-x and 7-5/7-6, best of three, the odd unfinished set), player
+refs by players.id as in migrated groups, one user who is a member of every
+group, and next matches with 8, 12 and 16 registered players.
+
+    from synthetic import generate
+    groups = generate(client, groups=4, players=16, matches=2000, seed=7)
+"""
+import datetime
+import random
+
+NEXT_MATCH_SIZES = (8, 12, 16)
+USERNAME = "bench@example.com"
+NICKNAME = "Bench"
+
+
+def set_score(rnd):
+    roll = rnd.random()
+    if roll < 0.80:
+        winner, loser = 6, rnd.choice([0, 1, 2, 2, 3, 3, 4, 4])
+    elif roll < 0.95:
+        winner, loser = 7, rnd.choice([5, 6])
+    else:
+        winner = loser = rnd.randint(2, 5)  # unfinished
+    return [winner, loser] if rnd.random() < 0.5 else [loser, winner]
+
+
+def match_sets(rnd):
+    first, second = set_score(rnd), set_score(rnd)
+    sets = [first, second]
+    if (first[0] > first[1]) != (second[0] > second[1]) and rnd.random() < 0.8:
+        sets.append(set_score(rnd) if rnd.random() < 0.7 else rnd.choice([[10, 8], [7, 10], [10, 6]]))
+    return sets
+
+
+def next_match_date(size):
+    return f"2030-01-{size:02d}"
+
+
+def generate(client, groups=4, players=16, matches=2000, seed=7):
+    """Seed client; returns the group ids. players >= 16 for every next-match size."""
+    rnd = random.Random(seed)
+    start = datetime.date(2023, 1, 1)
+    client.table("users").insert({"username": USERNAME, "nickname": NICKNAME}).execute()
+    group_ids = []
+    for g in range(groups):
+        group_id = f"bench-{g}"
+        group_ids.append(group_id)
+        client.table("groups").insert({"id": group_id, "name": f"Bench {g}", "player_refs_migrated": True}).execute()
+        client.table("user_groups").insert({"username": USERNAME, "group_id": group_id}).execute()
+        names = [NICKNAME] + [f"P{g}-{i}" for i in range(1, players)]
+        ids = [r["id"] for r in client.table("players").insert([
+            {"name": name, "group_id": group_id, "total_points": 0, "sets_won": 0,
+             "matches_played": 0, "matches_won": 0} for name in names]).execute().data]
+
+        rows = []
+        for k in range(matches):
+            four = rnd.sample(ids, 4)
+            day = start + datetime.timedelta(days=k * 730 // max(matches, 1))
+            rows.append({"group_id": group_id, "match_date": day.isoformat(), "mode": "bench",
+                         "team1": sorted(four[:2]), "team2": sorted(four[2:]), "sets": match_sets(rnd)})
+        for i in range(0, len(rows), 500):
+            client.table("matches").insert(rows[i:i + 500]).execute()
+
+        for size in NEXT_MATCH_SIZES:
+            if size <= len(ids):
+                client.table("next_matches").insert({"group_id": group_id, "match_date": next_match_date(size),
+                                                     "registered_users": rnd.sample(ids, size)}).execute()
+    return group_ids
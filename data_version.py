@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import read_cache
+
+# ------------------------------------------------------------
+# Per-group data version for conditional GETs.
+#
+# Every write to a group calls bump(group_id) once the write is done; it
+# also drops the group's read_cache entries. Group-scoped GET endpoints
+# send an ETag built from the version (plus the path and query, so each
+# URL has its own validator) and answer If-None-Match with 304 before
+# touching the database.
+#
+# Listeners (subscribe) hear about every bump with the tables that
+# changed, so in-process stores such as snapshot.py can refresh.
+#
+# Versions count in this process; the ETag carries a per-process epoch so
+# that versions restarting from 0 after a restart (or coming from another
+# worker) can never match an ETag a client kept.
+#
+# Across workers: every bump also writes a fresh random token to
+# groups.data_version (in the background; bumps that queue up while a write
+# is running, or that bump_many makes, share one token and one update per
+# chunk of groups, so a change touching many groups stays a few queries).
+# sync(group_id), called
+# by the group-scoped reads, reads that token at most every
+# DATA_VERSION_CHECK_SECONDS (0: on every read) and turns a token it did
+# not write or see before into a local bump, so ETags, the read cache,
+# snapshots and leaderboards drop what another worker's write changed.
+# ------------------------------------------------------------
+CHECK_SECONDS = float(os.environ.get("DATA_VERSION_CHECK_SECONDS", "1"))
+WRITE_CHUNK = 200
+
+_EPOCH = uuid.uuid4().hex[:8]
+
+_lock = threading.Lock()
+_versions = {}
+_listeners = []
+_tokens = {}    # group_id -> the last groups.data_version written or read here
+_checked = {}   # group_id -> time.monotonic() of the last read
+_dirty = set()    # groups whose new token is not written yet
+_writing = set()  # groups of the token write in progress
+_flushing = False
+_held = 0         # bump_many calls in progress: the write waits for them
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="data-version")
+
+def current(group_id: str) -> int:
+    with _lock:
+        return _versions.get(group_id, 0)
+
+def bump(group_id: str, tables=None, persist: bool = True) -> int:
+    """
+    Record that group_id's data changed. tables names the tables that were
+    written (None: any of them). persist=False for changes that came from
+    another worker (already in groups.data_version). Returns the new version.
+    """
+    if not group_id:
+        return 0
+    with _lock:
+        version = _versions.get(group_id, 0) + 1
+        _versions[group_id] = version
+        if persist:
+            _dirty.add(group_id)
+            if not _held:
+                _start_flush()
+    read_cache.invalidate(group_id)
+    for listener in list(_listeners):
+        listener(group_id, tables)
+    return version
+
+def bump_many(group_ids, tables=None):
+    """bump() every group of group_ids; their tokens are written together."""
+    global _held
+    with _lock:
+        _held += 1
+    try:
+        for group_id in group_ids:
+            bump(group_id, tables)
+    finally:
+        with _lock:
+            _held -= 1
+            if not _held and _dirty:
+                _start_flush()
+
+def wait_written():
+    """Block until the tokens of every bump so far are written."""
+    _writer.submit(lambda: None).result()
+
+def _start_flush():
+    global _flushing
+    if not _flushing:
+        _flushing = True
+        _writer.submit(_flush)
+
+def _flush():
+    """Write a new token for every bumped group (runs on _writer, one at a time)."""
+    global _flushing, _writing
+    import main  # main imports this module
+    while True:
+        with _lock:
+            if not _dirty:
+                _flushing = False
+                return
+            _writing = set(_dirty)
+            _dirty.clear()
+            token = uuid.uuid4().hex[:16]
+            for group_id in _writing:
+                _tokens[group_id] = token
+        groups = list(_writing)
+        try:
+            for i in range(0, len(groups), WRITE_CHUNK):
+                main.supabase.table("groups").update({"data_version": token}).in_("id", groups[i:i + WRITE_CHUNK]).execute()
+        except Exception as e:
+            print("Error writing data_version:", e)
+        with _lock:
+            now = time.monotonic()
+            for group_id in groups:
+                _checked[group_id] = now
+            _writing = set()
+
+def _pending(group_id):
+    return group_id in _dirty or group_id in _writing
+
+def refresh(group_id: str) -> bool:
+    """Read groups.data_version; True (after a local bump) if another worker changed the group."""
+    import main
+    rows = main.supabase.table("groups").select("data_version").eq("id", group_id).execute().data or []
+    token = rows[0].get("data_version") if rows else None
+    with _lock:
+        _checked[group_id] = time.monotonic()
+        if _pending(group_id):
+            return False  # our own token is on its way: what we read is older
+        seen = group_id in _tokens
+        changed = seen and _tokens[group_id] != token
+        _tokens[group_id] = token
+    if changed:
+        bump(group_id, persist=False)
+    return changed
+
+def _due(group_id):
+    with _lock:
+        if _pending(group_id):
+            return False
+        checked = _checked.get(group_id)
+        return checked is None or time.monotonic() - checked >= CHECK_SECONDS
+
+async def sync(group_id: str):
+    """Pick up another worker's writes to group_id (at most every CHECK_SECONDS)."""
+    if group_id and _due(group_id):
+        await db.run(refresh, group_id)
+
+def subscribe(listener):
+    """Call listener(group_id, tables) after every bump."""
+    _listeners.append(listener)
+
+def etag(group_id: str, path: str, query: str = "") -> str:
+    """Strong ETag for one group-scoped URL at the group's current version."""
+    url = hashlib.blake2s(f"{path}?{query}".encode(), digest_size=6).hexdigest()
+    return f'"{_EPOCH}-{current(group_id)}-{url}"'
+
+def matches(if_none_match: str, tag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 asks for GETs)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return tag in (t[2:] if t.startswith("W/") else t for t in candidates)
@@ -0,0 +1,28 @@
+import os
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# ------------------------------------------------------------
+# Non-blocking access to the (synchronous) supabase client.
+# Every PostgREST round-trip from an async handler goes through a bounded
+# thread pool, so a slow query never stalls the uvicorn event loop.
+# ------------------------------------------------------------
+DB_MAX_WORKERS = int(os.environ.get("DB_MAX_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking call (query or main.py logic) on the db thread pool."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()  # the request's route label (metrics.py) goes along
+    return await loop.run_in_executor(_executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+async def execute(query):
+    """await db.execute(supabase.table(...).select(...)) instead of query.execute()."""
+    return await run(query.execute)
+
+async def gather(*queries):
+    """Execute independent queries concurrently; results come back in order."""
+    return await asyncio.gather(*(execute(q) for q in queries))
@@ -0,0 +1,140 @@
+import datetime
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+# ------------------------------------------------------------
+# Per-group mutual exclusion for the ratings recompute.
+#
+# main.update_ratings_for_group and main.apply_match_changes are wrapped
+# in @exclusive: two recomputes of the same group never interleave their
+# reads and upserts, whoever calls them (the recompute worker,
+# /recalculate_points, the player-id migration, scripts). Other groups are
+# not held up.
+#
+# RECOMPUTE_LOCK=process (default) locks within this process only.
+# RECOMPUTE_LOCK=database also takes a lease row in recompute_locks
+# (migrations/004_recompute_locks.sql) for several uvicorn workers or
+# hosts. PostgREST has no session to keep a pg_advisory_lock on between
+# requests, so the lease is the row itself: whoever inserts the group's
+# row holds it until it deletes it or the lease expires
+# (RECOMPUTE_LOCK_TTL_SECONDS, renewed while the recompute runs, so a
+# crashed worker cannot block the group for longer than that).
+# ------------------------------------------------------------
+MODE = os.environ.get("RECOMPUTE_LOCK", "process").strip().lower()
+LEASE_TTL_SECONDS = float(os.environ.get("RECOMPUTE_LOCK_TTL_SECONDS", "120"))
+LEASE_POLL_SECONDS = 0.2
+HOLDER = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # this process
+
+_locks = defaultdict(threading.Lock)
+_locks_guard = threading.Lock()
+_held = threading.local()   # group_id -> depth, for re-entrant calls on one thread
+_counters = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "lease_takeovers": 0}
+
+def _count(name, amount=1):
+    with _locks_guard:
+        _counters[name] += amount
+
+def _client():
+    import main
+    return main.supabase
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _lease_row(group_id):
+    expires = _now() + datetime.timedelta(seconds=LEASE_TTL_SECONDS)
+    return {"group_id": group_id, "holder": HOLDER, "expires_at": expires.isoformat()}
+
+def _take_lease(group_id):
+    """One attempt: clear an expired lease, then insert ours (the primary key decides)."""
+    client = _client()
+    expired = client.table("recompute_locks").delete() \
+        .eq("group_id", group_id).lt("expires_at", _now().isoformat()).execute().data
+    if expired:
+        _count("lease_takeovers")
+    try:
+        client.table("recompute_locks").insert(_lease_row(group_id)).execute()
+        return True
+    except Exception:
+        # a duplicate key means someone holds it; anything else is a real error
+        if client.table("recompute_locks").select("holder").eq("group_id", group_id).execute().data:
+            return False
+        raise
+
+def _renew_lease(group_id):
+    _client().table("recompute_locks").update({"expires_at": _lease_row(group_id)["expires_at"]}) \
+        .eq("group_id", group_id).eq("holder", HOLDER).execute()
+
+def _release_lease(group_id):
+    _client().table("recompute_locks").delete().eq("group_id", group_id).eq("holder", HOLDER).execute()
+
+def _lease_keeper(group_id, stop):
+    # renew at a third of the TTL until the holder is done
+    while not stop.wait(LEASE_TTL_SECONDS / 3):
+        try:
+            _renew_lease(group_id)
+        except Exception as e:
+            print("Error renewing recompute lock for group", group_id, ":", e)
+
+@contextmanager
+def hold(group_id: str):
+    """Hold group_id's recompute lock (re-entrant on the same thread)."""
+    depth = getattr(_held, "groups", None)
+    if depth is None:
+        depth = _held.groups = defaultdict(int)
+    if depth[group_id]:
+        depth[group_id] += 1
+        try:
+            yield
+        finally:
+            depth[group_id] -= 1
+        return
+
+    with _locks_guard:
+        lock = _locks[group_id]
+    started = time.perf_counter()
+    waited = not lock.acquire(blocking=False)
+    if waited:
+        lock.acquire()
+    stop = None
+    try:
+        if MODE == "database":
+            while not _take_lease(group_id):
+                waited = True
+                time.sleep(LEASE_POLL_SECONDS)
+            stop = threading.Event()
+            threading.Thread(target=_lease_keeper, args=(group_id, stop), daemon=True).start()
+        _count("acquired")
+        if waited:
+            _count("waited")
+            _count("wait_seconds", time.perf_counter() - started)
+        depth[group_id] = 1
+        try:
+            yield
+        finally:
+            depth[group_id] = 0
+    finally:
+        if stop is not None:
+            stop.set()
+            try:
+                _release_lease(group_id)
+            except Exception as e:
+                print("Error releasing recompute lock for group", group_id, ":", e)
+        lock.release()
+
+def exclusive(fn):
+    """Decorator for fn(group_id, ...): the body runs under hold(group_id)."""
+    @functools.wraps(fn)
+    def wrapper(group_id, *args, **kwargs):
+        with hold(group_id):
+            return fn(group_id, *args, **kwargs)
+    return wrapper
+
+def stats() -> dict:
+    with _locks_guard:
+        return {"mode": MODE, **_counters, "wait_seconds": round(_counters["wait_seconds"], 4)}
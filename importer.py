@@ -0,0 +1,241 @@
+import codecs
+import csv
+import datetime
+import json
+
+import db
+import main
+
+# ------------------------------------------------------------
+# Bulk match import for /import_matches (CSV or NDJSON, one match per line).
+#
+# Lines are parsed as the body streams in. Each row is validated, checked
+# against the group's existing matches and the rows before it by its
+# canonical matchup key (main.matchup_key), and inserted IMPORT_CHUNK rows
+# per statement. A bad row is reported with its line number and skipped;
+# it never stops the import. The caller queues a single recompute for
+# everything that was inserted.
+#
+# CSV: a header line, then
+#   match_date,team1_a,team1_b,team2_a,team2_b,sets[,mode]
+#   2024-03-05,Nikos,Maria,Kostas,Eleni,"6-4, 3-6, 7-5"
+# NDJSON:
+#   {"match_date": "2024-03-05", "team1": ["Nikos", "Maria"],
+#    "team2": ["Kostas", "Eleni"], "sets": [[6, 4], [3, 6]], "mode": "..."}
+# sets may be given as [[6, 4], ...] or as text ("6-4, 3-6" / "6-4 3-6").
+# ------------------------------------------------------------
+IMPORT_CHUNK = 500
+EXISTING_PAGE = 1000       # PostgREST's default max rows per response
+MAX_REPORTED_ERRORS = 1000
+MAX_GAMES = 99
+CSV_COLUMNS = ("match_date", "team1_a", "team1_b", "team2_a", "team2_b", "sets")
+
+def parse_sets(value):
+    """[[6, 4], [3, 6]] from a list of pairs or from text like "6-4, 3-6"."""
+    if isinstance(value, str):
+        pairs = []
+        for part in value.replace(",", " ").replace(";", " ").split():
+            a, sep, b = part.partition("-")
+            if not sep:
+                raise ValueError(f"bad set '{part}' (expected games-games)")
+            pairs.append([a, b])
+    elif isinstance(value, list):
+        pairs = value
+    else:
+        raise ValueError("sets missing")
+
+    sets = []
+    for pair in pairs:
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            raise ValueError(f"bad set {pair!r} (expected two numbers)")
+        try:
+            g1, g2 = int(pair[0]), int(pair[1])
+        except (TypeError, ValueError):
+            raise ValueError(f"bad set {pair!r} (games must be whole numbers)")
+        if not (0 <= g1 <= MAX_GAMES and 0 <= g2 <= MAX_GAMES):
+            raise ValueError(f"bad set {pair!r} (games out of range)")
+        sets.append([g1, g2])
+    if not sets:
+        raise ValueError("no sets")
+    return sets
+
+def _validate(match_date, team1, team2, sets, mode):
+    try:
+        match_date = datetime.date.fromisoformat(str(match_date).strip()[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"bad match_date {match_date!r} (expected YYYY-MM-DD)")
+    teams = []
+    for team in (team1, team2):
+        if not isinstance(team, list) or len(team) != 2:
+            raise ValueError("each team needs exactly 2 players")
+        team = [str(p).strip() for p in team]
+        if not all(team):
+            raise ValueError("empty player name")
+        teams.append(team)
+    if len({main.normalize_name(p) for p in teams[0] + teams[1]}) != 4:
+        raise ValueError("a player appears twice")
+    return {"match_date": match_date, "team1": teams[0], "team2": teams[1],
+            "sets": parse_sets(sets), "mode": mode}
+
+def row_from_csv(record: dict, default_mode):
+    return _validate(
+        record.get("match_date"),
+        [record.get("team1_a"), record.get("team1_b")],
+        [record.get("team2_a"), record.get("team2_b")],
+        record.get("sets"),
+        (record.get("mode") or "").strip() or default_mode,
+    )
+
+def row_from_json(obj, default_mode):
+    if not isinstance(obj, dict):
+        raise ValueError("expected a JSON object")
+    return _validate(obj.get("match_date"), obj.get("team1"), obj.get("team2"),
+                     obj.get("sets"), obj.get("mode") or default_mode)
+
+async def _lines(chunks):
+    """(line_no, text) from an async iterator of byte chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    line_no = 0
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.rstrip("\r")
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield line_no + 1, buf.rstrip("\r")
+
+def _existing_matchup_keys(group_id, aliases):
+    keys = set()
+    start = 0
+    while True:
+        page = main.supabase.table("matches").select("id,match_date,team1,team2") \
+            .eq("group_id", group_id).order("id").range(start, start + EXISTING_PAGE - 1).execute().data or []
+        for m in page:
+            keys.add(main.matchup_key(m.get("match_date"), main._safe_json_list(m.get("team1")),
+                                      main._safe_json_list(m.get("team2")), aliases))
+        if len(page) < EXISTING_PAGE:
+            return keys
+        start += EXISTING_PAGE
+
+class _Import:
+    def __init__(self, group_id, aliases, taken, create_players, dry_run):
+        self.group_id = group_id
+        self.aliases = aliases
+        self.taken = taken
+        self.create_players = create_players
+        self.dry_run = dry_run
+        self.changes = []
+        self.report = {"rows": 0, "imported": 0, "duplicates": 0, "error_count": 0,
+                       "errors": [], "players_created": []}
+
+    def error(self, line_no, message):
+        self.report["error_count"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"line": line_no, "error": str(message)})
+
+    async def _create_players(self, names):
+        rows = [{"name": n, "group_id": self.group_id, "total_points": 0, "sets_won": 0,
+                 "matches_played": 0, "matches_won": 0} for n in names]
+        created = (await db.execute(main.supabase.table("players").insert(rows))).data or []
+        for pr in created:
+            self.aliases[str(pr["id"])] = pr["id"]
+            self.aliases.setdefault(main.normalize_name(pr.get("name")), pr["id"])
+        self.report["players_created"].extend(pr.get("name") for pr in created)
+
+    async def flush(self, pending):
+        if not pending:
+            return
+        # players the group does not have yet: one insert per chunk, or an error per row
+        unknown = {}
+        for _, row in pending:
+            for p in row["team1"] + row["team2"]:
+                if main._lookup_player(p, self.aliases) is None:
+                    unknown.setdefault(main.normalize_name(p), p)
+        problem = None if self.create_players else "unknown player(s)"
+        if unknown and self.create_players and not self.dry_run:
+            try:
+                await self._create_players(list(unknown.values()))
+                unknown = {}
+            except Exception as e:
+                problem = f"could not create player(s) ({e})"
+
+        accepted = []
+        for line_no, row in pending:
+            missing = [p for p in row["team1"] + row["team2"] if main.normalize_name(p) in unknown]
+            if missing and problem:
+                self.error(line_no, f"{problem}: {', '.join(missing)}")
+                continue
+            key = main.matchup_key(row["match_date"], row["team1"], row["team2"], self.aliases)
+            if key in self.taken:
+                self.report["duplicates"] += 1
+                continue
+            self.taken.add(key)
+            team1 = [main.player_ref(p, self.aliases) for p in sorted(row["team1"])]
+            team2 = [main.player_ref(p, self.aliases) for p in sorted(row["team2"])]
+            accepted.append((line_no, key, {
+                "group_id": self.group_id,
+                "match_date": row["match_date"],
+                "team1": team1,
+                "team2": team2,
+                "sets": row["sets"],
+                "mode": row["mode"],
+                "couples": [team1, team2],
+            }))
+
+        if self.dry_run or not accepted:
+            self.report["imported"] += len(accepted)
+            return
+        try:
+            inserted = (await db.execute(main.supabase.table("matches").insert([r for _, _, r in accepted]))).data or []
+        except Exception as e:
+            for line_no, key, _ in accepted:
+                self.taken.discard(key)
+                self.error(line_no, f"insert failed: {e}")
+            return
+        self.report["imported"] += len(inserted)
+        self.changes.extend((None, row) for row in inserted)
+
+async def import_matches(group_id: str, chunks, fmt: str = "csv", create_players: bool = False,
+                         dry_run: bool = False, default_mode: str = "import"):
+    """
+    Import matches from an async iterator of byte chunks.
+    Returns (report, changes): changes are the (None, inserted_row) pairs to
+    queue for the ratings. Raises ValueError if the CSV header is unusable.
+    """
+    players = (await db.execute(main.supabase.table("players").select("id,name").eq("group_id", group_id))).data or []
+    aliases = main.player_aliases(players)
+    taken = await db.run(_existing_matchup_keys, group_id, aliases)
+    state = _Import(group_id, aliases, taken, create_players, dry_run)
+
+    header = None
+    pending = []
+    async for line_no, line in _lines(chunks):
+        if not line.strip():
+            continue
+        if fmt == "csv" and header is None:
+            header = [h.strip().lower() for h in next(csv.reader([line]))]
+            missing = [c for c in CSV_COLUMNS if c not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+            continue
+        state.report["rows"] += 1
+        try:
+            if fmt == "csv":
+                row = row_from_csv(dict(zip(header, next(csv.reader([line])))), default_mode)
+            else:
+                row = row_from_json(json.loads(line), default_mode)
+        except (ValueError, csv.Error) as e:  # ValueError includes json.JSONDecodeError
+            state.error(line_no, e)
+            continue
+        pending.append((line_no, row))
+        if len(pending) >= IMPORT_CHUNK:
+            await state.flush(pending)
+            pending = []
+    await state.flush(pending)
+
+    if state.changes:
+        await db.run(main.sync_match_players, state.changes, state.aliases)
+    return state.report, state.changes
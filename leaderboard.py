@@ -0,0 +1,352 @@
+import bisect
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from sortedcontainers import SortedList
+
+import data_version
+import db
+import main
+
+# ------------------------------------------------------------
+# Date-range leaderboards from daily_stats.
+#
+# Per group, every player and couple gets a series: its days (sorted) and
+# running totals of points, sets, matches and wins up to each day. The
+# totals over [from, to] are two bisects and a subtraction, O(log n) in
+# the number of days played, whatever the range; no match is rescanned.
+#
+# The series are built from the group's daily_stats rows on first use and
+# dropped when the group's daily totals may have changed (data_version:
+# daily_stats from a local recompute; matches / players, which is what
+# Realtime reports of other processes' writes and recomputes; any table
+# when data_version.sync finds another worker's token), so the next read
+# rebuilds them. At most LEADERBOARD_MAX_GROUPS groups are kept.
+# ------------------------------------------------------------
+MAX_GROUPS = int(os.environ.get("LEADERBOARD_MAX_GROUPS", "128"))
+KINDS = ("player", "couple")
+SORTS = {
+    "points": lambda t: (t[0], t[3], t[1]),   # then wins, then sets
+    "wins": lambda t: (t[3], t[0], t[1]),
+    "sets": lambda t: (t[1], t[0], t[3]),
+    "matches": lambda t: (t[2], t[0], t[3]),
+}
+_FIELDS = ("total_points", "sets_won", "matches_played", "matches_won")
+
+class Series:
+    """One player's (or couple's) days and running totals."""
+    __slots__ = ("days", "running")
+
+    def __init__(self):
+        self.days = []
+        self.running = [(0, 0, 0, 0)]  # running[i] = totals of days[:i]
+
+    def add(self, day, values):
+        # rows arrive ordered by day
+        last = self.running[-1]
+        self.days.append(day)
+        self.running.append(tuple(a + b for a, b in zip(last, values)))
+
+    def between(self, date_from=None, date_to=None):
+        """(points, sets, matches, wins) over from <= day <= to (either end open)."""
+        lo = bisect.bisect_left(self.days, date_from) if date_from else 0
+        hi = bisect.bisect_right(self.days, date_to) if date_to else len(self.days)
+        if hi <= lo:
+            return (0, 0, 0, 0)
+        return tuple(b - a for a, b in zip(self.running[lo], self.running[hi]))
+
+class GroupBoard:
+    def __init__(self, group_id):
+        self.group_id = group_id
+        self.series = {kind: {} for kind in KINDS}  # kind -> (player1, player2) -> Series
+
+    def top(self, kind, date_from=None, date_to=None, limit=10, sort="points"):
+        """The best `limit` entries over the range: (key, totals), best first."""
+        totals = ((key, s.between(date_from, date_to)) for key, s in self.series[kind].items())
+        played = (item for item in totals if item[1][2] > 0)
+        return heapq.nlargest(limit, played, key=lambda item: SORTS[sort](item[1]))
+
+def build(group_id, rows):
+    """The board of a group's daily_stats rows, ordered by day."""
+    board = GroupBoard(group_id)
+    for row in rows:
+        kind = row.get("kind")
+        if kind not in KINDS:
+            continue
+        key = (row.get("player1"), row.get("player2") or "")
+        series = board.series[kind].get(key)
+        if series is None:
+            series = board.series[kind][key] = Series()
+        series.add(str(row.get("day"))[:10], tuple(int(row.get(f) or 0) for f in _FIELDS))
+    return board
+
+_lock = threading.Lock()
+_boards = OrderedDict()          # group_id -> GroupBoard, least recently used first
+_generation = {}                 # group_id -> change events seen
+_load_locks = {}
+_counters = {"hits": 0, "loads": 0}
+_WATCHED = {"daily_stats", "matches", "players"}
+
+def on_change(group_id, tables=None):
+    if tables is not None and not _WATCHED.intersection(tables):
+        return
+    with _lock:
+        _generation[group_id] = _generation.get(group_id, 0) + 1
+        _boards.pop(group_id, None)
+
+data_version.subscribe(on_change)
+
+def _load(group_id):
+    with _lock:
+        lock = _load_locks.setdefault(group_id, threading.Lock())
+    with lock:  # concurrent readers share one load
+        with _lock:
+            board = _boards.get(group_id)
+            if board is not None:
+                return board
+            generation = _generation.get(group_id, 0)
+        board = build(group_id, main._read_daily_stats(group_id, main._new_io()))
+        with _lock:
+            _counters["loads"] += 1
+            if _generation.get(group_id, 0) == generation:  # no change while loading
+                _boards[group_id] = board
+                while len(_boards) > MAX_GROUPS:
+                    _boards.popitem(last=False)
+        return board
+
+async def get(group_id: str) -> GroupBoard:
+    await data_version.sync(group_id)
+    with _lock:
+        board = _boards.get(group_id)
+        if board is not None:
+            _boards.move_to_end(group_id)
+            _counters["hits"] += 1
+            return board
+    return await db.run(_load, group_id)
+
+def stats() -> dict:
+    with _lock:
+        return {**_counters, "groups": len(_boards), "max_groups": MAX_GROUPS}
+
+# ------------------------------------------------------------
+# Global leaderboard: every user across all of their groups.
+#
+# A user's player in a group is the players row named after their nickname
+# (users.nickname, else the username, as /create_group and /set_nickname
+# have it). Their global totals are the sums of those rows' ratings over
+# the groups they are a member of (user_groups).
+#
+# Each group's contribution ({username: totals}) is kept, so a change in
+# one group re-reads that group only (players, members, their nicknames)
+# and moves just the users whose totals changed. Change events
+# (data_version: players, user_groups, or any table) only mark the group
+# dirty; the next read applies it. The first read loads every group.
+# Other workers' writes reach this process as groups.data_version tokens
+# (data_version.py): at most every LEADERBOARD_GLOBAL_CHECK_SECONDS a read
+# scans the tokens (one paged select of groups) and marks dirty every group
+# whose token changed, appeared or went away since the previous scan.
+#
+# Users with at least one match are ranked in a SortedList by
+# (-points, -wins, -sets, username): a page is a slice and the rank of one
+# user a bisect, O(log n) either way.
+# ------------------------------------------------------------
+GLOBAL_PAGE = 1000  # PostgREST's default max rows per response
+GLOBAL_IN_CHUNK = 200  # usernames per in_() filter (it goes in the URL)
+GLOBAL_CHECK_SECONDS = float(os.environ.get("LEADERBOARD_GLOBAL_CHECK_SECONDS", "5"))
+_GLOBAL_TABLES = {"players", "user_groups"}
+_ZERO = (0, 0, 0, 0)
+
+_global = {
+    "watching": False,       # change events mark groups dirty (set when the first load starts)
+    "loaded": False,
+    "dirty": set(),          # group ids to re-read before the next answer
+    "contrib": {},           # group_id -> {username: totals}
+    "totals": {},            # username -> totals over all their groups
+    "groups": {},            # username -> number of groups they have a player in
+    "nicknames": {},         # username -> display name
+    "ranked": SortedList(),  # (-points, -wins, -sets, username) of users who played
+    "refreshes": 0,
+    "versions": {},          # group_id -> groups.data_version at the last scan
+    "checked": None,         # time.monotonic() of the last scan
+}
+_global_refresh = threading.Lock()  # one thread applies changes at a time
+
+def _rank_key(username, totals):
+    points, sets_won, _, won = totals
+    return (-points, -won, -sets_won, username)
+
+def on_global_change(group_id, tables=None):
+    if tables is not None and not _GLOBAL_TABLES.intersection(tables):
+        return
+    with _lock:
+        if _global["watching"]:
+            _global["dirty"].add(group_id)
+
+data_version.subscribe(on_global_change)
+
+def _read_all(table, columns, order, **eq):
+    rows, start = [], 0
+    while True:
+        query = main.supabase.table(table).select(columns)
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        for column in order:
+            query = query.order(column)  # unique: stable pages
+        page = query.range(start, start + GLOBAL_PAGE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < GLOBAL_PAGE:
+            return rows
+        start += GLOBAL_PAGE
+
+def _contributions(players_rows, members, nicknames):
+    """{username: totals} of one group: each member's player row, if any."""
+    aliases = main.player_aliases(players_rows)
+    by_id = {pr["id"]: pr for pr in players_rows}
+    out = {}
+    for username in members:
+        pid = aliases.get(main.normalize_name(nicknames.get(username) or username))
+        if pid is not None:
+            out[username] = tuple(int(by_id[pid].get(f) or 0) for f in _FIELDS)
+    return out
+
+def _set_contributions(group_id, contrib):
+    # caller holds _lock
+    old = _global["contrib"].get(group_id, {})
+    if contrib:
+        _global["contrib"][group_id] = contrib
+    else:
+        _global["contrib"].pop(group_id, None)
+    for username in old.keys() | contrib.keys():
+        before, after = old.get(username), contrib.get(username)
+        if before == after:
+            continue
+        totals = _global["totals"].get(username, _ZERO)
+        if totals[2] > 0:
+            _global["ranked"].remove(_rank_key(username, totals))
+        totals = tuple(t - b + a for t, b, a in zip(totals, before or _ZERO, after or _ZERO))
+        groups = _global["groups"].get(username, 0) + (after is not None) - (before is not None)
+        if groups:
+            _global["totals"][username] = totals
+            _global["groups"][username] = groups
+        else:
+            for key in ("totals", "groups", "nicknames"):
+                _global[key].pop(username, None)
+            continue
+        if totals[2] > 0:
+            _global["ranked"].add(_rank_key(username, totals))
+
+def _read_versions():
+    return {g["id"]: g.get("data_version") for g in _read_all("groups", "id,data_version", ("id",))}
+
+def _versions_due():
+    # caller holds _lock
+    checked = _global["checked"]
+    return checked is None or time.monotonic() - checked >= GLOBAL_CHECK_SECONDS
+
+def _check_versions():
+    """Mark dirty the groups whose data_version token changed since the last scan."""
+    versions = _read_versions()
+    with _lock:
+        seen = _global["versions"]
+        _global["dirty"].update(g for g in versions.keys() | seen.keys() if versions.get(g) != seen.get(g))
+        _global["versions"] = versions
+        _global["checked"] = time.monotonic()
+
+def _load_global():
+    with _lock:
+        _global["dirty"].clear()
+        _global["watching"] = True  # changes made while loading are re-read after it
+    versions = _read_versions()  # before the rows: a write meanwhile shows up at the next scan
+    with _lock:
+        _global["versions"] = versions
+        _global["checked"] = time.monotonic()
+    users = {u["username"]: u.get("nickname") for u in _read_all("users", "username,nickname", ("username",))}
+    members = defaultdict(list)
+    for m in _read_all("user_groups", "username,group_id", ("group_id", "username")):
+        members[m["group_id"]].append(m["username"])
+    players = defaultdict(list)
+    for pr in _read_all("players", "id,group_id,name," + ",".join(_FIELDS), ("id",)):
+        players[pr["group_id"]].append(pr)
+    with _lock:
+        _global["nicknames"].update((u, n or u) for u, n in users.items())
+        for group_id, usernames in members.items():
+            _set_contributions(group_id, _contributions(players.get(group_id, []), usernames, users))
+        _global["loaded"] = True
+
+def _refresh_group(group_id):
+    players = _read_all("players", "id,name," + ",".join(_FIELDS), ("id",), group_id=group_id)
+    usernames = [m["username"] for m in _read_all("user_groups", "username", ("username",), group_id=group_id)]
+    users = {}
+    for i in range(0, len(usernames), GLOBAL_IN_CHUNK):
+        chunk = usernames[i:i + GLOBAL_IN_CHUNK]
+        rows = main.supabase.table("users").select("username,nickname").in_("username", chunk).execute().data or []
+        users.update((u["username"], u.get("nickname")) for u in rows)
+    with _lock:
+        _set_contributions(group_id, _contributions(players, usernames, users))
+        for username in usernames:
+            if username in _global["groups"]:
+                _global["nicknames"][username] = users.get(username) or username
+
+def _refresh_global():
+    with _global_refresh:
+        with _lock:
+            loaded = _global["loaded"]
+        if not loaded:
+            _load_global()
+        else:
+            with _lock:
+                due = _versions_due()
+            if due:
+                _check_versions()
+        while True:
+            with _lock:
+                if not _global["dirty"]:
+                    return
+                group_id = _global["dirty"].pop()  # an event meanwhile marks it again
+                _global["refreshes"] += 1
+            try:
+                _refresh_group(group_id)
+            except Exception:
+                with _lock:
+                    _global["dirty"].add(group_id)
+                raise
+
+def _global_entry(rank, username):
+    points, sets_won, played, won = _global["totals"][username]
+    return {"rank": rank, "player": _global["nicknames"].get(username, username),
+            "total_points": points, "sets_won": sets_won, "matches_played": played,
+            "matches_won": won, "groups": _global["groups"][username]}
+
+async def _fresh_global():
+    with _lock:
+        fresh = _global["loaded"] and not _global["dirty"] and not _versions_due()
+    if not fresh:
+        await db.run(_refresh_global)
+
+async def global_page(offset=0, limit=20) -> dict:
+    """Ranks offset+1 .. offset+limit of the global leaderboard, and the total."""
+    await _fresh_global()
+    with _lock:
+        ranked = _global["ranked"]
+        page = ranked.islice(offset, offset + limit)
+        return {"total": len(ranked),
+                "entries": [_global_entry(offset + i + 1, key[-1]) for i, key in enumerate(page)]}
+
+async def global_rank(username: str):
+    """One user's entry (rank None before their first match), or None if unknown."""
+    await _fresh_global()
+    with _lock:
+        totals = _global["totals"].get(username)
+        if totals is None:
+            return None
+        rank = _global["ranked"].bisect_left(_rank_key(username, totals)) + 1 if totals[2] > 0 else None
+        return _global_entry(rank, username)
+
+def global_stats() -> dict:
+    with _lock:
+        return {"users": len(_global["totals"]), "ranked": len(_global["ranked"]),
+                "groups": len(_global["contrib"]), "dirty": len(_global["dirty"]),
+                "refreshes": _global["refreshes"]}
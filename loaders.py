@@ -0,0 +1,80 @@
+import asyncio
+from collections import defaultdict
+
+import db
+
+# ------------------------------------------------------------
+# Request-scoped batching loaders (DataLoader style).
+#
+# loader.load(key) returns an awaitable. Keys asked for while the event loop
+# is busy with the current tick are collected and fetched together with one
+# `select ... where column in (...)` on the next tick; results are memoized
+# for the rest of the request, so asking twice costs nothing. Build a fresh
+# Loaders per request (web_api: Depends(request_loaders)) so nothing is
+# shared between requests or outlives a write.
+# ------------------------------------------------------------
+
+class Loader:
+    def __init__(self, client, table: str, column: str = "id", columns: str = "*", many: bool = False):
+        """
+        many=False: load(key) -> the row whose column == key, or None.
+        many=True:  load(key) -> every row whose column == key (a list).
+        """
+        self.client = client
+        self.table = table
+        self.column = column
+        self.columns = columns
+        self.many = many
+        self.queries = 0
+        self._cache = {}   # str(key) -> future
+        self._queue = []   # keys waiting for the next batch
+        self._tasks = set()
+
+    def load(self, key):
+        ck = str(key)
+        fut = self._cache.get(ck)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._cache[ck] = fut
+            if not self._queue:
+                loop.call_soon(self._start_batch)
+            self._queue.append(key)
+        return fut
+
+    async def load_many(self, keys):
+        return list(await asyncio.gather(*(self.load(k) for k in keys)))
+
+    def _start_batch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)  # keep a reference until it finishes
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        keys, self._queue = self._queue, []
+        futures = [self._cache[str(k)] for k in keys]
+        try:
+            self.queries += 1
+            query = self.client.table(self.table).select(self.columns).in_(self.column, keys)
+            rows = (await db.execute(query)).data or []
+        except Exception as e:
+            for k, fut in zip(keys, futures):
+                self._cache.pop(str(k), None)  # let a later load retry
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        found = defaultdict(list)
+        for row in rows:
+            found[str(row.get(self.column))].append(row)
+        for k, fut in zip(keys, futures):
+            hits = found.get(str(k), [])
+            if not fut.done():
+                fut.set_result(hits if self.many else (hits[0] if hits else None))
+
+class Loaders:
+    """The loaders one request can use."""
+    def __init__(self, client):
+        self.groups = Loader(client, "groups")
+        self.user_groups = Loader(client, "user_groups", "username", many=True)
+
@@ -1,19 +1,59 @@
 import os
 import json
+import hashlib
+import threading
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from fastapi import FastAPI
 from collections import defaultdict
 
+import data_version
+import group_lock
+import metrics
+import profiling
+import skill
+import storage
+
 # ------------------------------------------------------------
 # Setup
 # ------------------------------------------------------------
-app = FastAPI()
 load_dotenv()
 
 url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+
+# The client (and the supabase package behind it) is built on first use,
+# not at import: importing it is most of a cold start. web_api's warm-up
+# builds it in the background right after startup.
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # STORAGE_BACKEND: supabase (default) or sqlite; round-trips counted for /metrics
+                _client = metrics.instrument(storage.create_client(url=url, key=key))
+    return _client
+
+class _LazyClient:
+    """Stands in for the client until the first query builds it."""
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+supabase = _LazyClient()
+
+_batch_scoring = False  # not imported yet
+
+def load_batch_scoring():
+    """The NumPy batch scorer (imported on first use), or None without numpy."""
+    global _batch_scoring
+    if _batch_scoring is False:
+        try:
+            import batch_scoring
+        except ImportError:  # numpy not installed: scalar scoring only
+            batch_scoring = None
+        _batch_scoring = batch_scoring
+    return _batch_scoring
 
 # ------------------------------------------------------------
 # Helpers
@@ -128,195 +168,1076 @@ def _split_team_points_to_players(team_points: int, team_norm_in_order):
     return {p1: base + remainder, p2: base}
 
 # ------------------------------------------------------------
-# Main function (KEEP NAME)
+# Player references
+# Matches (team1 / team2 / couples), next-match registrations, couples and
+# match_players refer to players by players.id, so a rename only touches
+# the players row. Rows written before migrate_group_player_ids may still
+# hold nicknames: every reader resolves both through the group's aliases,
+# and references that match no player fall back to the normalized name.
 # ------------------------------------------------------------
-def update_ratings_for_group(group_id: str):
-    # --------
-    # Load players (so we can reset everyone)
-    # --------
-    players_rows = (
-        supabase.table("players")
-        .select("name")
-        .eq("group_id", group_id)
-        .execute()
-        .data
-        or []
-    )
+def player_aliases(players_rows):
+    """{str(id): id, normalized name: id} for a group's players rows."""
+    aliases = {}
+    by_id = sorted((pr for pr in players_rows if pr.get("id") is not None),
+                   key=lambda r: (len(str(r["id"])), str(r["id"])))
+    for pr in reversed(by_id):
+        norm = normalize_name(pr.get("name"))
+        if norm:
+            aliases[norm] = pr["id"]  # duplicate nicknames: the lowest id wins
+    for pr in players_rows:
+        if pr.get("id") is not None:
+            aliases[str(pr["id"])] = pr["id"]
+    return aliases
 
-    # --------
-    # Load matches newest first.
-    # Multiple matches per date => tie-break by created_at if possible, else id.
-    # --------
-    base_q = (
-        supabase.table("matches")
-        .select("*")
-        .eq("group_id", group_id)
-        .order("match_date", desc=True)
-    )
+def load_player_aliases(group_id: str, io=None):
+    query = supabase.table("players").select("id,name").eq("group_id", group_id)
+    rows = (_run(query, io) if io is not None else query.execute()).data or []
+    return player_aliases(rows)
+
+def _lookup_player(ref, aliases):
+    if ref is None:
+        return None
+    s = str(ref)
+    pid = aliases.get(s)
+    return pid if pid is not None else aliases.get(normalize_name(s))
+
+def player_ref(ref, aliases):
+    """What to store for a player: its id if known, else the value as given."""
+    pid = _lookup_player(ref, aliases)
+    return pid if pid is not None else ref
+
+def player_key(ref, aliases):
+    """Ratings / index key of a stored reference: str(id), else the normalized name."""
+    pid = _lookup_player(ref, aliases)
+    return str(pid) if pid is not None else normalize_name(str(ref) if ref is not None else "")
+
+def matchup_key(match_date, team1, team2, aliases):
+    """
+    Canonical hash of who played whom on a day: the same for either team
+    order, player order, nickname case, and nickname vs id references.
+    """
+    teams = sorted("+".join(sorted(player_key(p, aliases) for p in team)) for team in (team1, team2))
+    return hashlib.sha1(f"{str(match_date)[:10]}|{teams[0]}|{teams[1]}".encode()).hexdigest()
+
+LAST_N_MATCHES = 8          # each player's rating = their own last 8 matches
+INCREMENTAL_PAGE_SIZE = 100  # matches per page when sliding last-8 windows
+TRACE_PLAYER = "nikos"      # normalized (lowercase); change if needed
+
+def _empty_stats():
+    return {"points": 0, "sets": 0, "matches": 0, "wins": 0}
+
+def _new_io():
+    """Counters returned by the recompute functions."""
+    return {"players_written": 0, "couples_written": 0, "daily_written": 0, "rows_written": 0, "round_trips": 0}
+
+def _run(query, io):
+    """Execute a PostgREST query, counting the round-trip."""
+    io["round_trips"] += 1
+    return query.execute()
+
+def _parse_match(match, aliases=None):
+    """
+    (team1_keys, team2_keys, sets) of a match row, or None for rows the
+    ratings ignore (bad teams / no sets). Keys come from player_key.
+    """
+    team1 = _safe_json_list(match.get("team1"))
+    team2 = _safe_json_list(match.get("team2"))
+    sets = _safe_json_list(match.get("sets"))
+
+    if not team1 or not team2 or not sets:
+        return None
+    if len(team1) != 2 or len(team2) != 2:
+        return None
+
+    team1_norm = [player_key(p, aliases or {}) for p in team1]
+    team2_norm = [player_key(p, aliases or {}) for p in team2]
+    return team1_norm, team2_norm, sets
+
+def _score_match(match, parsed=None, totals=None, aliases=None):
+    """
+    Parse one match row into what the ratings need.
+    Returns None for rows the ratings ignore (bad teams / no sets).
+    parsed / totals can be passed in when they were computed in bulk.
+    """
+    if parsed is None:
+        parsed = _parse_match(match, aliases)
+    if parsed is None:
+        return None
+    team1_norm, team2_norm, sets = parsed
+
+    if totals is None:
+        totals = _calculate_team_points_from_sets(sets)
+    team1_total, team2_total, team1_sets_won, team2_sets_won, winner = totals
+
+    return {
+        "match_id": match.get("id"),
+        "match_date": match.get("match_date"),
+        "winner": winner,
+        "teams": [
+            ("team1", team1_norm, team1_total, team1_sets_won),
+            ("team2", team2_norm, team2_total, team2_sets_won),
+        ],
+    }
+
+def _player_entries(scored):
+    """(pnorm, history row) for every player of a scored match."""
+    for team, team_norm, team_total, team_sets_won in scored["teams"]:
+        # ---- PLAYER POINTS (per player, split team points) ----
+        player_points = _split_team_points_to_players(team_total, team_norm)
+        for pnorm in team_norm:
+            if not pnorm:
+                continue
+            yield pnorm, {
+                "match_id": scored["match_id"],
+                "match_date": scored["match_date"],
+                "team": team,
+                "winner": scored["winner"],
+                "team_points": team_total,
+                "player_points": int(player_points.get(pnorm, 0)),
+                "sets_won": int(team_sets_won),
+                "won_match": 1 if scored["winner"] == team else 0,
+            }
+
+def _couple_entries(scored):
+    """(couple, stats) for both couples of a scored match."""
+    # ---- COUPLE POINTS (KEEP YOUR OLD LOGIC) ----
+    # couple points += team_total_awarded * 2
+    for team, team_norm, team_total, team_sets_won in scored["teams"]:
+        if len(team_norm) != 2:
+            continue
+        yield tuple(sorted(team_norm)), {
+            "points": int(team_total) * 2,
+            "sets": team_sets_won,
+            "matches": 1,
+            "wins": 1 if scored["winner"] == team else 0,
+        }
+
+def _window_stats(history):
+    """Aggregate a player's stats from their own last 8 matches (history newest -> oldest)."""
+    last8 = history[:LAST_N_MATCHES]
+    return {
+        "matches": len(last8),
+        "points": sum(x["player_points"] for x in last8),
+        "sets": sum(x["sets_won"] for x in last8),
+        "wins": sum(x["won_match"] for x in last8),
+    }
+
+def _trace_player(last8, ps):
+    print(f"\n[NIKOS TRACE] Using last {len(last8)} matches for Nikos:")
+    running = 0
+    for i, x in enumerate(last8, start=1):
+        running += x["player_points"]
+        print(
+            f"[NIKOS TRACE] {i}/8 match_id={x['match_id']} date={x['match_date']} "
+            f"team={x['team']} winner={x['winner']} "
+            f"team_points={x['team_points']} player_points={x['player_points']} running_total={running}"
+        )
+    print(f"[NIKOS TRACE] FINAL last8_points={ps['points']} last8_matches={ps['matches']} wins={ps['wins']} sets_won={ps['sets']}\n")
+
+def _fetch_matches_newest_first(group_id: str, io, start=None, end=None):
+    """
+    Load matches newest first (optionally one page of them).
+    Multiple matches per date => tie-break by created_at if possible, else id.
+    Returns None if the query failed.
+    """
+    def run(tie_break):
+        q = (
+            supabase.table("matches")
+            .select("*")
+            .eq("group_id", group_id)
+            .order("match_date", desc=True)
+            .order(tie_break, desc=True)
+        )
+        if tie_break != "id":
+            q = q.order("id", desc=True)  # rows of one bulk insert share created_at
+        if start is not None:
+            q = q.range(start, end)
+        return _run(q, io)
 
     try:
-        matches_resp = base_q.order("created_at", desc=True).execute()
+        matches_resp = run("created_at")
         if hasattr(matches_resp, "status_code") and matches_resp.status_code >= 400:
             raise Exception("created_at ordering failed")
     except Exception:
-        matches_resp = base_q.order("id", desc=True).execute()
+        matches_resp = run("id")
 
     if hasattr(matches_resp, "status_code") and matches_resp.status_code >= 400:
         print("Error fetching matches:", getattr(matches_resp, "data", None))
-        return
+        return None
 
-    matches = matches_resp.data or []
+    return matches_resp.data or []
+
+BATCH_SCORING_MIN_MATCHES = 256  # below this the scalar loop is as fast
+
+def _score_sets_many(sets_per_match):
+    """Scores of many matches at once: NumPy batch when available, else scalar."""
+    scorer = load_batch_scoring() if len(sets_per_match) >= BATCH_SCORING_MIN_MATCHES else None
+    if scorer is not None:
+        try:
+            return scorer.score_sets_many(sets_per_match)
+        except (ValueError, OverflowError):
+            pass  # odd values in sets: the scalar scorer handles them as before
+    return [_calculate_team_points_from_sets(sets) for sets in sets_per_match]
 
+def _replay_group(matches, aliases=None, daily=None):
+    """
+    Full replay of a group's matches (newest first).
+    Returns (player_stats, couple_stats, per_player_history); a history
+    holds the player's last 8 matches. daily (a dict) is filled with the
+    daily_stats totals when given.
+    """
     # --------
     # Build per-player match history (newest -> oldest)
     # Each player keeps their own last 8 match rows
     # --------
     per_player_history = defaultdict(list)  # pnorm -> list of dict rows (newest first)
-    couple_stats = defaultdict(lambda: {"points": 0, "sets": 0, "matches": 0, "wins": 0})
-
-    TRACE_PLAYER = "nikos"  # normalized (lowercase); change if needed
+    couple_stats = defaultdict(_empty_stats)
 
+    parsed = []
     for match in matches:
-        match_id = match.get("id")
-        match_date = match.get("match_date")
+        p = _parse_match(match, aliases)
+        if p is not None:
+            parsed.append((match, p))
+    all_totals = _score_sets_many([sets for _, (_, _, sets) in parsed])
+
+    for (match, p), totals in zip(parsed, all_totals):
+        scored = _score_match(match, p, totals)
+
+        # push match into each player's personal history (only the last 8 count)
+        for pnorm, entry in _player_entries(scored):
+            history = per_player_history[pnorm]
+            if len(history) < LAST_N_MATCHES:
+                history.append(entry)
+
+        for couple, cs in _couple_entries(scored):
+            cstats = couple_stats[couple]
+            for k, v in cs.items():
+                cstats[k] += v
+
+        if daily is not None:
+            for key, ds in _daily_entries(scored):
+                totals = daily.setdefault(key, _empty_stats())
+                for k, v in ds.items():
+                    totals[k] += v
+
+    # --------
+    # Aggregate per-player stats from EACH player's own last 8 matches
+    # (history is already newest -> oldest because matches were iterated newest first)
+    # --------
+    player_stats = {pnorm: _window_stats(history) for pnorm, history in per_player_history.items()}
+    return player_stats, couple_stats, per_player_history
+
+def _player_payload(ps):
+    return {
+        "total_points": int(ps["points"]),
+        "sets_won": int(ps["sets"]),
+        "matches_played": int(ps["matches"]),
+        "matches_won": int(ps["wins"]),
+    }
+
+def _couple_payload(group_id, p1, p2, cs):
+    return {
+        "player1": p1,
+        "player2": p2,
+        "group_id": group_id,
+        "total_points": int(cs["points"]),
+        "sets_won": int(cs["sets"]),
+        "matches_played": int(cs["matches"]),
+        "matches_won": int(cs["wins"]),
+    }
+
+def _couple_row_stats(row):
+    return {
+        "points": int(row.get("total_points") or 0),
+        "sets": int(row.get("sets_won") or 0),
+        "matches": int(row.get("matches_played") or 0),
+        "wins": int(row.get("matches_won") or 0),
+    }
+
+STAT_COLUMNS = ("total_points", "sets_won", "matches_played", "matches_won")
+
+def _unchanged(row, payload):
+    """True if the stored row already holds these stats (no write needed)."""
+    return all(int(row.get(k) or 0) == payload[k] for k in STAT_COLUMNS)
+
+PLAYER_UPDATE_CHUNK = 200  # ids per in_() filter (it goes in the URL)
+
+def _update_players(group_id: str, updates, io):
+    """
+    Write {players.id: columns} as UPDATEs of those columns only, one per
+    distinct set of values (players with the same stats share it). Never
+    inserts and never touches the name, so a rename or a delete that lands
+    while a recompute runs stays as it is.
+    """
+    by_values = defaultdict(list)
+    for pid, values in updates.items():
+        by_values[tuple(sorted(values.items()))].append(pid)
+    for values, ids in by_values.items():
+        for i in range(0, len(ids), PLAYER_UPDATE_CHUNK):
+            _run(supabase.table("players").update(dict(values))
+                 .eq("group_id", group_id).in_("id", ids[i:i + PLAYER_UPDATE_CHUNK]), io)
+    if updates:
+        data_version.bump(group_id, tables=("players",))
+        io["players_written"] += len(updates)
+        io["rows_written"] += len(updates)
+
+def _write_player_stats(group_id: str, players_rows, player_stats, io):
+    """
+    Update the stat columns of every player whose stats changed.
+    players_rows must be full rows so unchanged players can be skipped;
+    player_stats is keyed by str(players.id).
+    """
+    updates = {}
+    for pr in players_rows:
+        pkey = str(pr.get("id"))
+        if pkey not in player_stats:
+            continue
+        payload = _player_payload(player_stats[pkey])
+        if _unchanged(pr, payload):
+            continue
+        updates[pr.get("id")] = payload
+    _update_players(group_id, updates, io)
+
+def _write_couple_stats(group_id: str, existing_rows, couple_stats, io):
+    """
+    One bulk upsert on (group_id, player1, player2) for every couple whose
+    stats changed; new couples are inserted by the same statement.
+    """
+    existing = {(r.get("player1"), r.get("player2")): r for r in existing_rows}
+    rows = []
+    for (p1, p2), cs in couple_stats.items():
+        if not p1 or not p2:
+            continue
+        payload = _couple_payload(group_id, p1, p2, cs)
+        row = existing.get((p1, p2))
+        if row is not None and _unchanged(row, payload):
+            continue
+        rows.append(payload)
+
+    if rows:
+        _run(supabase.table("couples").upsert(rows, on_conflict="group_id,player1,player2"), io)
+        data_version.bump(group_id, tables=("couples",))
+        io["couples_written"] += len(rows)
+        io["rows_written"] += len(rows)
+
+# ------------------------------------------------------------
+# daily_stats: per-player and per-couple totals per day, behind the
+# date-range leaderboards (leaderboard.py). The full replay writes them
+# all; apply_match_changes adds the changed matches' delta, as it does for
+# couples. Keys are (kind, player1, player2, day) with kind "player"
+# (player2 = "") or "couple"; points are the player's split points and the
+# couple's doubled team points, as in players and couples.
+# ------------------------------------------------------------
+DAILY_CHUNK = 500
+DAILY_PAGE = 1000
+
+def _daily_entries(scored):
+    """(key, stats) of every player and couple of a scored match."""
+    day = str(scored["match_date"])[:10] if scored["match_date"] else None
+    if not day:
+        return
+    for pnorm, entry in _player_entries(scored):
+        yield ("player", pnorm, "", day), {
+            "points": entry["player_points"], "sets": entry["sets_won"], "matches": 1, "wins": entry["won_match"],
+        }
+    for couple, cs in _couple_entries(scored):
+        yield ("couple", couple[0], couple[1], day), cs
+
+def _daily_key(row):
+    return (row.get("kind"), row.get("player1"), row.get("player2") or "", str(row.get("day"))[:10])
 
-        team1 = _safe_json_list(match.get("team1"))
-        team2 = _safe_json_list(match.get("team2"))
-        sets = _safe_json_list(match.get("sets"))
+def _read_daily_stats(group_id: str, io, days=None):
+    """The group's daily_stats rows (only these days when given)."""
+    rows, start = [], 0
+    while True:
+        query = supabase.table("daily_stats").select("*").eq("group_id", group_id)
+        if days is not None:
+            query = query.in_("day", sorted(days))
+        query = query.order("day").order("kind").order("player1").order("player2")  # unique: stable pages
+        page = _run(query.range(start, start + DAILY_PAGE - 1), io).data or []
+        rows.extend(page)
+        if len(page) < DAILY_PAGE:
+            return rows
+        start += DAILY_PAGE
 
-        if not team1 or not team2 or not sets:
+def _write_daily_stats(group_id: str, existing_rows, daily, io):
+    """Bulk upserts of the (kind, player1, player2, day) totals that changed."""
+    existing = {_daily_key(r): r for r in existing_rows}
+    rows = []
+    for key, ds in daily.items():
+        kind, p1, p2, day = key
+        if not p1:
             continue
-        if len(team1) != 2 or len(team2) != 2:
+        payload = {"group_id": group_id, "kind": kind, "player1": p1, "player2": p2, "day": day,
+                   **_player_payload(ds)}
+        row = existing.get(key)
+        if row is not None and _unchanged(row, payload):
             continue
+        rows.append(payload)
 
-        team1_norm = [normalize_name(p) for p in team1]
-        team2_norm = [normalize_name(p) for p in team2]
+    for i in range(0, len(rows), DAILY_CHUNK):
+        _run(supabase.table("daily_stats").upsert(rows[i:i + DAILY_CHUNK],
+                                                  on_conflict="group_id,kind,player1,player2,day"), io)
+    if rows:
+        data_version.bump(group_id, tables=("daily_stats",))
+        io["daily_written"] += len(rows)
+        io["rows_written"] += len(rows)
 
-        team1_total, team2_total, team1_sets_won, team2_sets_won, winner = _calculate_team_points_from_sets(sets)
+# ------------------------------------------------------------
+# Skill ratings (groups.rating_mode = 'skill', see skill.py), kept in
+# players.skill_rating / skill_matches next to the points. The group's
+# skill_last_date / skill_last_id hold the newest match applied: results
+# that sort after it are O(1) updates, anything else is a replay. The
+# mode and K are changed through set_rating_mode, which replays.
+# ------------------------------------------------------------
+def _skill_settings(group_id: str, io):
+    """The group's skill settings, or None when it rates by points only."""
+    rows = _run(supabase.table("groups").select("rating_mode,skill_k,skill_last_date,skill_last_id")
+                .eq("id", group_id), io).data or []
+    if not rows or rows[0].get("rating_mode") != "skill":
+        return None
+    return rows[0]
 
-        # ---- PLAYER POINTS (per player, split team points) ----
-        team1_player_points = _split_team_points_to_players(team1_total, team1_norm)
-        team2_player_points = _split_team_points_to_players(team2_total, team2_norm)
+SKILL_TOLERANCE = 1e-6  # verify_ratings_for_group
 
-        # push match into each player's personal history
-        for pnorm in team1_norm:
-            if not pnorm:
-                continue
-            per_player_history[pnorm].append({
-                "match_id": match_id,
-                "match_date": match_date,
-                "team": "team1",
-                "winner": winner,
-                "team_points": team1_total,
-                "player_points": int(team1_player_points.get(pnorm, 0)),
-                "sets_won": int(team1_sets_won),
-                "won_match": 1 if winner == "team1" else 0,
-            })
+def _skill_k(settings):
+    return float(settings.get("skill_k") or skill.K)
 
-        for pnorm in team2_norm:
-            if not pnorm:
-                continue
-            per_player_history[pnorm].append({
-                "match_id": match_id,
-                "match_date": match_date,
-                "team": "team2",
-                "winner": winner,
-                "team_points": team2_total,
-                "player_points": int(team2_player_points.get(pnorm, 0)),
-                "sets_won": int(team2_sets_won),
-                "won_match": 1 if winner == "team2" else 0,
-            })
+def _skill_order(match):
+    return (str(match.get("match_date") or ""), int(match.get("id") or 0))
+
+def _skill_games(matches, aliases):
+    """skill.game tuples of matches (given in any order), in rating order."""
+    parsed = []
+    for match in sorted(matches, key=_skill_order):
+        p = _parse_match(match, aliases)
+        if p is not None:
+            parsed.append(p)
+    games = []
+    for (team1, team2, _), totals in zip(parsed, _score_sets_many([sets for _, _, sets in parsed])):
+        g = skill.game(team1, team2, totals[4])
+        if g is not None:
+            games.append(g)
+    return games
+
+def _stored_skill(players_rows):
+    ratings, counts = {}, {}
+    for pr in players_rows:
+        pkey = str(pr.get("id"))
+        rating = pr.get("skill_rating")
+        ratings[pkey] = float(rating) if rating is not None else skill.INITIAL
+        counts[pkey] = int(pr.get("skill_matches") or 0)
+    return ratings, counts
+
+def _write_skill(group_id: str, players_rows, ratings, counts, last, settings, io):
+    """Update the skill columns of the players whose rating changed; move the group's newest-applied mark."""
+    stored, stored_counts = _stored_skill(players_rows)
+    updates = {}
+    for pr in players_rows:
+        pkey = str(pr.get("id"))
+        if pkey not in ratings:
+            continue
+        if pr.get("skill_rating") is not None and stored[pkey] == ratings[pkey] and stored_counts[pkey] == counts[pkey]:
+            continue
+        updates[pr.get("id")] = {"skill_rating": ratings[pkey], "skill_matches": counts[pkey]}
+    _update_players(group_id, updates, io)
+
+    last_date, last_id = last if last is not None else (None, None)
+    if (settings.get("skill_last_date"), settings.get("skill_last_id")) != (last_date, last_id):
+        _run(supabase.table("groups").update({"skill_last_date": last_date, "skill_last_id": last_id})
+             .eq("id", group_id), io)
+
+def _replay_skill(group_id: str, players_rows, aliases, matches, settings, io):
+    ratings, counts = skill.replay(_skill_games(matches, aliases),
+                                   [str(pr.get("id")) for pr in players_rows], _skill_k(settings))
+    last = max((_skill_order(m) for m in matches), default=None)
+    _write_skill(group_id, players_rows, ratings, counts, last, settings, io)
+
+def _apply_skill_changes(group_id: str, changes, players_rows, aliases, settings, io):
+    """
+    New results that sort after the newest applied match: an O(1) update
+    each, from the stored ratings. Edits, deletes and back-dated results
+    replay the group. Returns False if the matches could not be loaded.
+    """
+    inserts = [new for old, new in changes if old is None and new]
+    last_id = settings.get("skill_last_id")
+    last = (str(settings.get("skill_last_date") or ""), int(last_id)) if last_id is not None else None
+    if len(inserts) == len(changes) and all(last is None or _skill_order(m) > last for m in inserts):
+        ratings, counts = _stored_skill(players_rows)
+        for g in _skill_games(inserts, aliases):
+            skill.update(ratings, counts, g, _skill_k(settings))
+        newest = max(_skill_order(m) for m in inserts)
+        _write_skill(group_id, players_rows, ratings, counts, newest, settings, io)
+        return True
+    matches = _fetch_matches_newest_first(group_id, io)
+    if matches is None:
+        return False
+    _replay_skill(group_id, players_rows, aliases, matches, settings, io)
+    return True
+
+@group_lock.exclusive
+def set_rating_mode(group_id: str, mode: str, k=None):
+    """
+    Switch a group between points only and points + skill ratings (with
+    its own K, None for SKILL_K). Turning skill on, or changing K, replays
+    the group's history. Returns the write counters.
+    """
+    io = _new_io()
+    _run(supabase.table("groups").update({"rating_mode": mode, "skill_k": k}).eq("id", group_id), io)
+    settings = _skill_settings(group_id, io)
+    if settings is not None:
+        players_rows = _run(supabase.table("players").select("*").eq("group_id", group_id), io).data or []
+        matches = _fetch_matches_newest_first(group_id, io)
+        if matches is None:
+            return None
+        _replay_skill(group_id, players_rows, player_aliases(players_rows), matches, settings, io)
+    data_version.bump(group_id, tables=("players",))
+    return io
 
-        # ---- COUPLE POINTS (KEEP YOUR OLD LOGIC) ----
-        # couple points += team_total_awarded * 2
-        if len(team1_norm) == 2:
-            couple1 = tuple(sorted(team1_norm))
-            cstats = couple_stats[couple1]
-            cstats["sets"] += team1_sets_won
-            cstats["matches"] += 1
-            if winner == "team1":
-                cstats["wins"] += 1
-            cstats["points"] += int(team1_total) * 2
-
-        if len(team2_norm) == 2:
-            couple2 = tuple(sorted(team2_norm))
-            cstats = couple_stats[couple2]
-            cstats["sets"] += team2_sets_won
-            cstats["matches"] += 1
-            if winner == "team2":
-                cstats["wins"] += 1
-            cstats["points"] += int(team2_total) * 2
+# ------------------------------------------------------------
+# Main function (KEEP NAME) - full replay, also the repair path
+# ------------------------------------------------------------
+@group_lock.exclusive
+def update_ratings_for_group(group_id: str):
+    """
+    Returns the write counters (rows written, PostgREST round-trips),
+    or None if the matches could not be loaded.
+    """
+    io = _new_io()
 
     # --------
-    # Aggregate per-player stats from EACH player's own last 8 matches
+    # Load players (so we can reset everyone)
     # --------
-    player_stats = defaultdict(lambda: {"points": 0, "sets": 0, "matches": 0, "wins": 0})
-
-    for pnorm, history in per_player_history.items():
-        last8 = history[:8]  # history is already newest -> oldest because matches were iterated newest first
-        ps = player_stats[pnorm]
-        ps["matches"] = len(last8)
-        ps["points"] = sum(x["player_points"] for x in last8)
-        ps["sets"] = sum(x["sets_won"] for x in last8)
-        ps["wins"] = sum(x["won_match"] for x in last8)
-
-        if pnorm == TRACE_PLAYER:
-            print(f"\n[NIKOS TRACE] Using last {len(last8)} matches for Nikos:")
-            running = 0
-            for i, x in enumerate(last8, start=1):
-                running += x["player_points"]
-                print(
-                    f"[NIKOS TRACE] {i}/8 match_id={x['match_id']} date={x['match_date']} "
-                    f"team={x['team']} winner={x['winner']} "
-                    f"team_points={x['team_points']} player_points={x['player_points']} running_total={running}"
-                )
-            print(f"[NIKOS TRACE] FINAL last8_points={ps['points']} last8_matches={ps['matches']} wins={ps['wins']} sets_won={ps['sets']}\n")
+    with metrics.phase("fetch", io):
+        players_rows = _run(supabase.table("players").select("*").eq("group_id", group_id), io).data or []
+        aliases = player_aliases(players_rows)
+
+        matches = _fetch_matches_newest_first(group_id, io)
+        if matches is None:
+            return None
+
+    with metrics.phase("score", io):
+        daily = {}
+        player_stats, couple_stats, per_player_history = _replay_group(matches, aliases, daily)
+
+        trace = player_key(TRACE_PLAYER, aliases)
+        if trace in player_stats:
+            _trace_player(per_player_history[trace][:LAST_N_MATCHES], player_stats[trace])
 
     # --------
     # Update ALL players (reset those with no recent matches to 0)
-    # IMPORTANT: update by raw player name stored in players table
     # --------
-    for pr in players_rows:
-        raw_name = pr.get("name")
-        pnorm = normalize_name(raw_name)
-        ps = player_stats.get(pnorm, {"points": 0, "sets": 0, "matches": 0, "wins": 0})
-
-        supabase.table("players").update({
-            "total_points": int(ps["points"]),
-            "sets_won": int(ps["sets"]),
-            "matches_played": int(ps["matches"]),
-            "matches_won": int(ps["wins"]),
-        }).eq("name", raw_name).eq("group_id", group_id).execute()
+    with metrics.phase("write_players", io):
+        all_player_stats = {str(pr.get("id")): _empty_stats() for pr in players_rows}
+        all_player_stats.update(player_stats)
+        _write_player_stats(group_id, players_rows, all_player_stats, io)
 
     # --------
     # Update couples table (KEEP OLD LOGIC)
+    # Couples whose matches were all deleted are reset to 0 as well,
+    # so a replay always matches what the incremental mode keeps.
     # --------
-    for (p1, p2), cs in couple_stats.items():
-        if not p1 or not p2:
-            continue
+    with metrics.phase("write_couples", io):
+        existing_couples = _run(supabase.table("couples").select("*").eq("group_id", group_id), io).data or []
+        for row in existing_couples:
+            couple = (row.get("player1"), row.get("player2"))
+            if couple not in couple_stats:
+                couple_stats[couple] = _empty_stats()
+        _write_couple_stats(group_id, existing_couples, couple_stats, io)
 
-        existing = (
-            supabase.table("couples")
-            .select("*")
-            .eq("player1", p1)
-            .eq("player2", p2)
-            .eq("group_id", group_id)
-            .execute()
-            .data
-        )
+    # --------
+    # Daily totals for the leaderboards (days no match covers any more -> 0)
+    # --------
+    with metrics.phase("write_daily", io):
+        existing_daily = _read_daily_stats(group_id, io)
+        for row in existing_daily:
+            daily.setdefault(_daily_key(row), _empty_stats())
+        _write_daily_stats(group_id, existing_daily, daily, io)
 
-        payload = {
-            "player1": p1,
-            "player2": p2,
-            "group_id": group_id,
-            "total_points": int(cs["points"]),
-            "sets_won": int(cs["sets"]),
-            "matches_played": int(cs["matches"]),
-            "matches_won": int(cs["wins"]),
-        }
+    # --------
+    # Skill ratings, in groups that keep them
+    # --------
+    with metrics.phase("skill", io):
+        settings = _skill_settings(group_id, io)
+        if settings is not None:
+            _replay_skill(group_id, players_rows, aliases, matches, settings, io)
+    profiling.note(group_id, "update_ratings_for_group", matches=len(matches), players=len(players_rows),
+                   couples=len(existing_couples), **io)
+    return io
+
+# ------------------------------------------------------------
+# Incremental mode
+# ------------------------------------------------------------
+def _collect_player_windows(group_id: str, players, io, aliases=None):
+    """
+    Read matches newest first, one page at a time, until every given player
+    has a full last-8 window (or history runs out). Same ordering as the full
+    replay, so the windows are identical to what a replay would build.
+    """
+    windows = {p: [] for p in players if p}
+    start = 0
+    while windows:
+        page = _fetch_matches_newest_first(group_id, io, start, start + INCREMENTAL_PAGE_SIZE - 1)
+        if page is None:
+            return None
+        for match in page:
+            scored = _score_match(match, aliases=aliases)
+            if scored is None:
+                continue
+            for pnorm, entry in _player_entries(scored):
+                window = windows.get(pnorm)
+                if window is not None and len(window) < LAST_N_MATCHES:
+                    window.append(entry)
+        if len(page) < INCREMENTAL_PAGE_SIZE:
+            break
+        if all(len(w) >= LAST_N_MATCHES for w in windows.values()):
+            break
+        start += INCREMENTAL_PAGE_SIZE
+    return windows
 
-        if not existing:
-            supabase.table("couples").insert(payload).execute()
+@group_lock.exclusive
+def apply_match_changes(group_id: str, changes):
+    """
+    Incremental alternative to update_ratings_for_group.
+    changes: list of (old_match_row, new_match_row) - old is None for an insert,
+    new is None for a delete, both set for an edit.
+    Couples get their running totals adjusted by the delta; only the affected
+    players' last-8 windows are re-read (from the ledger, see match_players
+    below). update_ratings_for_group stays the
+    full replay and produces the same numbers.
+    Returns the same write counters as update_ratings_for_group.
+    """
+    io = _new_io()
+    couple_delta = defaultdict(_empty_stats)
+    daily_delta = defaultdict(_empty_stats)
+    affected_players = set()
+    with metrics.phase("fetch", io, "incremental"):
+        players_rows = _run(supabase.table("players").select("*").eq("group_id", group_id), io).data or []
+        aliases = player_aliases(players_rows)
+
+    with metrics.phase("score", io, "incremental"):
+        for old_match, new_match in changes:
+            for sign, match in ((-1, old_match), (1, new_match)):
+                if not match:
+                    continue
+                scored = _score_match(match, aliases=aliases)
+                if scored is None:
+                    continue
+                for pnorm, _ in _player_entries(scored):
+                    affected_players.add(pnorm)
+                for couple, cs in _couple_entries(scored):
+                    delta = couple_delta[couple]
+                    for k, v in cs.items():
+                        delta[k] += sign * v
+                for key, ds in _daily_entries(scored):
+                    delta = daily_delta[key]
+                    for k, v in ds.items():
+                        delta[k] += sign * v
+
+    # --------
+    # Players: slide only the affected players' last-8 windows
+    # --------
+    if affected_players:
+        with metrics.phase("fetch_windows", io, "incremental"):
+            windows = ledger_windows(group_id, affected_players, io, aliases)
+            if windows is None:
+                return None
+            player_stats = {pnorm: _window_stats(history) for pnorm, history in windows.items()}
+
+            trace = player_key(TRACE_PLAYER, aliases)
+            if trace in windows:
+                _trace_player(windows[trace], player_stats[trace])
+
+        with metrics.phase("write_players", io, "incremental"):
+            _write_player_stats(group_id, players_rows, player_stats, io)
+
+    # --------
+    # Couples: running totals += delta
+    # --------
+    couple_delta = {c: d for c, d in couple_delta.items() if any(d.values())}
+    if couple_delta:
+        with metrics.phase("write_couples", io, "incremental"):
+            existing_couples = _run(
+                supabase.table("couples")
+                .select("*")
+                .eq("group_id", group_id)
+                .in_("player1", sorted({p1 for p1, _ in couple_delta})),
+                io,
+            ).data or []
+            current = {(r.get("player1"), r.get("player2")): _couple_row_stats(r) for r in existing_couples}
+
+            couple_stats = {}
+            for couple, delta in couple_delta.items():
+                cs = current.get(couple, _empty_stats())
+                couple_stats[couple] = {k: cs[k] + delta[k] for k in cs}
+            _write_couple_stats(group_id, existing_couples, couple_stats, io)
+
+    # --------
+    # Daily totals: the touched days += delta
+    # --------
+    daily_delta = {key: d for key, d in daily_delta.items() if any(d.values())}
+    if daily_delta:
+        with metrics.phase("write_daily", io, "incremental"):
+            existing_daily = _read_daily_stats(group_id, io, days={key[3] for key in daily_delta})
+            current = {_daily_key(r): _couple_row_stats(r) for r in existing_daily}
+            daily = {}
+            for key, delta in daily_delta.items():
+                ds = current.get(key, _empty_stats())
+                daily[key] = {k: ds[k] + delta[k] for k in ds}
+            _write_daily_stats(group_id, existing_daily, daily, io)
+
+    # --------
+    # Skill ratings: O(1) per new result (see _apply_skill_changes)
+    # --------
+    with metrics.phase("skill", io, "incremental"):
+        settings = _skill_settings(group_id, io)
+        if settings is not None and not _apply_skill_changes(group_id, changes, players_rows, aliases, settings, io):
+            return None
+    profiling.note(group_id, "apply_match_changes", changes=len(changes), players=len(players_rows),
+                   affected_players=len(affected_players), **io)
+    return io
+
+# ------------------------------------------------------------
+# match_players: participant index (one row per player per match), so
+# player filtering, counting and keyset paging run in the database.
+# Kept in step with every match write.
+#
+# It is also each player's ledger (migrations/005_player_match_ledger.sql):
+# a row carries what the match gave that player (player_points, sets_won,
+# won_match; rated is false for matches the ratings ignore), so a
+# player's last-8 window is an indexed read of their newest rated rows
+# instead of a walk through the group's matches. Rows written before the
+# migration have rated = null; those players fall back to the walk until
+# rebuild_match_players (POST /recalculate_points) fills them in.
+# ------------------------------------------------------------
+MATCH_PLAYERS_CHUNK = 500
+LEDGER_PAGE = LAST_N_MATCHES + 4  # a few unrated rows still fit in one read
+LEDGER_COLUMNS = "match_id,match_date,team,rated,team_points,player_points,sets_won,won_match,winner"
+_WINNER_CODES = {"team1": 1, "team2": 2}
+
+def _match_player_rows(match, aliases, scored):
+    """scored: _score_match of the match (None if the ratings ignore it)."""
+    entries = dict(_player_entries(scored)) if scored else {}
+    rows = []
+    seen = set()
+    for team_no, team in ((1, _safe_json_list(match.get("team1"))), (2, _safe_json_list(match.get("team2")))):
+        for p in team:
+            pnorm = player_key(p, aliases)
+            if not pnorm or pnorm in seen:
+                continue
+            seen.add(pnorm)
+            entry = entries.get(pnorm)
+            rows.append({
+                "match_id": match.get("id"),
+                "group_id": match.get("group_id"),
+                "player": pnorm,
+                "match_date": match.get("match_date"),
+                "match_created_at": match.get("created_at"),
+                "team": team_no,
+                "rated": entry is not None,
+                "team_points": entry["team_points"] if entry else None,
+                "player_points": entry["player_points"] if entry else None,
+                "sets_won": entry["sets_won"] if entry else None,
+                "won_match": bool(entry["won_match"]) if entry else None,
+                "winner": _WINNER_CODES.get(entry["winner"]) if entry else None,
+            })
+    return rows
+
+def _ledger_entry(row):
+    """A ledger row in the shape of _player_entries' history rows."""
+    winner = {1: "team1", 2: "team2"}.get(row.get("winner"))
+    return {
+        "match_id": row.get("match_id"),
+        "match_date": row.get("match_date"),
+        "team": f"team{row.get('team')}",
+        "winner": winner,
+        "team_points": int(row.get("team_points") or 0),
+        "player_points": int(row.get("player_points") or 0),
+        "sets_won": int(row.get("sets_won") or 0),
+        "won_match": 1 if row.get("won_match") else 0,
+    }
+
+def player_window(group_id: str, player: str, io, limit=LAST_N_MATCHES):
+    """
+    The player's newest `limit` rated matches from the ledger (newest
+    first, the replay's order), or None if their rows predate the ledger.
+    """
+    window, start = [], 0
+    while True:
+        rows = _run(
+            supabase.table("match_players")
+            .select(LEDGER_COLUMNS)
+            .eq("group_id", group_id)
+            .eq("player", player)
+            .order("match_date", desc=True)
+            .order("match_created_at", desc=True)
+            .order("match_id", desc=True)
+            .range(start, start + LEDGER_PAGE - 1),
+            io,
+        ).data or []
+        for row in rows:
+            if row.get("rated") is None:
+                return None
+            if row["rated"]:
+                window.append(_ledger_entry(row))
+                if len(window) >= limit:
+                    return window
+        if len(rows) < LEDGER_PAGE:
+            return window
+        start += LEDGER_PAGE
+
+def ledger_windows(group_id: str, players, io, aliases=None):
+    """Last-8 windows of these players: ledger reads, the match walk for rows not backfilled yet."""
+    windows, missing = {}, []
+    for player in players:
+        if not player:
+            continue
+        window = player_window(group_id, player, io)
+        if window is None:
+            missing.append(player)
         else:
-            supabase.table("couples").update(payload) \
-                .eq("player1", p1).eq("player2", p2).eq("group_id", group_id).execute()
+            windows[player] = window
+    if missing:
+        walked = _collect_player_windows(group_id, missing, io, aliases)
+        if walked is None:
+            return None
+        windows.update(walked)
+    return windows
+
+def player_history(group_id: str, player_name: str, limit=LAST_N_MATCHES):
+    """
+    A player's newest rated matches from the ledger (what each gave them),
+    their last-8 totals and the stored rating, plus the match rows and the
+    group's names for display. Reads only, nothing is recomputed.
+    None if the player is not in the group.
+    """
+    io = _new_io()
+    players_rows = _run(supabase.table("players").select("*").eq("group_id", group_id), io).data or []
+    aliases = player_aliases(players_rows)
+    pid = _lookup_player(player_name, aliases)
+    row = next((pr for pr in players_rows if pid is not None and pr.get("id") == pid), None)
+    if row is None:
+        return None
+    key = str(pid)
+
+    history, source = player_window(group_id, key, io, limit), "ledger"
+    if history is None:
+        history, source = (_collect_player_windows(group_id, [key], io, aliases) or {}).get(key, []), "matches"
+    match_ids = [h["match_id"] for h in history]
+    matches = []
+    if match_ids:
+        matches = _run(supabase.table("matches").select("id,match_date,team1,team2,sets").in_("id", match_ids), io).data or []
+    return {
+        "player_id": pid,
+        "name": row.get("name"),
+        "source": source,
+        "history": history,
+        "window": _player_payload(_window_stats(history)),
+        "stored": {k: int(row.get(k) or 0) for k in STAT_COLUMNS},
+        "matches": {m["id"]: m for m in matches},
+        "names": {str(pr["id"]): pr.get("name") for pr in players_rows if pr.get("id") is not None},
+        "round_trips": io["round_trips"],
+    }
+
+def sync_match_players(changes, aliases=None):
+    """
+    Apply (old_match_row, new_match_row) changes to match_players:
+    one delete for the touched match ids, one insert for the new rows.
+    aliases (player_aliases of the group) are loaded if not given.
+    """
+    match_ids = set()
+    rows = []
+    for old_match, new_match in changes:
+        if old_match:
+            match_ids.add(old_match.get("id"))
+        if new_match:
+            match_ids.add(new_match.get("id"))
+            if aliases is None:
+                aliases = load_player_aliases(new_match.get("group_id"))
+            rows.extend(_match_player_rows(new_match, aliases, _score_match(new_match, aliases=aliases)))
+
+    match_ids.discard(None)
+    if match_ids:
+        supabase.table("match_players").delete().in_("match_id", sorted(match_ids)).execute()
+    for i in range(0, len(rows), MATCH_PLAYERS_CHUNK):
+        supabase.table("match_players").insert(rows[i:i + MATCH_PLAYERS_CHUNK]).execute()
+
+@group_lock.exclusive  # an incremental recompute must not read a half-rebuilt ledger
+def rebuild_match_players(group_id: str):
+    """Repair path: rebuild the group's index and ledger from the matches table."""
+    matches = _fetch_matches_newest_first(group_id, _new_io())
+    if matches is None:
+        return None
+    aliases = load_player_aliases(group_id)
+    parsed = [(match, _parse_match(match, aliases)) for match in matches]
+    totals = iter(_score_sets_many([p[2] for _, p in parsed if p is not None]))
+    rows = []
+    for match, p in parsed:
+        scored = _score_match(match, p, next(totals)) if p is not None else None
+        rows.extend(_match_player_rows(match, aliases, scored))
+    supabase.table("match_players").delete().eq("group_id", group_id).execute()
+    for i in range(0, len(rows), MATCH_PLAYERS_CHUNK):
+        supabase.table("match_players").insert(rows[i:i + MATCH_PLAYERS_CHUNK]).execute()
+    return len(rows)
+
+def verify_ratings_for_group(group_id: str):
+    """
+    Replay the whole history in memory and compare with the stored
+    players / couples rows. Returns a list of mismatches (empty = consistent).
+    Run update_ratings_for_group to repair.
+    """
+    players_rows = supabase.table("players").select("*").eq("group_id", group_id).execute().data or []
+    matches = _fetch_matches_newest_first(group_id, _new_io())
+    if matches is None:
+        return None
+    daily = {}
+    player_stats, couple_stats, _ = _replay_group(matches, player_aliases(players_rows), daily)
+
+    mismatches = []
+    for pr in players_rows:
+        expected = _player_payload(player_stats.get(str(pr.get("id")), _empty_stats()))
+        stored = {k: int(pr.get(k) or 0) for k in expected}
+        if stored != expected:
+            mismatches.append({"player": pr.get("name"), "stored": stored, "expected": expected})
+
+    couples_rows = supabase.table("couples").select("*").eq("group_id", group_id).execute().data or []
+    seen = set()
+    for cr in couples_rows:
+        couple = (cr.get("player1"), cr.get("player2"))
+        seen.add(couple)
+        expected = _player_payload(couple_stats.get(couple, _empty_stats()))
+        stored = _player_payload(_couple_row_stats(cr))
+        if stored != expected:
+            mismatches.append({"couple": list(couple), "stored": stored, "expected": expected})
+    for couple, cs in couple_stats.items():
+        if couple not in seen and all(couple):
+            mismatches.append({"couple": list(couple), "stored": None, "expected": _player_payload(cs)})
+
+    stored_daily = {_daily_key(r): _player_payload(_couple_row_stats(r))
+                    for r in _read_daily_stats(group_id, _new_io())}
+    for key in set(stored_daily) | {k for k in daily if k[1]}:
+        expected = _player_payload(daily.get(key, _empty_stats()))
+        if stored_daily.get(key, _player_payload(_empty_stats())) != expected:
+            mismatches.append({"daily": list(key), "stored": stored_daily.get(key), "expected": expected})
+
+    settings = _skill_settings(group_id, _new_io())
+    if settings is not None:
+        ratings, counts = skill.replay(_skill_games(matches, player_aliases(players_rows)),
+                                       [str(pr.get("id")) for pr in players_rows], _skill_k(settings))
+        stored, stored_counts = _stored_skill(players_rows)
+        for pr in players_rows:
+            pkey = str(pr.get("id"))
+            # O(1) updates and a replay may differ in the last bits of a float
+            if abs(stored[pkey] - ratings[pkey]) > SKILL_TOLERANCE or stored_counts[pkey] != counts[pkey]:
+                mismatches.append({"skill": pr.get("name"),
+                                   "stored": {"skill_rating": stored[pkey], "skill_matches": stored_counts[pkey]},
+                                   "expected": {"skill_rating": ratings[pkey], "skill_matches": counts[pkey]}})
+
+    return mismatches
+
+# ------------------------------------------------------------
+# Player-ID migration: rewrite nickname references to players.id.
+# Resumable: groups.player_refs_cursor keeps the last match id written,
+# and rewriting a row that already holds ids changes nothing.
+# ------------------------------------------------------------
+PLAYER_REFS_CHUNK = 200
+
+def _convert_refs(value, convert):
+    return [convert(p) for p in _safe_json_list(value)]
+
+def _rewrite_match_refs(group_id: str, convert, io, after_id=None, on_chunk=None):
+    """
+    Rewrite team1 / team2 / couples of the group's matches with convert(ref),
+    in id order: one read and at most one bulk upsert per chunk.
+    on_chunk(last_id) runs once a chunk is written. Returns the rows changed.
+    """
+    changed = 0
+    while True:
+        query = supabase.table("matches").select("*").eq("group_id", group_id).order("id").limit(PLAYER_REFS_CHUNK)
+        if after_id is not None:
+            query = query.gt("id", after_id)
+        chunk = _run(query, io).data or []
+        rows = []
+        for m in chunk:
+            team1 = _convert_refs(m.get("team1"), convert)
+            team2 = _convert_refs(m.get("team2"), convert)
+            couples = [_convert_refs(c, convert) for c in _safe_json_list(m.get("couples"))]
+            if (team1 != _safe_json_list(m.get("team1")) or team2 != _safe_json_list(m.get("team2"))
+                    or couples != [_safe_json_list(c) for c in _safe_json_list(m.get("couples"))]):
+                rows.append({**m, "team1": team1, "team2": team2, "couples": couples})
+        if rows:
+            _run(supabase.table("matches").upsert(rows, on_conflict="id"), io)
+            changed += len(rows)
+        if not chunk:
+            break
+        after_id = chunk[-1]["id"]
+        if on_chunk:
+            on_chunk(after_id)
+        if len(chunk) < PLAYER_REFS_CHUNK:
+            break
+    return changed
+
+def _rewrite_registration_refs(group_id: str, convert, io):
+    """Same for next_matches.registered_users (a handful of rows per group)."""
+    changed = 0
+    for nm in _run(supabase.table("next_matches").select("*").eq("group_id", group_id), io).data or []:
+        users = nm.get("registered_users") or []
+        new_users = [convert(u) for u in users]
+        if new_users != users:
+            _run(supabase.table("next_matches").update({"registered_users": new_users}).eq("id", nm["id"]), io)
+            changed += 1
+    return changed
+
+def migrate_group_player_ids(group_id: str):
+    """
+    Move a group from nickname references to players.id, then rebuild what
+    is keyed by player (match_players, players / couples ratings) and mark
+    the group migrated. A no-op for migrated groups; safe to re-run after
+    an interruption. Returns counters, or None if the group does not exist.
+    """
+    io = _new_io()
+    group = _run(supabase.table("groups").select("*").eq("id", group_id), io).data
+    if not group:
+        return None
+    result = {"group_id": group_id, "matches_rewritten": 0, "registrations_rewritten": 0, "stale_couples_deleted": 0}
+    if group[0].get("player_refs_migrated"):
+        return result
+
+    aliases = load_player_aliases(group_id, io)
+    convert = lambda ref: player_ref(ref, aliases)
+
+    def checkpoint(last_id):
+        _run(supabase.table("groups").update({"player_refs_cursor": last_id}).eq("id", group_id), io)
+
+    result["matches_rewritten"] = _rewrite_match_refs(
+        group_id, convert, io, group[0].get("player_refs_cursor"), checkpoint)
+    result["registrations_rewritten"] = _rewrite_registration_refs(group_id, convert, io)
+
+    rebuild_match_players(group_id)
+    update_ratings_for_group(group_id)
+
+    # couples rows still keyed by nicknames were zeroed by the replay
+    id_keys = {str(pid) for pid in aliases.values()}
+    for row in _run(supabase.table("couples").select("*").eq("group_id", group_id), io).data or []:
+        by_id = str(row.get("player1")) in id_keys and str(row.get("player2")) in id_keys
+        if not by_id and not any(_couple_row_stats(row).values()):
+            _run(supabase.table("couples").delete().eq("group_id", group_id)
+                 .eq("player1", row.get("player1")).eq("player2", row.get("player2")), io)
+            result["stale_couples_deleted"] += 1
+
+    _run(supabase.table("groups").update({"player_refs_migrated": True}).eq("id", group_id), io)
+    data_version.bump(group_id)
+    result["round_trips"] = io["round_trips"]
+    return result
+
+def detach_player_refs(group_id: str, player_id, name: str):
+    """
+    Before a players row is deleted: put its nickname back into the group's
+    matches and registrations, so history still shows who played.
+    """
+    io = _new_io()
+    convert = lambda ref: name if str(ref) == str(player_id) else ref
+    _rewrite_match_refs(group_id, convert, io)
+    _rewrite_registration_refs(group_id, convert, io)
+    data_version.bump(group_id)
+    return io
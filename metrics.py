@@ -0,0 +1,251 @@
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# ------------------------------------------------------------
+# Hot-path metrics, served in Prometheus text format at /metrics.
+#
+#   padel_http_request_duration_seconds{route,method}   histogram
+#   padel_http_requests_total{route,method,status}      counter
+#   padel_db_queries_total{route,table,op}              PostgREST round-trips
+#   padel_db_query_seconds_total{route,table,op}        time spent in them
+#   padel_db_rows_total{route,table,op}                 rows returned
+#   padel_recompute_phase_seconds{kind,phase}           ratings recompute by phase
+#                                                       (histogram); kind "full"
+#                                                       (update_ratings_for_group:
+#                                                       fetch, score, write_players,
+#                                                       write_couples, write_daily,
+#                                                       skill) or "incremental"
+#                                                       (apply_match_changes: fetch,
+#                                                       score, fetch_windows, and
+#                                                       the same write / skill phases)
+#   padel_recompute_phase_queries_total{kind,phase}     PostgREST round-trips in them
+#
+# The ASGI middleware labels every request with its route template (never
+# the raw path, so unknown paths cannot blow up the label set) and keeps it
+# in a context variable; the client wrapper (instrument(), applied by
+# main.get_client) reads it, so db.run must copy the context into its
+# thread pool. The recompute worker labels its work "recompute", anything
+# else outside a request is "background". METRICS=0 turns the middleware
+# and wrapper off.
+# ------------------------------------------------------------
+ENABLED = os.environ.get("METRICS", "1") != "0"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BACKGROUND = "background"
+
+_route = contextvars.ContextVar("metrics_route", default=BACKGROUND)
+_lock = threading.Lock()
+_counters = defaultdict(float)       # (name, labels) -> value
+_histograms = {}                     # (name, labels) -> [bucket counts..., sum, count]
+_HELP = {
+    "padel_http_request_duration_seconds": ("histogram", "Request latency by route."),
+    "padel_http_requests_total": ("counter", "Requests by route and status."),
+    "padel_db_queries_total": ("counter", "PostgREST round-trips by route and table."),
+    "padel_db_query_seconds_total": ("counter", "Seconds spent in PostgREST round-trips."),
+    "padel_db_rows_total": ("counter", "Rows returned by PostgREST round-trips."),
+    "padel_recompute_phase_seconds": ("histogram", "Ratings recompute time by kind and phase."),
+    "padel_recompute_phase_queries_total": ("counter", "PostgREST round-trips of the ratings recompute by kind and phase."),
+}
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+def inc(name, amount=1.0, **labels):
+    with _lock:
+        _counters[(name, _labels(**labels))] += amount
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+                break
+        h[-2] += seconds
+        h[-1] += 1
+
+def current_route():
+    return _route.get()
+
+@contextmanager
+def route(name):
+    """Label the round-trips of work outside a request (e.g. "recompute")."""
+    token = _route.set(name)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+@contextmanager
+def phase(name, io=None, kind="full"):
+    """Time one phase of the ratings recompute; io: its counters (round_trips)."""
+    started = time.perf_counter()
+    trips = io["round_trips"] if io is not None else 0
+    try:
+        yield
+    finally:
+        observe("padel_recompute_phase_seconds", time.perf_counter() - started, kind=kind, phase=name)
+        if io is not None:
+            inc("padel_recompute_phase_queries_total", io["round_trips"] - trips, kind=kind, phase=name)
+
+# ------------------------------------------------------------
+# Client wrapper: counts every execute() of a query built from it
+# ------------------------------------------------------------
+_OPS = ("select", "insert", "upsert", "update", "delete")
+
+class _CountingQuery:
+    def __init__(self, query, table, op="select"):
+        self._query = query
+        self._table = table
+        self._op = op
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        op = name if name in _OPS else self._op
+        if not callable(attr):
+            return _CountingQuery(attr, self._table, op) if hasattr(attr, "execute") else attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _CountingQuery(result, self._table, op) if hasattr(result, "execute") else result
+        return call
+
+    def execute(self):
+        started = time.perf_counter()
+        labels = {"route": _route.get(), "table": self._table, "op": self._op}
+        try:
+            response = self._query.execute()
+        finally:
+            elapsed = time.perf_counter() - started
+            with _lock:
+                _counters[("padel_db_queries_total", _labels(**labels))] += 1
+                _counters[("padel_db_query_seconds_total", _labels(**labels))] += elapsed
+        data = getattr(response, "data", None)
+        if isinstance(data, list):
+            inc("padel_db_rows_total", len(data), **labels)
+        elif data:
+            inc("padel_db_rows_total", 1, **labels)
+        return response
+
+class _CountingClient:
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return _CountingQuery(self._client.table(name), name)
+
+    def rpc(self, name, params=None, *args, **kwargs):
+        return _CountingQuery(self._client.rpc(name, params, *args, **kwargs), f"rpc:{name}", "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+def instrument(client):
+    """client with every round-trip counted (client itself when METRICS=0)."""
+    return _CountingClient(client) if ENABLED else client
+
+# ------------------------------------------------------------
+# ASGI middleware
+# ------------------------------------------------------------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._templates = {}  # raw path -> route template
+
+    def _template(self, scope):
+        path = scope["path"]
+        template = self._templates.get(path)
+        if template is None:
+            from starlette.routing import Match
+            template = "unmatched"
+            for route in scope["app"].router.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    template = getattr(route, "path", "unmatched")
+                    break
+            if template != "unmatched" or len(self._templates) < 1000:
+                self._templates[path] = template
+        return template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            return await self.app(scope, receive, send)
+        route = self._template(scope)
+        token = _route.set(route)
+        status = {"code": 500}
+        started = time.perf_counter()
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            _route.reset(token)
+            method = scope["method"]
+            observe("padel_http_request_duration_seconds", time.perf_counter() - started, route=route, method=method)
+            inc("padel_http_requests_total", route=route, method=method, status=str(status["code"]))
+
+# ------------------------------------------------------------
+# Prometheus text format
+# ------------------------------------------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+def render(gauges=None) -> str:
+    """Everything recorded so far, then gauges ({name: value}) as they are."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), h in histograms.items():
+        by_name[name].append((labels, h))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = _HELP.get(name, ("counter", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{name}{_label_text(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS, value):
+                cumulative += n
+                lines.append(f"{name}_bucket{_label_text(labels, [('le', repr(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{_label_text(labels)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_label_text(labels)} {value[-1]}")
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,14 @@
+-- Composite key used by the bulk couples upsert in update_ratings_for_group
+-- (on_conflict = "group_id,player1,player2").
+-- Run once in the Supabase SQL editor.
+
+-- Older select-then-insert code could create duplicate couple rows; keep one.
+delete from couples a
+using couples b
+where a.group_id = b.group_id
+  and a.player1 = b.player1
+  and a.player2 = b.player2
+  and a.id > b.id;
+
+alter table couples
+  add constraint couples_group_player1_player2_key unique (group_id, player1, player2);
@@ -0,0 +1,22 @@
+-- Participant index for /matches_paged: one row per player per match,
+-- maintained by the write endpoints (main.sync_match_players).
+-- player is the normalized (trimmed, lowercase) name.
+-- Run once in the Supabase SQL editor, then POST /recalculate_points?group_id=...
+-- for each group to backfill it (main.rebuild_match_players).
+
+create table if not exists match_players (
+  match_id   bigint not null references matches(id) on delete cascade,
+  group_id   uuid   not null,
+  player     text   not null,
+  match_date date,
+  team       smallint not null,
+  primary key (match_id, player)
+);
+
+-- player filter + (match_date, match_id) keyset, newest first
+create index if not exists match_players_group_player_date_idx
+  on match_players (group_id, player, match_date desc, match_id desc);
+
+-- unfiltered keyset paging on matches
+create index if not exists matches_group_date_id_idx
+  on matches (group_id, match_date desc, id desc);
@@ -0,0 +1,27 @@
+"""
+Rewrite nickname references in matches and next-match registrations to
+players.id, one group at a time (main.migrate_group_player_ids). Safe to
+stop and re-run: finished groups are skipped, a group in progress resumes
+from its last written chunk.
+
+    python migrations/003_player_ids.py [group_id ...]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+def run(group_ids=None):
+    if not group_ids:
+        groups = main.supabase.table("groups").select("id,name,player_refs_migrated").execute().data or []
+        group_ids = [g["id"] for g in groups if not g.get("player_refs_migrated")]
+    for i, group_id in enumerate(group_ids, start=1):
+        result = main.migrate_group_player_ids(group_id)
+        print(f"[{i}/{len(group_ids)}] {group_id}: {result}")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
@@ -0,0 +1,12 @@
+-- Matches, couples, match_players and next-match registrations refer to
+-- players by players.id instead of nickname (see main.player_ref / player_key).
+-- Run once in the Supabase SQL editor, then migrate the existing rows:
+--   python migrations/003_player_ids.py            (every group)
+--   python migrations/003_player_ids.py <group_id> (one group)
+-- The script is resumable; groups not yet migrated are migrated on their
+-- first nickname change as well.
+
+alter table groups add column if not exists player_refs_migrated boolean not null default false;
+alter table groups add column if not exists player_refs_cursor bigint;  -- last match id rewritten
+
+-- couples / match_players keep their text columns; they now hold str(players.id)
@@ -0,0 +1,10 @@
+-- Lease rows for RECOMPUTE_LOCK=database (group_lock.py): at most one
+-- ratings recompute per group across all uvicorn workers and hosts.
+-- The primary key is the lock; expires_at lets a crashed worker's lease lapse.
+-- Run once in the Supabase SQL editor.
+
+create table if not exists recompute_locks (
+  group_id   text primary key,
+  holder     text not null,
+  expires_at timestamptz not null
+);
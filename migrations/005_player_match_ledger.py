@@ -0,0 +1,26 @@
+"""
+Backfill the ledger columns of match_players (005_player_match_ledger.sql)
+by rebuilding each group's rows from its matches (main.rebuild_match_players).
+Ratings are not touched. Safe to re-run.
+
+    python migrations/005_player_match_ledger.py [group_id ...]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+def run(group_ids=None):
+    if not group_ids:
+        groups = main.supabase.table("groups").select("id").execute().data or []
+        group_ids = [g["id"] for g in groups]
+    for i, group_id in enumerate(group_ids, start=1):
+        rows = main.rebuild_match_players(group_id)
+        print(f"[{i}/{len(group_ids)}] {group_id}: {rows} ledger rows")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
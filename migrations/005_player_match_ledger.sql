@@ -0,0 +1,21 @@
+-- match_players becomes each player's ledger: what every match gave the
+-- player, so a last-8 window is an indexed top-8 read (main.player_window).
+-- Written by main.sync_match_players on every match write.
+-- rated is false for matches the ratings ignore (no sets, bad teams) and
+-- null for rows written before this migration: run once in the Supabase
+-- SQL editor, then backfill with
+--   python migrations/005_player_match_ledger.py
+-- (or POST /recalculate_points?group_id=... per group).
+
+alter table match_players
+  add column if not exists match_created_at timestamptz,
+  add column if not exists rated            boolean,
+  add column if not exists team_points      integer,
+  add column if not exists player_points    integer,
+  add column if not exists sets_won         integer,
+  add column if not exists won_match        boolean,
+  add column if not exists winner           smallint;
+
+-- a player's window, newest first in the ratings' order
+create index if not exists match_players_ledger_idx
+  on match_players (group_id, player, match_date desc, match_created_at desc, match_id desc);
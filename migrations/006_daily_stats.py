@@ -0,0 +1,25 @@
+"""
+Fill daily_stats (006_daily_stats.sql) with a full replay of each group
+(main.update_ratings_for_group). Safe to re-run.
+
+    python migrations/006_daily_stats.py [group_id ...]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+def run(group_ids=None):
+    if not group_ids:
+        groups = main.supabase.table("groups").select("id").execute().data or []
+        group_ids = [g["id"] for g in groups]
+    for i, group_id in enumerate(group_ids, start=1):
+        result = main.update_ratings_for_group(group_id)
+        print(f"[{i}/{len(group_ids)}] {group_id}: {result}")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
@@ -0,0 +1,22 @@
+-- Per-player and per-couple totals per day, behind /leaderboard
+-- (main.py daily_stats section, leaderboard.py). kind is 'player'
+-- (player2 = '') or 'couple'; player1 / player2 hold the same keys as the
+-- couples table. Run once in the Supabase SQL editor, then fill it with
+--   python migrations/006_daily_stats.py
+-- (a full replay per group; or POST /recalculate_points?group_id=...).
+
+create table if not exists daily_stats (
+  group_id       uuid     not null,
+  kind           text     not null check (kind in ('player', 'couple')),
+  player1        text     not null,
+  player2        text     not null default '',
+  day            date     not null,
+  total_points   integer  not null default 0,
+  sets_won       integer  not null default 0,
+  matches_played integer  not null default 0,
+  matches_won    integer  not null default 0,
+  primary key (group_id, kind, player1, player2, day)
+);
+
+-- the leaderboard load and the incremental update read a group by day
+create index if not exists daily_stats_group_day_idx on daily_stats (group_id, day);
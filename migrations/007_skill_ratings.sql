@@ -0,0 +1,14 @@
+-- Optional skill ratings (Elo for doubles, see skill.py) next to the
+-- points. A group keeps them once rating_mode is 'skill'; switch it with
+-- POST /set_rating_mode, which also replays the group's history, so
+-- nothing needs a backfill. Run once in the Supabase SQL editor.
+
+alter table groups
+  add column if not exists rating_mode     text not null default 'points',
+  add column if not exists skill_k         double precision,   -- null: SKILL_K
+  add column if not exists skill_last_date text,               -- newest match applied:
+  add column if not exists skill_last_id   bigint;             -- (match_date, id)
+
+alter table players
+  add column if not exists skill_rating  double precision,     -- null: SKILL_INITIAL
+  add column if not exists skill_matches integer default 0;
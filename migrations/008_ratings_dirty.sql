@@ -0,0 +1,9 @@
+-- Queued ratings recomputes that survive a restart (recompute.py): the
+-- first write of a burst sets ratings_dirty, a successful recompute with
+-- nothing newer queued clears it, and each worker fully replays the groups
+-- still marked when it starts. Run once in the Supabase SQL editor.
+
+alter table groups
+  add column if not exists ratings_dirty boolean not null default false;
+
+create index if not exists groups_ratings_dirty_idx on groups (id) where ratings_dirty;
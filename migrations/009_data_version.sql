@@ -0,0 +1,7 @@
+-- Per-group data version shared by all workers (data_version.py): every
+-- write stores a fresh token here, and the group-scoped reads compare it
+-- with the token they last saw, so ETags, caches and snapshots of one
+-- worker follow writes made on another. Run once in the Supabase SQL editor.
+
+alter table groups
+  add column if not exists data_version text;
@@ -0,0 +1,14 @@
+-- Recompute progress shared by all workers (recompute.py): one row per
+-- group and process with the oldest write (ratings_version token) that
+-- process has not recomputed yet, so /ratings_status can answer on any
+-- worker for a write made on another. Run once in the Supabase SQL editor.
+
+create table if not exists recompute_progress (
+  group_id      text not null,
+  holder        text not null,
+  pending_since bigint,
+  completed     bigint not null default 0,
+  error         text,
+  updated_at    timestamptz not null,
+  primary key (group_id, holder)
+);
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from "react";
 import PlayerDropdown from "./PlayerDropdown";
+import { waitForRatings } from "../utils/helpers";
 
 //const API_BASE = process.env.REACT_APP_API_BASE || "http://127.0.0.1:8000";
 const API_BASE = process.env.REACT_APP_API_BASE || "https://padel-4apg.onrender.com";
@@ -250,7 +251,11 @@ export
       });
       const data = await res2.json();
       if (data.error) setSaveMsg(data.error);
-      else setSaveMsg("Results saved!");
+      else {
+        setSaveMsg("Results saved! Updating ratings...");
+        await waitForRatings(API_BASE, selectedGroup, data.ratings_version);
+        setSaveMsg("Results saved!");
+      }
     } catch (err) {
       setSaveMsg("Error saving results: " + err.message);
     }
@@ -6,4 +6,15 @@ export function getAllPairs(arr) {
     }
   }
   return pairs;
-}
\ No newline at end of file
+}
+
+// Ratings are recomputed in the background after a write; resolves once the
+// recompute covering `version` (the write's ratings_version) has finished.
+export async function waitForRatings(apiBase, groupId, version, timeoutSeconds = 10) {
+  if (version === undefined || version === null) return true;
+  const res = await fetch(
+    `${apiBase}/ratings_status?group_id=${groupId}&version=${version}&wait=${timeoutSeconds}`
+  );
+  const data = await res.json();
+  return Boolean(data && data.ready);
+}
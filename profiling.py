@@ -0,0 +1,286 @@
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs
+
+import db
+import metrics
+
+# ------------------------------------------------------------
+# Opt-in request profiling.
+#
+# A request is profiled when it carries "X-Profile: <PROFILE_ADMIN_TOKEN>",
+# or at random with probability PROFILE_SAMPLE_RATE. While it runs, a
+# sampler thread reads the stack of every thread each PROFILE_INTERVAL_MS
+# (idle waits dropped): the event loop, the db thread pool and the
+# recompute worker, which is where the time of a slow write or of
+# update_ratings_for_group actually goes - a deterministic profiler only
+# sees the thread it was started on. After the response is sent, the
+# profile keeps sampling until the recompute the request queued has
+# finished (at most PROFILE_RECOMPUTE_WAIT_SECONDS).
+#
+# Each profile is tagged with route, group_id and the row counts reported
+# by update_ratings_for_group / apply_match_changes for that group (note();
+# recomputes of other groups running meanwhile are left out), and written
+# to PROFILE_DIR, which keeps the last PROFILE_KEEP. /admin/profiles lists
+# them and /admin/profiles/<id> returns collapsed stacks (flamegraph.pl,
+# speedscope), both behind "X-Admin-Token: <PROFILE_ADMIN_TOKEN>".
+#
+# The group_id comes from the query string or a JSON body; the bodies of
+# STREAMING_PATHS (bulk imports) and of other content types are streamed
+# to the app untouched instead of being read up front.
+#
+# One profile at a time; other requests run unprofiled meanwhile. With no
+# token and no sample rate the middleware is not installed at all, and
+# note() returns at once. PROFILE_SAMPLE_RATE without PROFILE_ADMIN_TOKEN
+# still records (and logs a warning at startup): /admin/profiles is then
+# closed, and the profiles can only be read from PROFILE_DIR on disk.
+# ------------------------------------------------------------
+ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", ".profiles")
+KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+RECOMPUTE_WAIT_SECONDS = float(os.environ.get("PROFILE_RECOMPUTE_WAIT_SECONDS", "10"))
+MAX_DEPTH = 128
+STREAMING_PATHS = {"/import_matches"}
+ENABLED = bool(ADMIN_TOKEN) or SAMPLE_RATE > 0
+
+if SAMPLE_RATE > 0 and not ADMIN_TOKEN:
+    print(f"Warning: PROFILE_SAMPLE_RATE={SAMPLE_RATE} without PROFILE_ADMIN_TOKEN: profiles are "
+          f"written to {os.path.abspath(PROFILE_DIR)} but /admin/profiles stays closed.")
+
+# innermost frames of a thread with nothing to do
+_IDLE = {("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select"),
+         ("thread.py", "_worker"), ("threading.py", "_wait_for_tstate_lock")}
+
+_session = None            # the profile being recorded, if any
+_busy = threading.Lock()   # one profile at a time
+_ring_lock = threading.Lock()
+
+class _Session:
+    def __init__(self, tags):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        # sorts by start time (profiles never overlap), so the ring can go by name
+        millis = int(self.started_at * 1000) % 1000
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(self.started_at))}{millis:03d}-{uuid.uuid4().hex[:6]}"
+        self.tags = tags
+        self.stacks = Counter()
+        self.samples = 0
+        self.notes = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+
+    def _sample(self):
+        own = threading.get_ident()
+        interval = INTERVAL_MS / 1000.0
+        while not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(_thread_label(names.get(ident, "thread")))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.tags["duration_ms"] = round((time.perf_counter() - self.started) * 1000, 2)
+
+def _thread_label(name):
+    # db_3 / ThreadPoolExecutor-0_1 / Thread-12 -> one root per kind of thread
+    return name.rstrip("0123456789").rstrip("_-") or "thread"
+
+def check_token(value) -> bool:
+    """value is PROFILE_ADMIN_TOKEN (constant-time compare); always False with no token set."""
+    return bool(ADMIN_TOKEN) and value is not None and \
+        hmac.compare_digest(value.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+def should_profile(header) -> str:
+    """Why this request is profiled ("header" / "sampled"), or "" if it is not."""
+    if check_token(header):
+        return "header"
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return "sampled"
+    return ""
+
+def start(**tags):
+    """Start recording; None if another profile is being recorded."""
+    global _session
+    if not _busy.acquire(blocking=False):
+        return None
+    _session = _Session(tags)
+    _session.start()
+    return _session
+
+def finish(session):
+    global _session
+    try:
+        session.stop()
+        _save(session)
+    finally:
+        _session = None
+        _busy.release()
+
+def note(group_id, source, **counts):
+    """Row counts of a recompute, attached to the profile being recorded."""
+    session = _session
+    if session is not None and session.tags.get("group_id") is not None \
+            and str(session.tags["group_id"]) == str(group_id):
+        session.notes.append({"group_id": group_id, "source": source, **counts})
+
+# ------------------------------------------------------------
+# On-disk ring
+# ------------------------------------------------------------
+def _path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.json")
+
+def _save(session):
+    record = {
+        "id": session.id,
+        **session.tags,
+        "started_at": session.started_at,
+        "interval_ms": INTERVAL_MS,
+        "samples": session.samples,
+        "recompute": session.notes,
+        "stacks": dict(session.stacks.most_common()),
+    }
+    with _ring_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        tmp = _path(session.id) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp, _path(session.id))
+        for old in _files()[:-KEEP] if KEEP > 0 else []:
+            os.remove(os.path.join(PROFILE_DIR, old))
+
+def _files():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+
+def list_profiles():
+    """Newest first, without the stacks."""
+    out = []
+    for name in reversed(_files()):
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue  # removed by the ring meanwhile
+        record.pop("stacks", None)
+        out.append(record)
+    return out
+
+def load(profile_id):
+    """The stored record, or None (unknown id, or not a profile id at all)."""
+    if not profile_id or os.path.basename(profile_id) != profile_id:
+        return None
+    try:
+        with open(_path(profile_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def collapsed(record) -> str:
+    """'frame;frame;frame count' lines, the input of flamegraph.pl."""
+    return "".join(f"{stack} {n}\n" for stack, n in record["stacks"].items())
+
+# ------------------------------------------------------------
+# ASGI middleware (installed by web_api only when ENABLED)
+# ------------------------------------------------------------
+def _buffers_body(scope):
+    # only small JSON bodies are read up front (for their group_id)
+    if scope["path"] in STREAMING_PATHS:
+        return False
+    content_type = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"content-type"), "")
+    return content_type.split(";")[0].strip().lower() == "application/json"
+
+def _group_id(scope, body):
+    group_id = parse_qs(scope.get("query_string", b"").decode()).get("group_id", [None])[0]
+    if group_id is None and body and len(body) < 1_000_000:  # not from a bulk import body
+        try:
+            data = json.loads(body)
+            group_id = data.get("group_id") if isinstance(data, dict) else None
+        except ValueError:
+            pass
+    return group_id
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-profile"), None)
+        reason = should_profile(header)
+        if not reason:
+            return await self.app(scope, receive, send)
+
+        # a JSON body is read up front (for its group_id) and replayed to the app
+        body = b""
+        replay = receive
+        if _buffers_body(scope):
+            chunks = []
+            while True:
+                message = await receive()
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    break
+            body = b"".join(chunks)
+            replayed = False
+
+            async def replay():
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+        route = metrics.current_route()
+        group_id = _group_id(scope, body)
+        session = start(route=route if route != metrics.BACKGROUND else scope["path"],
+                        method=scope["method"], group_id=group_id, reason=reason)
+        if session is None:
+            return await self.app(scope, replay, send)
+
+        status = {"code": 500}
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, replay, send_and_record)
+            if group_id:
+                await _wait_for_recompute(group_id)
+        finally:
+            session.tags["status"] = status["code"]
+            await db.run(finish, session)
+
+async def _wait_for_recompute(group_id):
+    import recompute  # imports main, which imports this module
+    status = recompute.status(group_id)
+    if status["pending"]:
+        await db.run(recompute.wait, group_id, status["version"], RECOMPUTE_WAIT_SECONDS)
@@ -0,0 +1,92 @@
+import os
+import threading
+
+from cachetools import TTLCache
+
+# ------------------------------------------------------------
+# Group-scoped read cache for the hot GET endpoints.
+#
+# Entries are keyed (endpoint, group_id) and hold the response payload.
+# TTL bounds staleness if a write ever bypasses the API; the size bound
+# evicts least recently used entries. Every write to a group calls
+# invalidate(group_id), which drops that group's entries and bumps its
+# generation, so a read that was already loading from the database when
+# the write landed does not store its (now stale) result.
+# ------------------------------------------------------------
+TTL_SECONDS = float(os.environ.get("READ_CACHE_TTL_SECONDS", "60"))
+MAX_ENTRIES = int(os.environ.get("READ_CACHE_MAX_ENTRIES", "2048"))
+
+ENDPOINTS = ("player_ratings", "next_matches")  # /players, /couple_ratings: snapshot.py
+
+class _CountingTTLCache(TTLCache):
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        # only called when the cache is full: an LRU eviction
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.expirations += len(expired)
+        return expired
+
+_lock = threading.Lock()
+_cache = _CountingTTLCache(MAX_ENTRIES, TTL_SECONDS)
+_generations = {}
+_counters = {"hits": 0, "misses": 0, "stores": 0, "stale_loads": 0, "invalidations": 0}
+
+async def get_or_load(endpoint: str, group_id: str, load):
+    """
+    Cached payload for (endpoint, group_id), or the result of `await load()`,
+    which is cached unless the group was invalidated while it was loading.
+    Exceptions from load propagate and nothing is cached.
+    """
+    key = (endpoint, group_id)
+    with _lock:
+        try:
+            value = _cache[key]
+        except KeyError:
+            _counters["misses"] += 1
+            generation = _generations.get(group_id, 0)
+        else:
+            _counters["hits"] += 1
+            return value
+
+    value = await load()
+
+    with _lock:
+        if _generations.get(group_id, 0) == generation:
+            _cache[key] = value
+            _counters["stores"] += 1
+        else:
+            _counters["stale_loads"] += 1
+    return value
+
+def invalidate(group_id: str):
+    """Drop every cached endpoint for this group."""
+    if not group_id:
+        return
+    with _lock:
+        _generations[group_id] = _generations.get(group_id, 0) + 1
+        for endpoint in ENDPOINTS:
+            _cache.pop((endpoint, group_id), None)
+        _counters["invalidations"] += 1
+
+def stats() -> dict:
+    with _lock:
+        _cache.expire()
+        lookups = _counters["hits"] + _counters["misses"]
+        return {
+            **_counters,
+            "evictions": _cache.evictions,
+            "expirations": _cache.expirations,
+            "hit_ratio": round(_counters["hits"] / lookups, 4) if lookups else None,
+            "entries": len(_cache),
+            "max_entries": MAX_ENTRIES,
+            "ttl_seconds": TTL_SECONDS,
+        }
@@ -0,0 +1,264 @@
+import datetime
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import group_lock
+import main
+import metrics
+
+# ------------------------------------------------------------
+# Background, coalesced per-group ratings recompute.
+#
+# Write endpoints enqueue the (old, new) match rows they touched and return
+# at once with a version token. Per group, the first write starts a debounce
+# timer; every write that arrives before it fires joins the same run, and
+# only one run per group is in flight at a time (writes that arrive while it
+# runs are picked up by one follow-up run). Deltas add up, so a burst of N
+# writes becomes a single apply_match_changes call.
+#
+# run_now() is the synchronous full replay (/recalculate_points): callers
+# that arrive while a full replay is running and nothing was written since
+# it started join that run instead of starting another. Across processes,
+# group_lock keeps recomputes of one group from overlapping.
+#
+# A run that fails (raises, or cannot load the matches) has lost its
+# deltas: the group gets a full replay instead, retried after
+# RECOMPUTE_RETRY_SECONDS (doubling up to RECOMPUTE_RETRY_MAX_SECONDS),
+# and its writes do not count as completed until one succeeds. Queued work
+# also survives a restart: the first write of a burst sets
+# groups.ratings_dirty, a successful run with nothing newer queued clears
+# it, and recover() (at startup) fully replays every group still marked.
+#
+# Version tokens are microseconds since the epoch (strictly increasing in
+# this process), so tokens handed out by different workers compare. Every
+# process publishes, per group, the oldest write it has not finished yet
+# (recompute_progress, one row per process: migrations/010); status() with
+# a version is ready once neither this process nor any other has unfinished
+# writes at or before it, so /ratings_status answers for a write made on
+# any worker. Rows not updated for RECOMPUTE_PROGRESS_TTL_SECONDS (a worker
+# that died; its groups are replayed by recover()) are ignored.
+# ------------------------------------------------------------
+DEBOUNCE_SECONDS = float(os.environ.get("RECOMPUTE_DEBOUNCE_SECONDS", "0.5"))
+FULL_REPLAY_AFTER = int(os.environ.get("RECOMPUTE_FULL_REPLAY_AFTER", "200"))  # coalesced changes
+RETRY_SECONDS = float(os.environ.get("RECOMPUTE_RETRY_SECONDS", "5"))
+RETRY_MAX_SECONDS = float(os.environ.get("RECOMPUTE_RETRY_MAX_SECONDS", "300"))
+RECOVER_PAGE = 1000
+PROGRESS_TTL_SECONDS = float(os.environ.get("RECOMPUTE_PROGRESS_TTL_SECONDS", "600"))
+WAIT_POLL_SECONDS = 0.25  # how often wait() looks at the other processes' progress
+
+class _GroupState:
+    def __init__(self):
+        self.version = 0          # last write enqueued
+        self.completed = 0        # last write covered by a finished recompute
+        self.pending_since = None # oldest write not covered yet (a lower bound)
+        self.changes = []         # pending (old, new) match rows
+        self.full = False         # pending full replay requested
+        self.timer = None
+        self.running = False
+        self.running_full = False # the run in flight is a full replay
+        self.running_version = 0  # the writes it covers
+        self.attempted = 0        # writes covered by the last finished run, failed or not
+        self.failures = 0         # failed runs in a row
+        self.marked = False       # groups.ratings_dirty set for the queued work
+        self.last_error = None
+        self.last_stats = None
+
+_lock = threading.Condition()
+_groups = defaultdict(_GroupState)
+_marker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recompute-mark")  # in order
+_last_token = 0
+
+def _token():
+    # caller holds _lock
+    global _last_token
+    _last_token = max(_last_token + 1, time.time_ns() // 1000)
+    return _last_token
+
+def _persist_dirty(group_id, dirty):
+    try:
+        main.supabase.table("groups").update({"ratings_dirty": dirty}).eq("id", group_id).execute()
+    except Exception as e:
+        print("Error marking ratings of group", group_id, "dirty =", dirty, ":", e)
+
+def _persist_progress(group_id, pending_since, completed, error):
+    row = {"group_id": group_id, "holder": group_lock.HOLDER, "pending_since": pending_since,
+           "completed": completed, "error": error,
+           "updated_at": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+    try:
+        main.supabase.table("recompute_progress").upsert(row, on_conflict="group_id,holder").execute()
+    except Exception as e:
+        print("Error publishing recompute progress of group", group_id, ":", e)
+
+def _publish(group_id, st):
+    # caller holds _lock
+    _marker.submit(_persist_progress, group_id, st.pending_since, st.completed, st.last_error)
+
+def _mark(group_id, st):
+    # caller holds _lock, so set / clear reach the marker thread in order
+    if not st.marked:
+        st.marked = True
+        _marker.submit(_persist_dirty, group_id, True)
+    if st.pending_since is None:
+        st.pending_since = st.version
+        _publish(group_id, st)
+
+def enqueue(group_id: str, changes=None, full: bool = False) -> int:
+    """
+    Queue a recompute for group_id covering these match changes.
+    Returns the version token; status(group_id)["completed"] >= token
+    once the ratings include this write.
+    """
+    with _lock:
+        st = _groups[group_id]
+        st.version = _token()
+        st.changes.extend(changes or [])
+        st.full = st.full or full
+        _mark(group_id, st)
+        if not st.running and st.timer is None:
+            _schedule(group_id, st)
+        return st.version
+
+def _schedule(group_id, st, delay=None):
+    st.timer = threading.Timer(DEBOUNCE_SECONDS if delay is None else delay, _drain, args=(group_id,))
+    st.timer.daemon = True
+    st.timer.start()
+
+def _drain(group_id: str):
+    with _lock:
+        st = _groups[group_id]
+        st.timer = None
+        st.running = True
+        changes, st.changes = st.changes, []
+        full, st.full = st.full, False
+        target = st.version
+        st.running_full = full or len(changes) > FULL_REPLAY_AFTER
+        st.running_version = target
+
+    stats, error = None, None
+    try:
+        with metrics.route("recompute"):
+            if st.running_full:
+                stats = main.update_ratings_for_group(group_id)
+            elif changes:
+                stats = main.apply_match_changes(group_id, changes)
+            if stats is None and (st.running_full or changes):
+                error = "matches could not be loaded"
+    except Exception as e:
+        error = str(e)
+    if error:
+        print("Error in recompute for group", group_id, ":", error)
+
+    with _lock:
+        st.running = False
+        st.attempted = target
+        st.last_stats = stats
+        st.last_error = error
+        if error is None:
+            st.completed = target
+            st.pending_since = target + 1 if st.version > target else None
+            st.failures = 0
+            if st.version == target and st.marked:
+                st.marked = False
+                _marker.submit(_persist_dirty, group_id, False)
+            # writes that arrived during the run => one follow-up run
+            if st.version > target and st.timer is None:
+                _schedule(group_id, st)
+        else:
+            # this run's deltas are lost: replay the group, after a pause
+            st.full = True
+            st.failures += 1
+            if st.timer is None:
+                _schedule(group_id, st, min(RETRY_SECONDS * 2 ** (st.failures - 1), RETRY_MAX_SECONDS))
+        _publish(group_id, st)
+        _lock.notify_all()
+
+def run_now(group_id: str, timeout: float = None) -> dict:
+    """
+    Full replay of group_id, shared with concurrent callers; blocks until it
+    is done. Returns that run's stats, or raises its error.
+    """
+    with _lock:
+        st = _groups[group_id]
+        if st.running and st.running_full and st.running_version == st.version:
+            target = st.version  # join the run in flight: it already covers every write
+        else:
+            st.version = _token()
+            st.full = True
+            target = st.version
+            _mark(group_id, st)
+            if not st.running and st.timer is None:
+                st.timer = threading.Timer(0, _drain, args=(group_id,))  # no debounce
+                st.timer.daemon = True
+                st.timer.start()
+            # else the pending timer or the follow-up of the running drain picks it up
+        # done, or failed (then retried in the background)
+        if not _lock.wait_for(lambda: st.completed >= target or (st.attempted >= target and st.last_error),
+                              timeout=timeout):
+            raise TimeoutError(f"recompute of group {group_id} did not finish in {timeout}s")
+        if st.completed < target:
+            raise RuntimeError(st.last_error)
+        return st.last_stats
+
+def _others_done(group_id, version):
+    """No other live process has unfinished writes of group_id at or before version."""
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=PROGRESS_TTL_SECONDS)
+    try:
+        rows = main.supabase.table("recompute_progress").select("holder") \
+            .eq("group_id", group_id).neq("holder", group_lock.HOLDER) \
+            .lte("pending_since", version).gt("updated_at", cutoff.isoformat()).execute().data
+    except Exception as e:
+        print("Error reading recompute progress of group", group_id, ":", e)
+        return True  # answer for this process alone
+    return not rows
+
+def status(group_id: str, version: int = None) -> dict:
+    """
+    Recompute state of group_id in this process; with a version (a write's
+    ratings_version, from any worker), "ready" covers the other processes too.
+    """
+    with _lock:
+        st = _groups.get(group_id) or _GroupState()
+        target = st.version if version is None else version
+        out = {
+            "group_id": group_id,
+            "version": st.version,
+            "completed": st.completed,
+            "ready": st.pending_since is None or st.pending_since > target,
+            "pending": st.version > st.completed,
+            "error": st.last_error,
+            "stats": st.last_stats,
+        }
+    if version is not None and out["ready"]:
+        out["ready"] = _others_done(group_id, version)
+    return out
+
+def wait(group_id: str, version: int, timeout: float) -> bool:
+    """Block until the recomputes covering version (in any process) have finished, or timeout."""
+    deadline = time.monotonic() + timeout
+    while not status(group_id, version)["ready"]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        with _lock:
+            _lock.wait(min(remaining, WAIT_POLL_SECONDS))
+    return True
+
+def recover() -> list:
+    """
+    Queue a full replay of every group whose queued recompute never
+    finished (groups.ratings_dirty, e.g. after a restart). Returns their ids.
+    """
+    group_ids, start = [], 0
+    while True:
+        rows = main.supabase.table("groups").select("id").eq("ratings_dirty", True) \
+            .order("id").range(start, start + RECOVER_PAGE - 1).execute().data or []
+        group_ids.extend(r["id"] for r in rows)
+        if len(rows) < RECOVER_PAGE:
+            break
+        start += RECOVER_PAGE
+    for group_id in group_ids:
+        enqueue(group_id, full=True)
+    return group_ids
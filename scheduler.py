@@ -0,0 +1,237 @@
+import math
+import random
+import time
+
+from teams import couple_strength
+
+# ------------------------------------------------------------
+# Multi-court Americano / Mexicano session planner.
+#
+# A plan is, per round, an ordering of the players: slots 4c..4c+3 play on
+# court c (team1 = first two, team2 = last two), everyone after the last
+# court sits out. Local search (simulated annealing, restarted until the
+# time budget runs out) swaps two players inside one round and keeps the
+# best plan seen. Cost terms:
+#   - repeated partnerships          (each repeat of a pair)
+#   - repeated opponents             (each repeat of a pair)
+#   - team strength imbalance        |strength(team1) - strength(team2)|
+#   - uneven sit-outs                sum of squared sit-out counts
+#   - mexicano only: mixed levels    spread of player points on a court
+# Strengths use the same formula as /propose_teams (players.total_points
+# plus couples.total_points).
+# ------------------------------------------------------------
+
+DEFAULT_WEIGHTS = {
+    "partner_repeat": 1000.0,
+    "opponent_repeat": 200.0,
+    "imbalance": 1.0,
+    "sit_out": 50.0,
+    "level_spread": 1.0,
+}
+
+class _Search:
+    def __init__(self, n, courts, rounds, player_pts, strength, mode, weights, rng):
+        self.n = n
+        self.courts = courts
+        self.rounds = rounds
+        self.player_pts = player_pts
+        self.strength = strength
+        self.mexicano = mode == "mexicano"
+        self.w = weights
+        self.rng = rng
+        self.slots = 4 * courts
+
+    # --- building / scoring -------------------------------------------------
+    def random_plan(self):
+        """Random rounds, sit-outs rotated so nobody sits twice before everyone sat once."""
+        plan = []
+        sits = [0] * self.n
+        for _ in range(self.rounds):
+            order = list(range(self.n))
+            self.rng.shuffle(order)
+            order.sort(key=lambda p: sits[p])  # stable sort keeps the shuffle among ties
+            sitting = order[: self.n - self.slots]
+            playing = order[self.n - self.slots:]
+            self.rng.shuffle(playing)
+            for p in sitting:
+                sits[p] += 1
+            plan.append(playing + sitting)
+        return plan
+
+    def load(self, plan):
+        n = self.n
+        self.plan = [list(r) for r in plan]
+        self.partner = [[0] * n for _ in range(n)]
+        self.opponent = [[0] * n for _ in range(n)]
+        self.sits = [0] * n
+        self.cost = 0.0
+        for r in range(self.rounds):
+            for c in range(self.courts):
+                self.cost += self._court(r, c, +1)
+            for p in self.plan[r][self.slots:]:
+                self.cost += self._sit(p, +1)
+
+    def _pair(self, table, a, b, sign, weight):
+        # sum over pairs of count * (count - 1) / 2, updated incrementally
+        if a > b:
+            a, b = b, a
+        if sign > 0:
+            d = weight * table[a][b]
+            table[a][b] += 1
+        else:
+            table[a][b] -= 1
+            d = -weight * table[a][b]
+        return d
+
+    def _court(self, r, c, sign):
+        """Add (+1) or remove (-1) court c of round r; returns the cost change."""
+        a, b, x, y = self.plan[r][4 * c: 4 * c + 4]
+        w = self.w
+        d = self._pair(self.partner, a, b, sign, w["partner_repeat"])
+        d += self._pair(self.partner, x, y, sign, w["partner_repeat"])
+        for p in (a, b):
+            for q in (x, y):
+                d += self._pair(self.opponent, p, q, sign, w["opponent_repeat"])
+        static = w["imbalance"] * abs(self.strength[a][b] - self.strength[x][y])
+        if self.mexicano:
+            pts = [self.player_pts[p] for p in (a, b, x, y)]
+            static += w["level_spread"] * (max(pts) - min(pts))
+        return d + sign * static
+
+    def _sit(self, p, sign):
+        # sum of squared sit-out counts
+        if sign > 0:
+            d = self.w["sit_out"] * (2 * self.sits[p] + 1)
+            self.sits[p] += 1
+        else:
+            self.sits[p] -= 1
+            d = -self.w["sit_out"] * (2 * self.sits[p] + 1)
+        return d
+
+    def _touch(self, r, i, sign):
+        if i < self.slots:
+            return self._court(r, i // 4, sign)
+        return self._sit(self.plan[r][i], sign)
+
+    def _swap_delta(self, r, i, j):
+        """Swap slots i and j of round r; returns the cost change."""
+        # i is always a playing slot; j may be on the same court, another court or sitting out
+        same_group = j < self.slots and i // 4 == j // 4
+        d = self._touch(r, i, -1)
+        if not same_group:
+            d += self._touch(r, j, -1)
+        row = self.plan[r]
+        row[i], row[j] = row[j], row[i]
+        d += self._touch(r, i, +1)
+        if not same_group:
+            d += self._touch(r, j, +1)
+        return d
+
+    # --- search -------------------------------------------------------------
+    def anneal(self, deadline, iterations):
+        best_cost = self.cost
+        best_plan = [list(r) for r in self.plan]
+        temp = self.w["opponent_repeat"]
+        cooling = (0.01) ** (1.0 / max(iterations, 1))
+        done = 0
+        for done in range(1, iterations + 1):
+            if done % 256 == 0 and time.perf_counter() > deadline:
+                break
+            r = self.rng.randrange(self.rounds)
+            i = self.rng.randrange(self.slots)
+            j = self.rng.randrange(self.n)
+            if i == j:
+                continue
+            d = self._swap_delta(r, i, j)
+            if d <= 0 or self.rng.random() < math.exp(-d / temp):
+                self.cost += d
+                if self.cost < best_cost - 1e-9:
+                    best_cost = self.cost
+                    best_plan = [list(row) for row in self.plan]
+            else:
+                self._swap_delta(r, i, j)  # undo
+            temp *= cooling
+        return best_cost, best_plan, done
+
+def _breakdown(search):
+    partner = sum(c * (c - 1) // 2 for row in search.partner for c in row)
+    opponent = sum(c * (c - 1) // 2 for row in search.opponent for c in row)
+    imbalance = 0
+    for r in range(search.rounds):
+        for c in range(search.courts):
+            a, b, x, y = search.plan[r][4 * c: 4 * c + 4]
+            imbalance += abs(search.strength[a][b] - search.strength[x][y])
+    return {
+        "repeated_partnerships": partner,
+        "repeated_opponents": opponent,
+        "total_imbalance": imbalance,
+        "max_sit_outs": max(search.sits) if search.sits else 0,
+        "min_sit_outs": min(search.sits) if search.sits else 0,
+    }
+
+def schedule_session(players, courts, rounds, player_points, couple_points,
+                     mode="americano", time_budget=1.0, seed=None, weights=None):
+    """
+    Build a multi-round, multi-court plan for one session.
+    players: names; courts: courts available (capped at len(players) // 4);
+    mode: "americano" (rotate partners) or "mexicano" (also keep levels together).
+    Runs restarts of the local search until time_budget (seconds) is spent.
+    """
+    n = len(players)
+    courts = min(int(courts), n // 4)
+    if courts < 1 or rounds < 1:
+        return {"rounds": [], "cost": None, "summary": None, "restarts": 0, "iterations": 0}
+
+    w = dict(DEFAULT_WEIGHTS)
+    w.update(weights or {})
+    rng = random.Random(seed)
+
+    player_pts = [player_points.get(p, 0) or 0 for p in players]
+    strength = [[0] * n for _ in range(n)]
+    for a in range(n):
+        for b in range(a + 1, n):
+            strength[a][b] = strength[b][a] = couple_strength(players[a], players[b], player_points, couple_points)
+
+    search = _Search(n, courts, int(rounds), player_pts, strength, mode, w, rng)
+    deadline = time.perf_counter() + max(time_budget, 0.0)
+    # one restart ~ a few hundred moves per slot; enough to settle before restarting
+    per_restart = max(2000, 400 * search.slots * search.rounds // 4)
+
+    best_cost, best_plan = None, None
+    restarts = iterations = 0
+    while True:
+        search.load(search.random_plan())
+        cost, plan, done = search.anneal(deadline, per_restart)
+        restarts += 1
+        iterations += done
+        if best_cost is None or cost < best_cost:
+            best_cost, best_plan = cost, plan
+        if time.perf_counter() > deadline:
+            break
+
+    search.load(best_plan)
+    out_rounds = []
+    for r, row in enumerate(best_plan):
+        court_rows = []
+        for c in range(courts):
+            a, b, x, y = row[4 * c: 4 * c + 4]
+            court_rows.append({
+                "court": c + 1,
+                "team1": [players[a], players[b]],
+                "team2": [players[x], players[y]],
+                "team1_strength": strength[a][b],
+                "team2_strength": strength[x][y],
+            })
+        out_rounds.append({
+            "round": r + 1,
+            "courts": court_rows,
+            "sitting_out": [players[p] for p in row[search.slots:]],
+        })
+
+    return {
+        "rounds": out_rounds,
+        "cost": round(best_cost, 3),
+        "summary": _breakdown(search),
+        "restarts": restarts,
+        "iterations": iterations,
+    }
@@ -0,0 +1,62 @@
+import os
+
+# ------------------------------------------------------------
+# Skill ratings: Elo for doubles (groups.rating_mode = 'skill').
+#
+# Unlike the points system, a skill rating accounts for who you beat. A
+# team's rating is the mean of its two players'; the expected score of
+# team1 is 1 / (1 + 10 ** ((team2 - team1) / 400)), and after the match
+# both players of team1 move by K * (score - expected) and both players of
+# team2 by the opposite (score: 1 win, 0 loss, 0.5 when nobody won). Each
+# match is an O(1) update of its four players, applied as results come in.
+#
+# Matches are applied in (match_date, id) order. A match that sorts before
+# the newest one already applied (an edit, a delete, a back-dated result)
+# or a new K needs a replay of the group's history (replay()): one pass,
+# with the matches scored in bulk beforehand (main._score_sets_many). Each
+# update needs the ratings the previous ones produced, so the pass itself
+# stays sequential.
+#
+# Only players rows are rated; references that match no player count as a
+# fresh SKILL_INITIAL player in every match and are never updated. Matches
+# that do not have four distinct players are skipped.
+# ------------------------------------------------------------
+INITIAL = float(os.environ.get("SKILL_INITIAL", "1500"))
+K = float(os.environ.get("SKILL_K", "32"))
+SCALE = 400.0
+MODES = ("points", "skill")
+
+_SCORES = {"team1": 1.0, "team2": 0.0}
+
+def score(winner) -> float:
+    """team1's actual score: 1 for a win, 0 for a loss, 0.5 when nobody won."""
+    return _SCORES.get(winner, 0.5)
+
+def game(team1, team2, winner):
+    """(a, b, c, d, score) of a match (team1 = a, b), or None if it is not rated."""
+    players = list(team1) + list(team2)
+    if len(players) != 4 or len(set(players)) != 4 or not all(players):
+        return None
+    return (*players, score(winner))
+
+def expected(team1_rating, team2_rating) -> float:
+    return 1.0 / (1.0 + 10.0 ** ((team2_rating - team1_rating) / SCALE))
+
+def update(ratings, counts, g, k=K):
+    """Apply one game to ratings / counts (dicts of rated players only), in place."""
+    a, b, c, d, s = g
+    ra, rb = ratings.get(a, INITIAL), ratings.get(b, INITIAL)
+    rc, rd = ratings.get(c, INITIAL), ratings.get(d, INITIAL)
+    delta = k * (s - expected((ra + rb) / 2.0, (rc + rd) / 2.0))
+    for player, new in ((a, ra + delta), (b, rb + delta), (c, rc - delta), (d, rd - delta)):
+        if player in ratings:
+            ratings[player] = new
+            counts[player] = counts.get(player, 0) + 1
+
+def replay(games, players, k=K):
+    """Ratings and rated-match counts of players ({key: ...}) after games, in order."""
+    ratings = {p: INITIAL for p in players}
+    counts = {p: 0 for p in players}
+    for g in games:
+        update(ratings, counts, g, k)
+    return ratings, counts
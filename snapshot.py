@@ -0,0 +1,273 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import data_version
+import db
+import main
+
+# ------------------------------------------------------------
+# Per-group in-memory snapshot of players, couples and matches.
+#
+# The read endpoints used to fetch and json-decode the same rows on every
+# request. A snapshot holds them decoded once: match rows as compact
+# MatchRecord objects (__slots__, tuples) sorted by (match_date, id),
+# players and couples as plain rows. It loads on first access and then
+# tracks change events per table:
+#   - local writes: data_version.bump(group_id, tables) (subscribed below)
+#   - other processes: get() first calls data_version.sync, which bumps
+#     (all tables) when groups.data_version holds a token another worker
+#     wrote, at most every DATA_VERSION_CHECK_SECONDS; and, when enabled,
+#     Supabase Realtime postgres_changes (start_realtime), which bumps per
+#     table right away. Either way ETags and the read cache follow too.
+# A changed table is marked stale and re-read on the next access; the other
+# tables stay as they are (a ratings recompute only touches players and
+# couples, never the match list).
+#
+# Memory is bounded: snapshots are kept in LRU order and evicted past
+# SNAPSHOT_MAX_MB (estimated size) or SNAPSHOT_MAX_GROUPS; stats() reports
+# the per-group sizes. A group whose snapshot alone is over SNAPSHOT_MAX_MB
+# is not kept at all: each read loads it from the database and drops it
+# afterwards (stats()["oversized"] counts those loads).
+# ------------------------------------------------------------
+MAX_BYTES = int(float(os.environ.get("SNAPSHOT_MAX_MB", "64")) * 1024 * 1024)
+MAX_GROUPS = int(os.environ.get("SNAPSHOT_MAX_GROUPS", "256"))
+REALTIME = os.environ.get("SNAPSHOT_REALTIME", "0") == "1"
+LOAD_PAGE = 1000  # PostgREST's default max rows per response
+TABLES = ("players", "couples", "matches")
+
+_MATCH_COLUMNS = ("id", "group_id", "match_date", "team1", "team2", "sets", "couples",
+                  "mode", "score1", "score2", "result", "next_match_id")
+
+def _freeze(value):
+    # decoded JSON lists -> tuples (smaller, and nobody can mutate them)
+    return tuple(_freeze(v) for v in value) if isinstance(value, list) else value
+
+def _thaw(value):
+    return [_thaw(v) for v in value] if isinstance(value, tuple) else value
+
+class MatchRecord:
+    """One decoded matches row."""
+    __slots__ = _MATCH_COLUMNS + ("extra",)
+
+    def __init__(self, row):
+        for col in _MATCH_COLUMNS:
+            setattr(self, col, row.get(col))
+        self.team1 = _freeze(main._safe_json_list(self.team1))
+        self.team2 = _freeze(main._safe_json_list(self.team2))
+        self.sets = _freeze(main._safe_json_list(self.sets))
+        self.couples = _freeze([main._safe_json_list(c) for c in main._safe_json_list(self.couples)])
+        # columns this file does not know about (created_at, ...); None when there are none
+        self.extra = {k: v for k, v in row.items() if k not in _MATCH_COLUMNS} or None
+
+    def order_key(self):
+        return (self.match_date or "", self.id)
+
+    def refs(self):
+        return self.team1 + self.team2
+
+    def as_row(self):
+        """The row as the table returns it (lists decoded)."""
+        row = {col: _thaw(getattr(self, col)) for col in _MATCH_COLUMNS}
+        if self.extra:
+            row.update(self.extra)
+        return row
+
+def _sizeof(obj, seen=None):
+    """Rough deep size in bytes (containers, slots, strings)."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_sizeof(getattr(obj, s, None), seen) for s in obj.__slots__)
+    return size
+
+class GroupSnapshot:
+    __slots__ = ("group_id", "players", "couples", "matches", "by_id", "stale",
+                 "generation", "nbytes", "loaded_at", "refresh_lock")
+
+    def __init__(self, group_id):
+        self.group_id = group_id
+        self.players = []
+        self.couples = []
+        self.matches = []        # MatchRecord, oldest first by (match_date, id)
+        self.by_id = {}          # match id -> MatchRecord
+        self.stale = set(TABLES)
+        self.generation = dict.fromkeys(TABLES, 0)  # change events seen per table
+        self.nbytes = {}         # table -> estimated bytes
+        self.loaded_at = None
+        self.refresh_lock = threading.Lock()
+
+    def names_by_id(self):
+        return {str(p["id"]): p["name"] for p in self.players}
+
+    def newest_first(self, limit=None, before=None):
+        """
+        Match records, newest first; only those ordered before the
+        (match_date, id) key `before` when it is given.
+        """
+        end = len(self.matches)
+        if before is not None:
+            end = bisect.bisect_left(self.matches, (before[0] or "", before[1]), key=MatchRecord.order_key)
+        start = 0 if limit is None else max(0, end - limit)
+        return self.matches[start:end][::-1]
+
+    def total_bytes(self):
+        return sum(self.nbytes.values())
+
+_lock = threading.Lock()
+_snapshots = OrderedDict()   # group_id -> GroupSnapshot, least recently used first
+_counters = {"hits": 0, "loads": 0, "table_loads": 0, "evictions": 0, "events": 0, "oversized": 0}
+
+def _select_all(table, group_id, order=None):
+    rows = []
+    start = 0
+    while True:
+        query = main.supabase.table(table).select("*").eq("group_id", group_id)
+        if order:
+            query = query.order(order)
+        page = query.range(start, start + LOAD_PAGE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < LOAD_PAGE:
+            return rows
+        start += LOAD_PAGE
+
+def _refresh(snap):
+    # Runs on the db thread pool. The per-snapshot lock makes concurrent
+    # readers of a stale group share one reload. Tables stay marked stale
+    # until the reload is done, so no reader is handed half-loaded data, and a
+    # table stays stale if another change event for it came in meanwhile.
+    with snap.refresh_lock:
+        with _lock:
+            tables = set(snap.stale)
+            generation = {t: snap.generation[t] for t in tables}
+        if not tables:
+            return
+        for table in TABLES:
+            if table not in tables:
+                continue
+            if table == "matches":
+                records = sorted((MatchRecord(r) for r in _select_all("matches", snap.group_id, "id")),
+                                 key=MatchRecord.order_key)
+                snap.matches, snap.by_id = records, {r.id: r for r in records}
+                snap.nbytes["matches"] = _sizeof(records)
+            else:
+                rows = _select_all(table, snap.group_id)
+                setattr(snap, table, rows)
+                snap.nbytes[table] = _sizeof(rows)
+        snap.loaded_at = time.time()
+        with _lock:
+            snap.stale -= {t for t in tables if snap.generation[t] == generation[t]}
+            _counters["loads"] += 1
+            _counters["table_loads"] += len(tables)
+            _evict(keep=snap.group_id)
+
+def _evict(keep):
+    # caller holds _lock
+    kept = _snapshots.get(keep)
+    if kept is not None and kept.total_bytes() > MAX_BYTES:
+        del _snapshots[keep]  # over the cap alone: the caller uses it once
+        _counters["oversized"] += 1
+    total = sum(s.total_bytes() for s in _snapshots.values())
+    while len(_snapshots) > 1 and (total > MAX_BYTES or len(_snapshots) > MAX_GROUPS):
+        group_id, oldest = next(iter(_snapshots.items()))
+        if group_id == keep:
+            _snapshots.move_to_end(group_id)
+            continue
+        del _snapshots[group_id]
+        total -= oldest.total_bytes()
+        _counters["evictions"] += 1
+
+async def get(group_id: str) -> GroupSnapshot:
+    """The group's snapshot, loading whatever is missing or stale."""
+    await data_version.sync(group_id)
+    with _lock:
+        snap = _snapshots.get(group_id)
+        if snap is None:
+            snap = _snapshots[group_id] = GroupSnapshot(group_id)
+        _snapshots.move_to_end(group_id)
+        if not snap.stale:
+            _counters["hits"] += 1
+            return snap
+    await db.run(_refresh, snap)
+    return snap
+
+def on_change(group_id: str, tables=None):
+    """Mark tables (None: all) of a cached group stale."""
+    with _lock:
+        _counters["events"] += 1
+        snap = _snapshots.get(group_id)
+        if snap is not None:
+            for table in TABLES if tables is None else [t for t in tables if t in TABLES]:
+                snap.stale.add(table)
+                snap.generation[table] += 1
+
+data_version.subscribe(on_change)
+
+def drop(group_id: str = None):
+    """Forget one group's snapshot (or all of them)."""
+    with _lock:
+        if group_id is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(group_id, None)
+
+def stats() -> dict:
+    with _lock:
+        groups = {g: {"bytes": s.total_bytes(), "matches": len(s.matches), "players": len(s.players),
+                      "couples": len(s.couples), "stale": sorted(s.stale)}
+                  for g, s in _snapshots.items()}
+        return {
+            **_counters,
+            "groups": len(groups),
+            "bytes": sum(g["bytes"] for g in groups.values()),
+            "max_bytes": MAX_BYTES,
+            "max_groups": MAX_GROUPS,
+            "by_group": groups,
+        }
+
+# ------------------------------------------------------------
+# Realtime: hear about writes made by other processes
+# ------------------------------------------------------------
+def _group_ids_for(table, record):
+    group_id = record.get("group_id")
+    if group_id:
+        return [group_id]
+    # a DELETE only carries the primary key (unless REPLICA IDENTITY FULL)
+    with _lock:
+        if table == "matches":
+            return [g for g, s in _snapshots.items() if record.get("id") in s.by_id]
+        return list(_snapshots)
+
+def on_postgres_change(payload):
+    """Realtime postgres_changes callback."""
+    data = payload.get("data", payload)
+    table = data.get("table")
+    if table not in TABLES:
+        return
+    record = data.get("record") or data.get("old_record") or {}
+    for group_id in _group_ids_for(table, record):
+        data_version.bump(group_id, tables=(table,), persist=False)  # the writer stored its token
+
+async def start_realtime(url=None, key=None):
+    """
+    Subscribe to postgres_changes on players, couples and matches (the tables
+    must be in the supabase_realtime publication). Returns the async client;
+    close it with `await client.remove_all_channels()`.
+    """
+    from supabase import acreate_client
+    client = await acreate_client(url or main.url, key or main.key)
+    channel = client.channel("padel-snapshots")
+    for table in TABLES:
+        channel.on_postgres_changes("*", schema="public", table=table, callback=on_postgres_change)
+    await channel.subscribe()
+    return client
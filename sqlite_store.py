@@ -0,0 +1,425 @@
+import json
+import re
+import sqlite3
+import threading
+
+# ------------------------------------------------------------
+# Embedded SQLite backend (STORAGE_BACKEND=sqlite, see storage.py).
+#
+# SQLiteClient answers the same query-builder calls the code makes on the
+# Supabase client -- table(name).select/insert/upsert/update/delete with
+# eq/neq/in_/gt/gte/lt/lte/or_ filters, order/limit/range, execute() --
+# so main.py and web_api.py run unchanged on a local file. JSON columns
+# are stored as text and decoded on the way out, booleans come back as
+# bools, NULLs sort like Postgres (last ascending, first descending).
+#
+# One connection in WAL mode, shared by the db thread pool behind a lock.
+# Keep SCHEMA in step with the Supabase tables (and migrations/).
+# ------------------------------------------------------------
+SCHEMA = """
+create table if not exists users (
+  id         integer primary key autoincrement,
+  username   text not null unique,
+  nickname   text,
+  created_at text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+create table if not exists groups (
+  id                   text primary key,
+  name                 text,
+  player_refs_migrated boolean not null default 0,
+  player_refs_cursor   integer,
+  rating_mode          text not null default 'points',
+  skill_k              real,
+  skill_last_date      text,
+  skill_last_id        integer,
+  ratings_dirty        boolean not null default 0,
+  data_version         text,
+  created_at           text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+create table if not exists user_groups (
+  id         integer primary key autoincrement,
+  username   text not null,
+  group_id   text not null,
+  created_at text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+create index if not exists user_groups_username_idx on user_groups (username);
+create index if not exists user_groups_group_idx on user_groups (group_id);
+
+create table if not exists players (
+  id             integer primary key autoincrement,
+  name           text,
+  group_id       text,
+  total_points   integer default 0,
+  sets_won       integer default 0,
+  matches_played integer default 0,
+  matches_won    integer default 0,
+  skill_rating   real,
+  skill_matches  integer default 0,
+  created_at     text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+create index if not exists players_group_name_idx on players (group_id, name);
+
+create table if not exists couples (
+  id             integer primary key autoincrement,
+  group_id       text not null,
+  player1        text not null,
+  player2        text not null,
+  total_points   integer default 0,
+  sets_won       integer default 0,
+  matches_played integer default 0,
+  matches_won    integer default 0,
+  created_at     text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+  unique (group_id, player1, player2)
+);
+
+create table if not exists matches (
+  id            integer primary key autoincrement,
+  group_id      text,
+  match_date    text,
+  team1         text,
+  team2         text,
+  sets          text,
+  couples       text,
+  mode          text,
+  score1        integer,
+  score2        integer,
+  result        text,
+  next_match_id integer,
+  created_at    text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+create index if not exists matches_group_date_id_idx on matches (group_id, match_date, id);
+create index if not exists matches_next_match_idx on matches (next_match_id);
+
+create table if not exists next_matches (
+  id               integer primary key autoincrement,
+  group_id         text,
+  match_date       text,
+  registered_users text,
+  created_at       text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+create index if not exists next_matches_group_date_idx on next_matches (group_id, match_date);
+
+create table if not exists match_players (
+  match_id         integer not null references matches(id) on delete cascade,
+  group_id         text not null,
+  player           text not null,
+  match_date       text,
+  team             integer not null,
+  match_created_at text,
+  rated            integer,
+  team_points      integer,
+  player_points    integer,
+  sets_won         integer,
+  won_match        integer,
+  winner           integer,
+  primary key (match_id, player)
+);
+create index if not exists match_players_group_player_date_idx
+  on match_players (group_id, player, match_date, match_id);
+create index if not exists match_players_ledger_idx
+  on match_players (group_id, player, match_date, match_created_at, match_id);
+
+create table if not exists daily_stats (
+  group_id       text not null,
+  kind           text not null,
+  player1        text not null,
+  player2        text not null default '',
+  day            text not null,
+  total_points   integer not null default 0,
+  sets_won       integer not null default 0,
+  matches_played integer not null default 0,
+  matches_won    integer not null default 0,
+  primary key (group_id, kind, player1, player2, day)
+);
+create index if not exists daily_stats_group_day_idx on daily_stats (group_id, day);
+
+create table if not exists recompute_locks (
+  group_id   text primary key,
+  holder     text not null,
+  expires_at text not null
+);
+
+create table if not exists recompute_progress (
+  group_id      text not null,
+  holder        text not null,
+  pending_since integer,
+  completed     integer not null default 0,
+  error         text,
+  updated_at    text not null,
+  primary key (group_id, holder)
+);
+"""
+
+JSON_COLUMNS = {
+    "matches": {"team1", "team2", "sets", "couples"},
+    "next_matches": {"registered_users"},
+}
+BOOL_COLUMNS = {
+    "groups": {"player_refs_migrated", "ratings_dirty"},
+    "match_players": {"rated", "won_match"},
+}
+# columns added after a table was first shipped: added to older files on open
+ADDED_COLUMNS = {
+    "match_players": ("match_created_at text", "rated integer", "team_points integer", "player_points integer",
+                      "sets_won integer", "won_match integer", "winner integer"),
+    "groups": ("rating_mode text not null default 'points'", "skill_k real", "skill_last_date text",
+               "skill_last_id integer", "ratings_dirty boolean not null default 0",
+               "data_version text"),
+    "players": ("skill_rating real", "skill_matches integer default 0"),
+}
+PRIMARY_KEYS = {"match_players": "match_id,player", "daily_stats": "group_id,kind,player1,player2,day",
+                "recompute_progress": "group_id,holder"}
+
+_IDENT = re.compile(r"^[a-z_][a-z0-9_]*$")
+_OPS = {"eq": "=", "neq": "<>", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
+def _ident(name):
+    name = name.strip()
+    if not _IDENT.match(name):
+        raise ValueError(f"bad column name {name!r}")
+    return f'"{name}"'
+
+class Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class Query:
+    def __init__(self, client, table):
+        _ident(table)
+        self.client = client
+        self.table = table
+        self.op = "select"
+        self.columns = "*"
+        self.count = None
+        self.payload = None
+        self.on_conflict = ""
+        self.where = []     # sql fragments, joined with AND
+        self.params = []
+        self.orders = []
+        self._limit = None
+        self._offset = None
+
+    # --- verbs
+    def select(self, columns="*", count=None):
+        self.op, self.columns, self.count = "select", columns, count
+        return self
+
+    def insert(self, payload, **kw):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict="", **kw):
+        self.op, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload, **kw):
+        self.op, self.payload = "update", payload
+        return self
+
+    def delete(self, **kw):
+        self.op = "delete"
+        return self
+
+    # --- filters
+    def _compare(self, column, op, value):
+        if value is None:
+            if op not in ("eq", "neq"):
+                raise ValueError(f"cannot compare {column} {op} null")
+            self.where.append(f"{_ident(column)} is {'' if op == 'eq' else 'not '}null")
+        else:
+            self.where.append(f"{_ident(column)} {_OPS[op]} ?")
+            self.params.append(self._bind(column, value))
+        return self
+
+    def eq(self, column, value):
+        return self._compare(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._compare(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._compare(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._compare(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._compare(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._compare(column, "lte", value)
+
+    def in_(self, column, values):
+        values = list(values)
+        if not values:
+            self.where.append("0")
+            return self
+        self.where.append(f"{_ident(column)} in ({', '.join('?' * len(values))})")
+        self.params.extend(self._bind(column, v) for v in values)
+        return self
+
+    def or_(self, expr):
+        """PostgREST logic tree: "a.lt.X,and(a.eq.X,b.lt.Y)"."""
+        sql, params = _logic("or", expr)
+        self.where.append(f"({sql})")
+        self.params.extend(params)
+        return self
+
+    # --- modifiers
+    def order(self, column, desc=False, **kw):
+        # Postgres: NULLS LAST ascending, NULLS FIRST descending
+        self.orders.append(f"{_ident(column)} {'desc nulls first' if desc else 'asc nulls last'}")
+        return self
+
+    def limit(self, n, **kw):
+        self._limit = int(n)
+        return self
+
+    def range(self, start, end, **kw):
+        self._offset, self._limit = int(start), int(end) - int(start) + 1
+        return self
+
+    # --- execution
+    def _bind(self, column, value):
+        if column in JSON_COLUMNS.get(self.table, ()) and isinstance(value, (list, dict)):
+            return json.dumps(value)
+        return value
+
+    def _where_sql(self):
+        return f" where {' and '.join(self.where)}" if self.where else ""
+
+    def _decode(self, cursor):
+        names = [d[0] for d in cursor.description]
+        json_cols = JSON_COLUMNS.get(self.table, set())
+        bool_cols = BOOL_COLUMNS.get(self.table, set())
+        rows = []
+        for values in cursor.fetchall():
+            row = dict(zip(names, values))
+            for col in json_cols.intersection(row):
+                if isinstance(row[col], str):
+                    try:
+                        row[col] = json.loads(row[col])
+                    except ValueError:
+                        pass
+            for col in bool_cols.intersection(row):
+                if row[col] is not None:
+                    row[col] = bool(row[col])
+            rows.append(row)
+        return rows
+
+    def _select(self, conn):
+        columns = "*" if self.columns.strip() == "*" else ", ".join(_ident(c) for c in self.columns.split(","))
+        sql = f'select {columns} from "{self.table}"{self._where_sql()}'
+        if self.orders:
+            sql += " order by " + ", ".join(self.orders)
+        if self._limit is not None or self._offset is not None:
+            sql += f" limit {self._limit if self._limit is not None else -1} offset {self._offset or 0}"
+        rows = self._decode(conn.execute(sql, self.params))
+        count = None
+        if self.count:
+            count = conn.execute(f'select count(*) from "{self.table}"{self._where_sql()}', self.params).fetchone()[0]
+        return Response(rows, count)
+
+    def _insert(self, conn):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        conflict = self.on_conflict or PRIMARY_KEYS.get(self.table, "id")
+        keys = [c.strip() for c in conflict.split(",")]
+        out = []
+        for row in rows:
+            cols = list(row)
+            sql = f'insert into "{self.table}" ({", ".join(_ident(c) for c in cols)}) values ({", ".join("?" * len(cols))})'
+            if self.op == "upsert":
+                updates = [c for c in cols if c not in keys]
+                sql += f" on conflict ({', '.join(_ident(c) for c in keys)}) do " + (
+                    "update set " + ", ".join(f"{_ident(c)} = excluded.{_ident(c)}" for c in updates)
+                    if updates else "nothing")
+            sql += " returning *"
+            out.extend(self._decode(conn.execute(sql, [self._bind(c, row[c]) for c in cols])))
+        return Response(out)
+
+    def _update(self, conn):
+        cols = list(self.payload)
+        sql = f'update "{self.table}" set {", ".join(f"{_ident(c)} = ?" for c in cols)}{self._where_sql()} returning *'
+        return Response(self._decode(conn.execute(sql, [self._bind(c, self.payload[c]) for c in cols] + self.params)))
+
+    def _delete(self, conn):
+        return Response(self._decode(conn.execute(f'delete from "{self.table}"{self._where_sql()} returning *', self.params)))
+
+    def execute(self):
+        run = {"select": self._select, "insert": self._insert, "upsert": self._insert,
+               "update": self._update, "delete": self._delete}[self.op]
+        with self.client.lock:
+            conn = self.client.conn
+            if self.op == "select":
+                return run(conn)
+            conn.execute("begin")  # one statement per call, all rows or none
+            try:
+                result = run(conn)
+            except Exception:
+                conn.execute("rollback")
+                raise
+            conn.execute("commit")
+            return result
+
+def _split_top(expr):
+    parts, depth, current = [], 0, ""
+    for ch in expr:
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    parts.append(current)
+    return parts
+
+def _logic(joiner, expr):
+    fragments, params = [], []
+    for part in _split_top(expr):
+        part = part.strip()
+        for nested in ("and", "or"):
+            if part.startswith(nested + "(") and part.endswith(")"):
+                sql, sub = _logic(nested, part[len(nested) + 1:-1])
+                break
+        else:
+            column, op, value = part.split(".", 2)
+            if op == "is" and value == "null":
+                sql, sub = f"{_ident(column)} is null", []
+            else:
+                sql, sub = f"{_ident(column)} {_OPS[op]} ?", [value]
+        fragments.append(f"({sql})")
+        params.extend(sub)
+    return f" {joiner} ".join(fragments), params
+
+class SQLiteClient:
+    """Drop-in for the subset of the supabase client used by this code."""
+    def __init__(self, path="padel.db"):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("pragma foreign_keys = on")
+        if path != ":memory:":
+            self.conn.execute("pragma journal_mode = wal")
+            self.conn.execute("pragma synchronous = normal")
+        self._add_columns()
+        self.conn.executescript(SCHEMA)
+
+    def _add_columns(self):
+        for table, columns in ADDED_COLUMNS.items():
+            have = {r[1] for r in self.conn.execute(f"pragma table_info({table})")}
+            if not have:
+                continue  # new file: SCHEMA creates the table whole
+            for column in columns:
+                if column.split()[0] not in have:
+                    self.conn.execute(f"alter table {table} add column {column}")
+
+    def table(self, name):
+        return Query(self, name)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,34 @@
+import os
+
+# ------------------------------------------------------------
+# Storage backend, chosen by configuration.
+#
+#   STORAGE_BACKEND=supabase (default)  hosted project, SUPABASE_URL / SUPABASE_KEY
+#   STORAGE_BACKEND=sqlite              embedded file at SQLITE_PATH (default padel.db),
+#                                       for single-node self-hosting and local work
+#
+# The interface is the query-builder surface the code already uses:
+#   client.table(name)
+#     .select(columns="*", count=None) | .insert(rows) | .upsert(rows, on_conflict=...)
+#     | .update(values) | .delete()
+#     .eq / .neq / .gt / .gte / .lt / .lte / .in_ / .or_(postgrest logic tree)
+#     .order(column, desc=...) / .limit(n) / .range(start, end)
+#     .execute() -> object with .data (list of row dicts) and .count
+# over the tables users, groups, user_groups, players, couples, matches,
+# next_matches, match_players, daily_stats and recompute_locks. Anything new must work
+# on both backends.
+# ------------------------------------------------------------
+BACKENDS = ("supabase", "sqlite")
+
+def configured_backend() -> str:
+    return os.environ.get("STORAGE_BACKEND", "supabase").strip().lower()
+
+def create_client(backend: str = None, url: str = None, key: str = None):
+    backend = (backend or configured_backend()).lower()
+    if backend == "supabase":
+        from supabase import create_client as create_supabase_client
+        return create_supabase_client(url or os.environ.get("SUPABASE_URL"), key or os.environ.get("SUPABASE_KEY"))
+    if backend == "sqlite":
+        import sqlite_store
+        return sqlite_store.SQLiteClient(os.environ.get("SQLITE_PATH", "padel.db"))
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected one of {', '.join(BACKENDS)})")
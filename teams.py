@@ -0,0 +1,176 @@
+import time
+
+# ------------------------------------------------------------
+# Team balancing for /propose_teams.
+#
+# Goal (unchanged): pair the registered players into n // 2 couples so that
+# max(couple strength) - min(couple strength) is as small as possible.
+#
+# Instead of enumerating every set of couples, sweep a window [lo, hi] over
+# the sorted couple strengths (two pointers) and ask "can everybody be paired
+# using only couples whose strength lies in the window?". That question is a
+# maximum matching on a general graph, answered with Edmonds' blossom
+# algorithm, warm-started from the previous window's matching. Polynomial in
+# the number of players; 24 players take a few milliseconds.
+# ------------------------------------------------------------
+
+def couple_strength(a, b, player_points, couple_points):
+    """Same strength formula the exhaustive search used."""
+    return player_points.get(a, 0) + player_points.get(b, 0) + couple_points.get((a, b), 0)
+
+def _augment_from(root, n, adj, match):
+    """
+    Edmonds' blossom search for an augmenting path starting at the free
+    vertex root. Augments `match` in place and returns True if one was found.
+    """
+    used = [False] * n
+    parent = [-1] * n
+    base = list(range(n))
+
+    def lca(a, b):
+        seen = [False] * n
+        while True:
+            a = base[a]
+            seen[a] = True
+            if match[a] == -1:
+                break
+            a = parent[match[a]]
+        while True:
+            b = base[b]
+            if seen[b]:
+                return b
+            b = parent[match[b]]
+
+    def mark_path(v, b, child, blossom):
+        while base[v] != b:
+            blossom[base[v]] = blossom[base[match[v]]] = True
+            parent[v] = child
+            child = match[v]
+            v = parent[match[v]]
+
+    used[root] = True
+    queue = [root]
+    head = 0
+    while head < len(queue):
+        v = queue[head]
+        head += 1
+        for to in adj[v]:
+            if base[v] == base[to] or match[v] == to:
+                continue
+            if to == root or (match[to] != -1 and parent[match[to]] != -1):
+                cur = lca(v, to)
+                blossom = [False] * n
+                mark_path(v, cur, to, blossom)
+                mark_path(to, cur, v, blossom)
+                for i in range(n):
+                    if blossom[base[i]]:
+                        base[i] = cur
+                        if not used[i]:
+                            used[i] = True
+                            queue.append(i)
+            elif parent[to] == -1:
+                parent[to] = v
+                if match[to] == -1:
+                    # flip the path root ... to
+                    while to != -1:
+                        pv = parent[to]
+                        nxt = match[pv]
+                        match[to] = pv
+                        match[pv] = to
+                        to = nxt
+                    return True
+                used[match[to]] = True
+                queue.append(match[to])
+    return False
+
+def _fill_matching(n, adj, match, target):
+    """Grow `match` until it has `target` couples. Returns True on success."""
+    size = sum(1 for v in range(n) if match[v] > v)
+    for v in range(n):
+        if size >= target:
+            return True
+        if match[v] == -1 and adj[v] and _augment_from(v, n, adj, match):
+            size += 1
+    return size >= target
+
+def _greedy(n, strength):
+    """Strongest with weakest: a quick first answer for the time budget."""
+    solo = sorted(range(n), key=lambda i: sum(strength[i]))
+    couples = []
+    while len(solo) >= 2:
+        couples.append(tuple(sorted((solo.pop(0), solo.pop(-1)))))
+    return couples
+
+def _spread(couples, strength):
+    values = [strength[a][b] for a, b in couples]
+    return max(values) - min(values)
+
+def propose_couples(users, player_points, couple_points, time_budget=None):
+    """
+    Most balanced set of non-overlapping couples.
+    Returns (couples, strengths, optimal): couples as (user_a, user_b) tuples
+    in the order the exhaustive search used to report them, their strengths,
+    and False if time_budget (seconds) ran out before optimality was proven,
+    in which case the best answer found so far is returned.
+    """
+    n = len(users)
+    target = n // 2
+    if target == 0:
+        return [], None, True
+
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+
+    strength = [[0] * n for _ in range(n)]
+    pairs = []
+    for a in range(n):
+        for b in range(a + 1, n):
+            s = couple_strength(users[a], users[b], player_points, couple_points)
+            strength[a][b] = strength[b][a] = s
+            pairs.append((s, a, b))
+    pairs.sort()
+    values = sorted({s for s, _, _ in pairs})
+
+    best = _greedy(n, strength)
+    best_spread = _spread(best, strength)
+    optimal = True
+
+    match = [-1] * n
+    lo_pair = 0  # first pair with strength >= lo
+    j = 0
+    for i, lo in enumerate(values):
+        if best_spread == 0:
+            break
+        while pairs[lo_pair][0] < lo:
+            lo_pair += 1
+        # drop matched couples that fell below the window
+        for v in range(n):
+            if match[v] != -1 and strength[v][match[v]] < lo:
+                match[match[v]] = -1
+                match[v] = -1
+
+        j = max(j, i)
+        while j < len(values) and values[j] - lo < best_spread:
+            if deadline is not None and time.perf_counter() > deadline:
+                optimal = False
+                break
+            hi = values[j]
+            adj = [[] for _ in range(n)]
+            for k in range(lo_pair, len(pairs)):
+                s, a, b = pairs[k]
+                if s > hi:
+                    break
+                adj[a].append(b)
+                adj[b].append(a)
+            # cheap necessary condition before running the matching
+            if sum(1 for v in range(n) if adj[v]) >= 2 * target and _fill_matching(n, adj, match, target):
+                best = [(v, match[v]) for v in range(n) if match[v] > v]
+                best_spread = hi - lo
+                break
+            j += 1
+        if not optimal or j == len(values):
+            break
+
+    best.sort()
+    couples = [(users[a], users[b]) for a, b in best]
+    strengths = [strength[a][b] for a, b in best]
+    return couples, strengths, optimal
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))  # fake_supabase, synthetic
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """The in-memory Supabase stand-in, installed as the client of main and web_api."""
+    from fake_supabase import FakeSupabase
+    import main
+    import web_api
+    client = FakeSupabase()
+    monkeypatch.setattr(main, "supabase", client)
+    monkeypatch.setattr(web_api, "supabase", client)
+    return client
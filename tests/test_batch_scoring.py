@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+import batch_scoring
+from main import BATCH_SCORING_MIN_MATCHES, _calculate_team_points_from_sets, _score_sets_many
+
+EDGE_CASES = [[], [[6, 0]], [[0, 6]], [[6, 0], [1, 0]], [[4, 0], [3, 0]], [[6, 6]], [[6, 1], [5, 7], [6, 4]],
+              [[7, 6]], [[7, 5], [6, 7], [7, 6]], [[6, 4], None], [[6, 4], "6-4"], [[1], [1, 2, 3]]]
+
+
+def random_sets(rnd):
+    """Anything the sets column can hold, weighted towards real scores."""
+    sets = []
+    for _ in range(rnd.choice([0, 1, 2, 2, 3, 3, 4])):
+        roll = rnd.random()
+        if roll < 0.75:
+            a = rnd.choice([6, 6, 6, 7])
+            b = rnd.randint(0, 7 if a == 7 else 4)
+            sets.append([a, b] if rnd.random() < 0.5 else [b, a])
+        elif roll < 0.85:
+            g = rnd.randint(0, 7)
+            sets.append([g, g])  # unfinished set
+        elif roll < 0.95:
+            sets.append([rnd.randint(-2, 15), rnd.randint(-2, 15)])
+        else:
+            sets.append(rnd.choice([[1], [1, 2, 3], "6-4", None, []]))  # malformed entry
+    return sets
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_batch_matches_scalar(seed):
+    rnd = random.Random(seed)
+    cases = [random_sets(rnd) for _ in range(1000)]
+    assert batch_scoring.score_sets_many(cases) == [_calculate_team_points_from_sets(s) for s in cases]
+
+
+@pytest.mark.parametrize("sets", EDGE_CASES, ids=repr)
+def test_batch_matches_scalar_edge_cases(sets):
+    assert batch_scoring.score_sets_many([sets]) == [_calculate_team_points_from_sets(sets)]
+
+
+@pytest.mark.parametrize("huge", [10 ** 20, -10 ** 20, 2 ** 63, batch_scoring.MAX_GAMES + 1])
+def test_games_beyond_int64_fall_back_to_scalar(huge):
+    cases = [[[huge, 0]], [[0, huge], [6, 4]]] + [[[6, 4]]] * BATCH_SCORING_MIN_MATCHES
+    assert _score_sets_many(cases) == [_calculate_team_points_from_sets(s) for s in cases]
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db
+import web_api
+
+GROUP = "g1"
+
+
+@pytest.fixture
+def group(fake, monkeypatch):
+    for name in "ABCD":
+        fake.table("players").insert({"group_id": GROUP, "name": name}).execute()
+    ids = [p["id"] for p in fake.tables["players"]]
+    for day in range(1, 6):
+        fake.table("matches").insert({"group_id": GROUP, "match_date": f"2024-01-0{day}",
+                                      "team1": ids[:2], "team2": ids[2:], "sets": [[6, day]]}).execute()
+    monkeypatch.setattr(web_api, "EXPORT_PAGE", 2)
+    return fake
+
+
+@pytest.fixture
+def failing_second_page(monkeypatch):
+    """db.execute fails on the second matches page of the export."""
+    execute = db.execute
+    pages = []
+
+    async def flaky(query):
+        if getattr(query, "table", None) == "matches":
+            pages.append(query)
+            if len(pages) == 2:
+                raise RuntimeError("connection reset")
+        return await execute(query)
+
+    monkeypatch.setattr(db, "execute", flaky)
+
+
+def test_export_complete(group):
+    client = TestClient(web_api.app)
+    csv_lines = client.get("/export_matches", params={"group_id": GROUP, "format": "csv"}).text.splitlines()
+    assert len(csv_lines) == 1 + 5
+    ndjson = [json.loads(line) for line in client.get("/export_matches", params={"group_id": GROUP}).text.splitlines()]
+    assert [m["date"] for m in ndjson] == [f"2024-01-0{d}" for d in range(1, 6)]
+
+
+def test_csv_export_failing_midway_is_cut_off(group, failing_second_page):
+    client = TestClient(web_api.app)
+    # the body stops without its final chunk: the client gets an error, not a short CSV
+    with pytest.raises(RuntimeError, match="connection reset"):
+        client.get("/export_matches", params={"group_id": GROUP, "format": "csv"})
+
+
+def test_ndjson_export_failing_midway_ends_with_error_line(group, failing_second_page):
+    client = TestClient(web_api.app)
+    lines = [json.loads(line) for line in client.get("/export_matches", params={"group_id": GROUP}).text.splitlines()]
+    assert len(lines) == 3
+    assert lines[-1] == {"error": "connection reset"}
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from teams import couple_strength, propose_couples
+
+
+def brute_force_spread(users, player_points, couple_points):
+    """Smallest max - min strength over every set of n // 2 disjoint couples."""
+    target = len(users) // 2
+    best = None
+
+    def search(free, strengths):
+        nonlocal best
+        if len(strengths) == target:
+            spread = max(strengths) - min(strengths)
+            if best is None or spread < best:
+                best = spread
+            return
+        if len(free) < 2 * (target - len(strengths)):
+            return
+        first, rest = free[0], free[1:]
+        for k, partner in enumerate(rest):
+            s = couple_strength(first, partner, player_points, couple_points)
+            search(rest[:k] + rest[k + 1:], strengths + [s])
+        if len(free) % 2:  # with an odd count one player sits out
+            search(rest, strengths)
+
+    search(list(users), [])
+    return best
+
+
+def random_group(rnd, n):
+    users = [f"u{i}" for i in range(n)]
+    player_points = {u: rnd.randint(0, 12) for u in users}
+    couple_points = {}
+    for i, a in enumerate(users):
+        for b in users[i + 1:]:
+            if rnd.random() < 0.3:
+                couple_points[(a, b)] = rnd.randint(-3, 3)
+    return users, player_points, couple_points
+
+
+@pytest.mark.parametrize("n", range(2, 11))
+@pytest.mark.parametrize("seed", range(15))
+def test_propose_couples_matches_brute_force(n, seed):
+    users, player_points, couple_points = random_group(random.Random(seed * 100 + n), n)
+    couples, strengths, optimal = propose_couples(users, player_points, couple_points)
+
+    assert optimal
+    assert len(couples) == n // 2
+    players = [u for c in couples for u in c]
+    assert len(set(players)) == len(players) and set(players) <= set(users)
+    assert strengths == [couple_strength(a, b, player_points, couple_points) for a, b in couples]
+    assert max(strengths) - min(strengths) == brute_force_spread(users, player_points, couple_points)
+
+
+def test_propose_couples_too_few_players():
+    assert propose_couples(["u0"], {"u0": 3}, {}) == ([], None, True)
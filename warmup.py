@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+import db
+import main
+import recompute
+import snapshot
+import storage
+
+# ------------------------------------------------------------
+# Background warm-up after a cold start.
+#
+# The app answers requests as soon as it has started; the work a first
+# request would otherwise pay for runs in the background instead:
+#   client       build the storage client (imports supabase)
+#   connections  WARMUP_CONNECTIONS concurrent cheap queries, so the pool
+#                holds open TLS connections before real traffic needs them
+#   recover      queue full replays of groups whose ratings recompute was
+#                cut short by a restart (recompute.recover)
+#   scorer       import the NumPy batch scorer
+#   snapshots    load the snapshots of the busiest groups (most matches
+#                among the latest WARMUP_RECENT_MATCHES rows), or of
+#                WARMUP_GROUPS=<id>,<id> when given
+#   realtime     Supabase Realtime subscription (SNAPSHOT_REALTIME=1)
+# /readyz turns ready once client and connections are done (retried every
+# WARMUP_RETRY_SECONDS while they fail); the later steps only make the
+# first reads faster, so their failures are reported but do not block
+# readiness. WARMUP=0 skips all of it (ready at once, everything lazy)
+# except recover, which is about correctness, not speed.
+# ------------------------------------------------------------
+ENABLED = os.environ.get("WARMUP", "1") != "0"
+CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", "4"))
+SNAPSHOT_GROUPS = int(os.environ.get("WARMUP_SNAPSHOT_GROUPS", "5"))
+RECENT_MATCHES = int(os.environ.get("WARMUP_RECENT_MATCHES", "500"))
+RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", "5"))
+
+_STARTED = time.time()
+
+state = {
+    "status": "pending",   # pending | running | failed (retrying) | ready | skipped
+    "ready": False,
+    "steps": {},           # step -> seconds
+    "errors": {},          # step -> message
+    "groups": [],          # snapshots preloaded
+    "recovered": [],       # groups queued for a full replay at startup
+    "started_at": None,
+    "finished_at": None,
+}
+realtime_client = None
+
+def uptime():
+    return round(time.time() - _STARTED, 3)
+
+def hot_groups(limit=SNAPSHOT_GROUPS):
+    explicit = [g.strip() for g in os.environ.get("WARMUP_GROUPS", "").split(",") if g.strip()]
+    if explicit:
+        return explicit
+    rows = main.supabase.table("matches").select("group_id") \
+        .order("id", desc=True).limit(RECENT_MATCHES).execute().data or []
+    counts = Counter(r["group_id"] for r in rows if r.get("group_id"))
+    return [g for g, _ in counts.most_common(limit)]
+
+async def _step(name, fn, critical=False):
+    started = time.perf_counter()
+    try:
+        await fn()
+    except Exception as e:
+        print(f"Warm-up step {name} failed:", e)
+        state["errors"][name] = str(e)
+        if critical:
+            raise
+    finally:
+        state["steps"][name] = round(time.perf_counter() - started, 4)
+
+async def _connections():
+    await db.gather(*(main.supabase.table("groups").select("id").limit(1) for _ in range(CONNECTIONS)))
+
+async def _snapshots():
+    state["groups"] = await db.run(hot_groups)
+    await asyncio.gather(*(snapshot.get(g) for g in state["groups"]))
+
+async def _recover():
+    state["recovered"] = await db.run(recompute.recover)
+
+async def _realtime():
+    global realtime_client
+    if snapshot.REALTIME and storage.configured_backend() == "supabase":
+        realtime_client = await snapshot.start_realtime()
+
+async def run():
+    if not ENABLED:
+        state.update(status="skipped", ready=True)
+        await _step("recover", _recover)
+        return
+    state.update(status="running", started_at=time.time())
+    while True:
+        try:
+            await _step("client", lambda: db.run(main.get_client), critical=True)
+            await _step("connections", _connections, critical=True)
+            break
+        except Exception:
+            state["status"] = "failed"  # not ready; try again
+            await asyncio.sleep(RETRY_SECONDS)
+    state["errors"].clear()
+    state["ready"] = True
+    await _step("recover", _recover)
+    await _step("scorer", lambda: db.run(main.load_batch_scoring))
+    await _step("snapshots", _snapshots)
+    await _step("realtime", _realtime)
+    state.update(status="ready", finished_at=time.time())
+
+async def stop():
+    if realtime_client is not None:
+        await realtime_client.remove_all_channels()
@@ -1,14 +1,34 @@
-from fastapi import FastAPI, Request, Query
+from fastapi import FastAPI, Request, Query, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from typing import Optional
 from fastapi import Query
-from itertools import combinations
 from fastapi.responses import JSONResponse
-from main import update_ratings_for_group
+from starlette.concurrency import run_in_threadpool
 import uuid
+import base64
 import main  # <-- Imports your business logic and supabase client
+import db  # <-- Runs supabase calls off the event loop
+import recompute  # <-- Background, coalesced ratings recompute per group
+import teams  # <-- Couple balancing for /propose_teams
+import scheduler  # <-- Multi-court session plans
+import read_cache  # <-- Group-scoped cache for the hot GET endpoints
+import data_version  # <-- Per-group data version behind the ETags
+import loaders  # <-- Request-scoped batching loaders (one in_() query per table)
+import importer  # <-- Bulk CSV / NDJSON match import
+import snapshot  # <-- Decoded per-group players / couples / matches in memory
+import warmup  # <-- Background warm-up after a cold start, /readyz
+import metrics  # <-- Route latency and PostgREST round-trips, /metrics
+import profiling  # <-- Opt-in request profiles, /admin/profiles
+import leaderboard  # <-- Date-range leaderboards from daily_stats, and the global one
+import skill  # <-- Elo skill ratings (groups.rating_mode = 'skill')
+import group_lock  # <-- Per-group recompute lock (counters on /metrics)
 import json
+import asyncio
+from contextlib import asynccontextmanager
+import csv
+import io
+from datetime import date
 
 
 def normalize_name(name: str) -> str:
@@ -26,7 +46,15 @@ def safe_json_list(value):
     return []
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Serve at once; client, connections and hot snapshots warm up behind (warmup.py)
+    task = asyncio.create_task(warmup.run())
+    yield
+    task.cancel()
+    await warmup.stop()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     ##allow_origins=["https://padel-chi.vercel.appss"],
@@ -35,9 +63,88 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)  # inside metrics: sees the route label
+app.add_middleware(metrics.MetricsMiddleware)
 
 supabase = main.supabase  # Use the same Supabase client as in main.py
 
+def request_loaders():
+    # FastAPI dependency: fresh loaders (and memo) for every request
+    return loaders.Loaders(supabase)
+
+# --- Player references ---
+# Match rows, couples and registrations store players.id; the API keeps
+# speaking nicknames (main.player_ref on the way in, _names on the way out).
+async def _group_players(group_id):
+    return (await db.execute(supabase.table("players").select("id,name").eq("group_id", group_id))).data or []
+
+def _names_by_id(players):
+    return {str(p["id"]): p["name"] for p in players}
+
+def _names(refs, names_by_id):
+    """Nicknames of stored references (ids, or nicknames in rows not migrated yet)."""
+    return [names_by_id.get(str(p), p) for p in refs]
+
+# --- Match formatting ---
+# Shared by /matches, /all_results, /last_games, /matches_paged and
+# /export_matches so every view decodes a stored row the same way.
+def _match_sets(m):
+    """sets as [[g1, g2], ...]; a malformed set reads as [0, 0]."""
+    sets = []
+    for s in safe_json_list(m.get("sets")):
+        try:
+            sets.append([int(s[0]), int(s[1])] if isinstance(s, list) and len(s) == 2 else [0, 0])
+        except (TypeError, ValueError):
+            sets.append([0, 0])
+    return sets
+
+def _sets_string(sets):
+    # "6-4, 3-6, 7-5"
+    return ", ".join(f"{s[0]}-{s[1]}" for s in sets) if sets else ""
+
+def _set_scores(sets):
+    """(sets won by team1, sets won by team2), or (None, None) without sets."""
+    if not sets:
+        return None, None
+    return sum(1 for s in sets if s[0] > s[1]), sum(1 for s in sets if s[1] > s[0])
+
+def _match_item(m, names_by_id):
+    team1 = safe_json_list(m.get("team1"))
+    team2 = safe_json_list(m.get("team2"))
+    sets = _match_sets(m)
+    score1, score2 = _set_scores(sets)
+    return {
+        "id": m.get("id"),
+        "date": m.get("match_date"),
+        "team1": _names(team1, names_by_id),
+        "team2": _names(team2, names_by_id),
+        "team1_raw": _names(team1, names_by_id),  # <-- names as stored before player ids
+        "team2_raw": _names(team2, names_by_id),
+        "team1_ids": team1,
+        "team2_ids": team2,
+        "sets": sets,
+        "sets_string": _sets_string(sets),
+        "score1": score1,
+        "score2": score2,
+    }
+
+# --- Conditional GETs ---
+async def _not_modified(request: Request, response: Response, group_id):
+    """
+    Tag a group-scoped GET with the group's data version. Returns a 304
+    response when the client's If-None-Match is still current.
+    """
+    if not group_id:
+        return None
+    await data_version.sync(group_id)  # writes made by other workers
+    tag = data_version.etag(group_id, request.url.path, request.url.query)
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}  # no-cache: browsers revalidate every time
+    if data_version.matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
 # --- Group Management ---
 @app.post("/create_group")
 async def create_group(request: Request):
@@ -47,36 +154,33 @@ async def create_group(request: Request):
     group_id = str(uuid.uuid4())
 
     try:
-        user_res = supabase.table("users").select("nickname").eq("username", username).execute()
+        user_res = await db.execute(supabase.table("users").select("nickname").eq("username", username))
         if hasattr(user_res, "status_code") and user_res.status_code >= 400:
             return {"error": getattr(user_res, "data", None)}
         nickname = user_res.data[0]["nickname"] if user_res.data and user_res.data[0].get("nickname") else username
 
-        supabase.table("groups").insert({"id": group_id, "name": group_name}).execute()
-        supabase.table("user_groups").insert({"username": username, "group_id": group_id}).execute()
-        supabase.table("players").insert({
+        await db.execute(supabase.table("groups").insert({"id": group_id, "name": group_name}))
+        await db.execute(supabase.table("user_groups").insert({"username": username, "group_id": group_id}))
+        await db.execute(supabase.table("players").insert({
             "name": nickname,
             "group_id": group_id,
             "total_points": 0,
             "sets_won": 0,
             "matches_played": 0,
             "matches_won": 0
-        }).execute()
+        }))
+        data_version.bump(group_id)
         return {"message": f"Group '{group_name}' created successfully!", "id": group_id}
     except Exception as e:
         print("Error in /create_group:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/view_groups")
-def view_groups(username: str):
+async def view_groups(username: str, loader: loaders.Loaders = Depends(request_loaders)):
     try:
-        memberships = supabase.table("user_groups").select("*").eq("username", username).execute().data
+        memberships = await loader.user_groups.load(username)
         group_ids = [m["group_id"] for m in memberships]
-        groups = []
-        for gid in group_ids:
-            group = supabase.table("groups").select("*").eq("id", gid).execute().data
-            if group:
-                groups.append(group[0])
+        groups = [g for g in await loader.groups.load_many(group_ids) if g]
         return {"groups": groups}
     except Exception as e:
         print("Error in /view_groups:", e)
@@ -87,11 +191,14 @@ async def delete_group(request: Request):
     data = await request.json()
     group_id = data.get("group_id")
     try:
-        supabase.table("user_groups").delete().eq("group_id", group_id).execute()
-        supabase.table("matches").delete().eq("group_id", group_id).execute()
-        supabase.table("next_matches").delete().eq("group_id", group_id).execute()
-        supabase.table("players").delete().eq("group_id", group_id).execute()
-        supabase.table("groups").delete().eq("id", group_id).execute()
+        await db.execute(supabase.table("user_groups").delete().eq("group_id", group_id))
+        await db.execute(supabase.table("match_players").delete().eq("group_id", group_id))
+        await db.execute(supabase.table("matches").delete().eq("group_id", group_id))
+        await db.execute(supabase.table("next_matches").delete().eq("group_id", group_id))
+        await db.execute(supabase.table("players").delete().eq("group_id", group_id))
+        await db.execute(supabase.table("daily_stats").delete().eq("group_id", group_id))
+        await db.execute(supabase.table("groups").delete().eq("id", group_id))
+        data_version.bump(group_id)
         return {"message": f"Group '{group_id}' deleted."}
     except Exception as e:
         print("Error in /delete_group:", e)
@@ -104,33 +211,35 @@ async def add_player_to_group(request: Request):
     group_id = data.get("group_id")
     nickname = data.get("nickname")
     try:
-        existing = supabase.table("players") \
+        existing = (await db.execute(supabase.table("players") \
             .select("*") \
             .eq("name", nickname) \
-            .eq("group_id", group_id) \
-            .execute().data
+            .eq("group_id", group_id))).data
         if existing:
             return {"message": f"Player '{nickname}' already exists in this group.", "name": nickname}
-        supabase.table("players").insert({
+        await db.execute(supabase.table("players").insert({
             "name": nickname,
             "group_id": group_id,
             "total_points": 0,
             "sets_won": 0,
             "matches_played": 0,
             "matches_won": 0
-        }).execute()
+        }))
+        data_version.bump(group_id)
         return {"message": f"Player '{nickname}' added to group!", "name": nickname, "nickname": nickname}
     except Exception as e:
         print("Error in /add_player_to_group:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/players")
-def get_players(group_id: Optional[str] = Query(None)):
+async def get_players(request: Request, response: Response, group_id: Optional[str] = Query(None)):
+    not_modified = await _not_modified(request, response, group_id)
+    if not_modified:
+        return not_modified
     try:
-        query = supabase.table("players").select("*")
         if group_id:
-            query = query.eq("group_id", group_id)
-        players = query.execute().data
+            return (await snapshot.get(group_id)).players
+        players = (await db.execute(supabase.table("players").select("*"))).data
         return players
     except Exception as e:
         print("Error in /players:", e)
@@ -142,7 +251,15 @@ async def remove_player_from_group(request: Request):
     group_id = data.get("group_id")
     name = data.get("name")
     try:
-        supabase.table("players").delete().eq("name", name).eq("group_id", group_id).execute()
+        removed = (await db.execute(supabase.table("players").select("id,name").eq("name", name).eq("group_id", group_id))).data
+        for row in removed:
+            # history keeps the nickname once the id is gone
+            await db.run(main.detach_player_refs, group_id, row["id"], row["name"])
+        await db.execute(supabase.table("players").delete().eq("name", name).eq("group_id", group_id))
+        if removed:
+            await db.run(main.rebuild_match_players, group_id)
+            recompute.enqueue(group_id, full=True)
+        data_version.bump(group_id)
         return {"message": f"Player '{name}' removed from group."}
     except Exception as e:
         print("Error in /remove_player_from_group:", e)
@@ -155,21 +272,35 @@ async def create_next_match(request: Request):
     group_id = data.get("group_id")
     match_date = data.get("match_date")
     try:
-        supabase.table("next_matches").insert({
+        await db.execute(supabase.table("next_matches").insert({
             "group_id": group_id,
             "match_date": match_date,
             "registered_users": []
-        }).execute()
+        }))
+        data_version.bump(group_id)
         return {"message": "Next match created!"}
     except Exception as e:
         print("Error in /create_next_match:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
+async def _load_next_matches(group_id):
+    matches_res, players_res = await db.gather(
+        supabase.table("next_matches").select("*").eq("group_id", group_id),
+        supabase.table("players").select("id,name").eq("group_id", group_id),
+    )
+    matches, names_by_id = matches_res.data, _names_by_id(players_res.data)
+    for m in matches:
+        m["registered_ids"] = m.get("registered_users") or []
+        m["registered_users"] = _names(m["registered_ids"], names_by_id)
+    return {"matches": matches}
+
 @app.get("/next_matches")
-def get_next_matches(group_id: str):
+async def get_next_matches(request: Request, response: Response, group_id: str):
+    not_modified = await _not_modified(request, response, group_id)
+    if not_modified:
+        return not_modified
     try:
-        matches = supabase.table("next_matches").select("*").eq("group_id", group_id).execute().data
-        return {"matches": matches}
+        return await read_cache.get_or_load("next_matches", group_id, lambda: _load_next_matches(group_id))
     except Exception as e:
         print("Error in /next_matches:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -181,13 +312,19 @@ async def add_player_to_next_match(request: Request):
     match_date = data.get("match_date")
     username = data.get("username")
     try:
-        match = supabase.table("next_matches").select("*").eq("group_id", group_id).eq("match_date", match_date).execute().data
+        match_res, players_res = await db.gather(
+            supabase.table("next_matches").select("*").eq("group_id", group_id).eq("match_date", match_date),
+            supabase.table("players").select("id,name").eq("group_id", group_id),
+        )
+        match, aliases = match_res.data, main.player_aliases(players_res.data)
         if not match:
             return {"error": "Match not found."}
         reg_users = match[0]["registered_users"] or []
-        if username not in reg_users:
-            reg_users.append(username)
-            supabase.table("next_matches").update({"registered_users": reg_users}).eq("id", match[0]["id"]).execute()
+        key = main.player_key(username, aliases)
+        if key not in {main.player_key(u, aliases) for u in reg_users}:
+            reg_users.append(main.player_ref(username, aliases))
+            await db.execute(supabase.table("next_matches").update({"registered_users": reg_users}).eq("id", match[0]["id"]))
+            data_version.bump(group_id)
         return {"message": f"Player '{username}' added to next match."}
     except Exception as e:
         print("Error in /add_player_to_next_match:", e)
@@ -200,12 +337,18 @@ async def remove_player_from_next_match(request: Request):
     match_date = data.get("match_date")
     username = data.get("username")
     try:
-        match = supabase.table("next_matches").select("*").eq("group_id", group_id).eq("match_date", match_date).execute().data
+        match_res, players_res = await db.gather(
+            supabase.table("next_matches").select("*").eq("group_id", group_id).eq("match_date", match_date),
+            supabase.table("players").select("id,name").eq("group_id", group_id),
+        )
+        match, aliases = match_res.data, main.player_aliases(players_res.data)
         if match:
             reg_users = match[0]["registered_users"] or []
-            if username in reg_users:
-                reg_users.remove(username)
-                supabase.table("next_matches").update({"registered_users": reg_users}).eq("id", match[0]["id"]).execute()
+            key = main.player_key(username, aliases)
+            if key in {main.player_key(u, aliases) for u in reg_users}:
+                reg_users = [u for u in reg_users if main.player_key(u, aliases) != key]
+                await db.execute(supabase.table("next_matches").update({"registered_users": reg_users}).eq("id", match[0]["id"]))
+                data_version.bump(group_id)
         return {"message": f"Removed {username} from next match."}
     except Exception as e:
         print("Error in /remove_player_from_next_match:", e)
@@ -217,7 +360,8 @@ async def delete_next_match(request: Request):
     group_id = data.get("group_id")
     match_id = data.get("match_id")
     try:
-        supabase.table("next_matches").delete().eq("id", match_id).eq("group_id", group_id).execute()
+        await db.execute(supabase.table("next_matches").delete().eq("id", match_id).eq("group_id", group_id))
+        data_version.bump(group_id)
         return {"message": f"Match '{match_id}' deleted."}
     except Exception as e:
         print("Error in /delete_next_match:", e)
@@ -236,52 +380,42 @@ async def register_match_result(request: Request):
     if not (group_id and couples and results):
         return {"error": "Missing required fields."}
     try:
+        # Nicknames from the UI are stored as players.id
+        aliases = main.player_aliases(await _group_players(group_id))
+
         # Prepare couples as list of player id pairs, ordered for uniqueness
         couples_ids = []
         for couple in couples:
             sorted_couple = sorted(couple)
             if len(sorted_couple) != 2:
                 return {"error": f"Each couple must have exactly 2 player IDs: {couple}"}
-            couples_ids.append(sorted_couple)
+            couples_ids.append([main.player_ref(p, aliases) for p in sorted_couple])
 
         # --- Fetch all matches for this group and day ---
-        existing_matches = supabase.table("matches") \
+        existing_matches = (await db.execute(supabase.table("matches") \
             .select("team1,team2,next_match_id") \
             .eq("group_id", group_id) \
-            .eq("match_date", match_date) \
-            .execute().data
+            .eq("match_date", match_date))).data
 
         # --- Duplicate couple combination check for the same day ---
+        # (one canonical matchup key per match instead of pairwise comparisons)
+        taken = {
+            main.matchup_key(match_date, safe_json_list(m.get("team1")), safe_json_list(m.get("team2")), aliases)
+            for m in existing_matches
+            # If updating itself, allow
+            if not (match_id and str(m.get("next_match_id")) == str(match_id))
+        }
         for res in results:
-            team1_ids = sorted(res["team1"])
-            team2_ids = sorted(res["team2"])
-            if len(team1_ids) != 2 or len(team2_ids) != 2:
+            if len(res["team1"]) != 2 or len(res["team2"]) != 2:
                 return {"error": "Each team must have exactly 2 player IDs."}
-
-            for match in existing_matches:
-                # Parse team1/team2 if stored as string
-                import json
-                m_team1 = match.get("team1", [])
-                m_team2 = match.get("team2", [])
-                if isinstance(m_team1, str):
-                    try: m_team1 = json.loads(m_team1)
-                    except Exception: m_team1 = []
-                if isinstance(m_team2, str):
-                    try: m_team2 = json.loads(m_team2)
-                    except Exception: m_team2 = []
-
-                # Check for duplicate (order-insensitive)
-                if ((sorted(m_team1) == team1_ids and sorted(m_team2) == team2_ids) or
-                    (sorted(m_team1) == team2_ids and sorted(m_team2) == team1_ids)):
-                    # If updating itself, allow
-                    if match_id and str(match.get("next_match_id")) == str(match_id):
-                        continue
-                    return {"error": "This couple combination already exists for this day."}
+            if main.matchup_key(match_date, res["team1"], res["team2"], aliases) in taken:
+                return {"error": "This couple combination already exists for this day."}
 
         # --- Insert results ---
+        inserted = []
         for res in results:
-            team1_ids = sorted(res["team1"])
-            team2_ids = sorted(res["team2"])
+            team1_ids = [main.player_ref(p, aliases) for p in sorted(res["team1"])]
+            team2_ids = [main.player_ref(p, aliases) for p in sorted(res["team2"])]
             insert_data = {
                 "group_id": group_id,
                 "match_date": match_date,
@@ -293,20 +427,51 @@ async def register_match_result(request: Request):
             }
             if match_id:
                 insert_data["next_match_id"] = match_id
-            resp = supabase.table("matches").insert(insert_data).execute()
+            resp = await db.execute(supabase.table("matches").insert(insert_data))
             if hasattr(resp, "status_code") and resp.status_code >= 400:
                 return {"error": getattr(resp, "data", None)}
+            inserted.extend(resp.data or [])
 
         if match_id:
-            supabase.table("next_matches").delete().eq("id", match_id).execute()
-
-        # --- Call your main.py logic here ---
-        main.update_ratings_for_group(group_id)
-        return {"message": "Results registered!"}
+            await db.execute(supabase.table("next_matches").delete().eq("id", match_id))
+
+        # --- Keep the participant index in step, queue your main.py logic
+        # (only the new matches' delta, in the background) ---
+        changes = [(None, row) for row in inserted]
+        await db.run(main.sync_match_players, changes, aliases)
+        data_version.bump(group_id)
+        version = recompute.enqueue(group_id, changes)
+        return {"message": "Results registered!", "ratings": "pending", "ratings_version": version}
     except Exception as e:
         print("Error in /register_match_result:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
     
+# --- Match edits under the group lock ---
+# An edit's (old, new) rows feed the incremental recompute, so the old row
+# must be the one the update replaced: two concurrent edits of a match that
+# both read the same old row would subtract it twice. The read and the
+# write run under group_lock.hold (across workers with
+# RECOMPUTE_LOCK=database), so concurrent edits chain (X -> A, A -> B).
+def _update_match_rows(group_id, column, value, update_for):
+    """[(old, new)] of the matches where column = value; update_for(idx, row) -> update dict."""
+    with group_lock.hold(group_id):
+        changes = []
+        olds = supabase.table("matches").select("*").eq(column, value).execute().data or []
+        for idx, old in enumerate(olds):
+            update_data = update_for(idx, old)
+            resp = supabase.table("matches").update(update_data).eq("id", old["id"]).execute()
+            if hasattr(resp, "status_code") and resp.status_code >= 400:
+                return changes, getattr(resp, "data", None)
+            changes.append((old, resp.data[0] if resp.data else {**old, **update_data}))
+        return changes, None
+
+def _delete_match_row(group_id, match_id):
+    """[(old, None)] of the deleted match."""
+    with group_lock.hold(group_id):
+        old = supabase.table("matches").select("*").eq("id", match_id).execute().data
+        supabase.table("matches").delete().eq("id", match_id).execute()
+        return [(old[0], None)] if old else []
+
 @app.post("/update_match_result")
 async def update_match_result(request: Request):
     data = await request.json()
@@ -315,16 +480,19 @@ async def update_match_result(request: Request):
     couples = data.get("couples")
     results = data.get("results")
     try:
-        matches = supabase.table("matches").select("*").eq("next_match_id", match_id).execute().data
-
-        for idx, match in enumerate(matches):
-            team1_ids = sorted(results[idx]["team1"])
-            team2_ids = sorted(results[idx]["team2"])
+        players_res = await db.execute(supabase.table("players").select("id,name").eq("group_id", group_id))
+        aliases = main.player_aliases(players_res.data)
+        if couples:
+            couples = [[main.player_ref(p, aliases) for p in couple] for couple in couples]
+
+        def update_for(idx, match):
+            team1_ids = [main.player_ref(p, aliases) for p in sorted(results[idx]["team1"])]
+            team2_ids = [main.player_ref(p, aliases) for p in sorted(results[idx]["team2"])]
             sets = results[idx].get("sets", [])
             score1 = sum(1 for s in sets if s[0] > s[1])
             score2 = sum(1 for s in sets if s[1] > s[0])
 
-            update_data = {
+            return {
                 "team1": team1_ids,
                 "team2": team2_ids,
                 "sets": sets,
@@ -332,97 +500,107 @@ async def update_match_result(request: Request):
                 "score2": score2,
                 "couples": couples
             }
-            resp = supabase.table("matches").update(update_data).eq("id", match["id"]).execute()
-            if hasattr(resp, "status_code") and resp.status_code >= 400:
-                return {"error": getattr(resp, "data", None)}
 
-        # --- Call your main.py logic here ---
-        main.update_ratings_for_group(group_id)
-        return {"message": "Result updated!"}
+        changes, error = await db.run(_update_match_rows, group_id, "next_match_id", match_id, update_for)
+        if error is not None:
+            return {"error": error}
+
+        # --- Keep the participant index in step, queue your main.py logic
+        # (only the edited matches' delta, in the background) ---
+        await db.run(main.sync_match_players, changes, aliases)
+        data_version.bump(group_id)
+        version = recompute.enqueue(group_id, changes)
+        return {"message": "Result updated!", "ratings": "pending", "ratings_version": version}
     except Exception as e:
         print("Error in /update_match_result:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/matches")
-def get_matches(group_id: Optional[str] = Query(None)):
+async def get_matches(request: Request, response: Response, group_id: Optional[str] = Query(None)):
+    not_modified = await _not_modified(request, response, group_id)
+    if not_modified:
+        return not_modified
     try:
-        query = supabase.table("matches").select("*")
         if group_id:
-            query = query.eq("group_id", group_id)
-        matches = query.execute().data
-        return {"matches": matches}
+            # oldest to newest
+            snap = await snapshot.get(group_id)
+            matches, names_by_id = [r.as_row() for r in snap.matches], snap.names_by_id()
+        else:
+            matches_res, players_res = await db.gather(
+                supabase.table("matches").select("*").order("match_date", desc=False),
+                supabase.table("players").select("id, name"),
+            )
+            matches, names_by_id = matches_res.data, _names_by_id(players_res.data)
+
+        result = [
+            {**_match_item(m, names_by_id),
+             "couples": [_names(safe_json_list(c), names_by_id) for c in safe_json_list(m.get("couples"))]}
+            for m in matches
+        ]
+        return {"matches": result}
     except Exception as e:
         print("Error in /matches:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 # --- Ratings Endpoints ---
+# Cached per group; main.py invalidates when the ratings are rewritten.
+async def _load_player_ratings(group_id):
+    players = (await db.execute(supabase.table("players").select("*").eq("group_id", group_id))).data
+    return {"players": players}
+
 @app.get("/player_ratings")
-def player_ratings(group_id: str):
+async def player_ratings(request: Request, response: Response, group_id: str):
+    not_modified = await _not_modified(request, response, group_id)
+    if not_modified:
+        return not_modified
     try:
-        players = supabase.table("players").select("*").eq("group_id", group_id).execute().data
-        return {"players": players}
+        return await read_cache.get_or_load("player_ratings", group_id, lambda: _load_player_ratings(group_id))
     except Exception as e:
         print("Error in /player_ratings:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
+def _couple_ratings(snap):
+    names_by_id = snap.names_by_id()
+    couples = []
+    for c in snap.couples:
+        name1, name2 = _names([c["player1"], c["player2"]], names_by_id)
+        couples.append({**c, "player1_name": name1, "player2_name": name2})
+    return {"couples": couples}
+
 @app.get("/couple_ratings")
-def couple_ratings(group_id: str):
+async def couple_ratings(request: Request, response: Response, group_id: str):
+    not_modified = await _not_modified(request, response, group_id)
+    if not_modified:
+        return not_modified
     try:
-        couples = supabase.table("couples").select("*").eq("group_id", group_id).execute().data
-        players = supabase.table("players").select("id, name").eq("group_id", group_id).execute().data
-        id_to_name = {p["id"]: p["name"] for p in players}
-        for c in couples:
-            c["player1_name"] = id_to_name.get(c["player1"], c["player1"])
-            c["player2_name"] = id_to_name.get(c["player2"], c["player2"])
-        return {"couples": couples}
+        return _couple_ratings(await snapshot.get(group_id))
     except Exception as e:
         print("Error in /couple_ratings:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.post("/set_nickname")
-async def set_nickname(request: Request):
+async def set_nickname(request: Request, loader: loaders.Loaders = Depends(request_loaders)):
     data = await request.json()
     username = data.get("username")  # This should be the user's email
     new_nickname = data.get("nickname")
     try:
         # 1. Get old nickname
-        user_row = supabase.table("users").select("nickname").eq("username", username).execute().data
+        user_row = (await db.execute(supabase.table("users").select("nickname").eq("username", username))).data
         old_nickname = user_row[0]["nickname"] if user_row and user_row[0].get("nickname") else username
 
         # 2. Update nickname in users table
-        supabase.table("users").update({"nickname": new_nickname}).eq("username", username).execute()
-
-        # 3. For each group the user is in, update player and matches
-        user_groups = supabase.table("user_groups").select("group_id").eq("username", username).execute().data
-        for group in user_groups:
-            group_id = group["group_id"]
-            # Update player's name
-            supabase.table("players").update({"name": new_nickname}).eq("group_id", group_id).eq("name", old_nickname).execute()
-            # Update matches
-            matches = supabase.table("matches").select("*").eq("group_id", group_id).execute().data
-            for match in matches:
-                import json
-                team1 = match.get("team1", [])
-                team2 = match.get("team2", [])
-                couples = match.get("couples", [])
-                if isinstance(team1, str):
-                    try: team1 = json.loads(team1)
-                    except Exception: team1 = []
-                if isinstance(team2, str):
-                    try: team2 = json.loads(team2)
-                    except Exception: team2 = []
-                if isinstance(couples, str):
-                    try: couples = json.loads(couples)
-                    except Exception: couples = []
-                new_team1 = [new_nickname if p == old_nickname else p for p in team1]
-                new_team2 = [new_nickname if p == old_nickname else p for p in team2]
-                new_couples = [[new_nickname if p == old_nickname else p for p in couple] for couple in couples]
-                if team1 != new_team1 or team2 != new_team2 or couples != new_couples:
-                    supabase.table("matches").update({
-                        "team1": json.dumps(new_team1),
-                        "team2": json.dumps(new_team2),
-                        "couples": json.dumps(new_couples)
-                    }).eq("id", match["id"]).execute()
+        await db.execute(supabase.table("users").update({"nickname": new_nickname}).eq("username", username))
+
+        # 3. Rename the player in every group the user is in. Matches refer to
+        #    players.id, so once a group is migrated that is its players row only:
+        #    one update for all groups.
+        group_ids = [g["group_id"] for g in await loader.user_groups.load(username)]
+        for group in await loader.groups.load_many(group_ids):
+            if group and not group.get("player_refs_migrated"):
+                await db.run(main.migrate_group_player_ids, group["id"])
+        if group_ids:
+            await db.execute(supabase.table("players").update({"name": new_nickname}).in_("group_id", group_ids).eq("name", old_nickname))
+        data_version.bump_many(group_ids)
 
         return {"message": "Nickname updated everywhere!"}
     except Exception as e:
@@ -431,64 +609,54 @@ async def set_nickname(request: Request):
 
 # --- Propose Teams Endpoint ---
 @app.get("/propose_teams")
-def propose_teams(group_id: str, match_date: str):
+async def propose_teams(group_id: str, match_date: str, time_budget_ms: Optional[int] = None, balance: str = "points"):
     import json
 
+    # balance=skill pairs on the players' skill ratings (skill.py) instead
+    # of points; couples have no skill rating of their own
+    if balance not in skill.MODES:
+        return JSONResponse({"error": f"Unknown balance '{balance}'."}, status_code=400)
     try:
         # 1. Get registered users for the match
-        match = supabase.table("next_matches").select("*").eq("group_id", group_id).eq("match_date", match_date).execute().data
+        match = (await db.execute(supabase.table("next_matches").select("*").eq("group_id", group_id).eq("match_date", match_date))).data
         if not match:
             return {"couples": [], "leftover": None}
-        users = match[0].get("registered_users", [])
+        # 2. Get player points / 3. Get couple points
+        if balance == "skill":
+            players_res = await db.execute(supabase.table("players").select("id,name,skill_rating").eq("group_id", group_id))
+            couples_res = None
+        else:
+            players_res, couples_res = await db.gather(
+                supabase.table("players").select("id,name,total_points").eq("group_id", group_id),
+                supabase.table("couples").select("player1,player2,total_points").eq("group_id", group_id),
+            )
+        players_data = players_res.data
+        names_by_id = _names_by_id(players_data)
+        if balance == "skill":
+            player_points = {p["name"]: p["skill_rating"] if p.get("skill_rating") is not None else skill.INITIAL
+                             for p in players_data}
+        else:
+            player_points = {p["name"]: p.get("total_points", 0) for p in players_data}
+
+        users = _names(match[0].get("registered_users") or [], names_by_id)
         if not users or len(users) < 2:
             return {"couples": [], "leftover": users[0] if users else None}
 
-        # 2. Get player points
-        players_data = supabase.table("players").select("name,total_points").eq("group_id", group_id).execute().data
-        player_points = {p["name"]: p.get("total_points", 0) for p in players_data}
-
-        # 3. Get couple points
-        couples_data = supabase.table("couples").select("player1,player2,total_points").eq("group_id", group_id).execute().data
+        couples_data = couples_res.data if couples_res is not None else []
         couple_points = {}
         for c in couples_data:
-            key1 = (c["player1"], c["player2"])
-            key2 = (c["player2"], c["player1"])
+            key1 = tuple(_names([c["player1"], c["player2"]], names_by_id))
+            key2 = key1[::-1]
             couple_points[key1] = c.get("total_points", 0)
             couple_points[key2] = c.get("total_points", 0)
 
-        # 4. Generate all possible couples
-        all_couples = list(combinations(users, 2))
-
-        # 5. Find best set of non-overlapping couples
+        # 4./5. Find best set of non-overlapping couples (off the event loop).
+        # With time_budget_ms the best answer found so far is returned.
         n = len(users)
-        max_couples = n // 2
-        best_combo = None
-        min_diff = float('inf')
-        best_strengths = None
-
-        def is_non_overlapping(combo):
-            used = set()
-            for c in combo:
-                if c[0] in used or c[1] in used:
-                    return False
-                used.add(c[0])
-                used.add(c[1])
-            return True
-
-        from itertools import combinations as iter_combinations
-
-        for combo in iter_combinations(all_couples, max_couples):
-            if not is_non_overlapping(combo):
-                continue
-            strengths = []
-            for c in combo:
-                pts = player_points.get(c[0], 0) + player_points.get(c[1], 0) + couple_points.get((c[0], c[1]), 0)
-                strengths.append(pts)
-            diff = max(strengths) - min(strengths)
-            if diff < min_diff:
-                min_diff = diff
-                best_combo = combo
-                best_strengths = strengths
+        time_budget = time_budget_ms / 1000.0 if time_budget_ms else None
+        best_combo, best_strengths, optimal = await run_in_threadpool(
+            teams.propose_couples, users, player_points, couple_points, time_budget
+        )
 
         # 6. Handle leftover player if odd number
         leftover = None
@@ -502,16 +670,78 @@ def propose_teams(group_id: str, match_date: str):
 
         couples = [list(c) for c in best_combo] if best_combo else []
 
+        if balance == "skill" and best_strengths:
+            best_strengths = [round(v, 1) for v in best_strengths]
+
         return {
             "couples": couples,
             "leftover": leftover,
-            "couple_strengths": best_strengths
+            "couple_strengths": best_strengths,
+            "optimal": optimal,
+            "balance": balance,
         }
 
     except Exception as e:
         print("Error in /propose_teams:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
+# --- Session Scheduler Endpoint ---
+SCHEDULE_MAX_ROUNDS = 50
+SCHEDULE_MIN_BUDGET_MS = 50
+SCHEDULE_MAX_BUDGET_MS = 10000
+
+@app.post("/schedule_session")
+async def schedule_session(request: Request):
+    # Multi-round, multi-court plan (Americano / Mexicano) for a session.
+    # Players come from the body or from the next match's registered users.
+    data = await request.json()
+    group_id = data.get("group_id")
+    match_date = data.get("match_date")
+    players = data.get("players")
+    mode = data.get("mode") or "americano"
+    if not group_id:
+        return {"error": "Missing required fields."}
+    if mode not in ("americano", "mexicano"):
+        return JSONResponse({"error": f"Unknown mode '{mode}'."}, status_code=400)
+    try:
+        courts = int(data.get("courts") or 1)
+        rounds = int(data.get("rounds") or 1)
+        time_budget_ms = int(data.get("time_budget_ms") or 1000)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "courts, rounds and time_budget_ms must be integers."}, status_code=400)
+    if courts < 1 or rounds < 1:
+        return JSONResponse({"error": "courts and rounds must be at least 1."}, status_code=400)
+    rounds = min(rounds, SCHEDULE_MAX_ROUNDS)
+    time_budget_ms = max(SCHEDULE_MIN_BUDGET_MS, min(time_budget_ms, SCHEDULE_MAX_BUDGET_MS))
+
+    try:
+        players_res, couples_res = await db.gather(
+            supabase.table("players").select("id,name,total_points").eq("group_id", group_id),
+            supabase.table("couples").select("player1,player2,total_points").eq("group_id", group_id),
+        )
+        names_by_id = _names_by_id(players_res.data)
+        if not players:
+            match = (await db.execute(supabase.table("next_matches").select("*").eq("group_id", group_id).eq("match_date", match_date))).data
+            players = _names((match[0].get("registered_users") or []) if match else [], names_by_id)
+        if len(players) < 4:
+            return {"error": "At least 4 players are needed.", "rounds": []}
+
+        player_points = {p["name"]: p.get("total_points", 0) for p in players_res.data}
+        couple_points = {}
+        for c in couples_res.data:
+            a, b = _names([c["player1"], c["player2"]], names_by_id)
+            couple_points[(a, b)] = c.get("total_points", 0)
+            couple_points[(b, a)] = c.get("total_points", 0)
+
+        plan = await run_in_threadpool(
+            scheduler.schedule_session, players, courts, rounds, player_points, couple_points,
+            mode, time_budget_ms / 1000.0, data.get("seed"),
+        )
+        return plan
+    except Exception as e:
+        print("Error in /schedule_session:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
 @app.post("/link_user_to_player")
 async def link_user_to_player(request: Request):
     data = await request.json()
@@ -525,52 +755,25 @@ async def link_user_to_player(request: Request):
 
     try:
         # 1. Add user to user_groups if not already present
-        user_group_exists = supabase.table("user_groups").select("*").eq("username", username).eq("group_id", group_id).execute().data
+        user_group_exists = (await db.execute(supabase.table("user_groups").select("*").eq("username", username).eq("group_id", group_id))).data
         if not user_group_exists:
-            supabase.table("user_groups").insert({"username": username, "group_id": group_id}).execute()
+            await db.execute(supabase.table("user_groups").insert({"username": username, "group_id": group_id}))
 
         # 2. Check for duplicate player name in group
-        existing = supabase.table("players").select("*").eq("name", new_nickname).eq("group_id", group_id).execute().data
+        existing = (await db.execute(supabase.table("players").select("*").eq("name", new_nickname).eq("group_id", group_id))).data
         if existing and player_name != new_nickname:
             return JSONResponse({"error": f"Player with name '{new_nickname}' already exists in this group."}, status_code=400)
 
         # 3. Update user's nickname in users table
-        supabase.table("users").update({"nickname": new_nickname}).eq("username", username).execute()
+        await db.execute(supabase.table("users").update({"nickname": new_nickname}).eq("username", username))
 
-        # 4. Update player's name in the group
-        update_result = supabase.table("players").update({"name": new_nickname}).eq("group_id", group_id).eq("name", player_name).execute()
+        # 4. Update player's name in the group (matches refer to players.id;
+        #    a no-op migration once the group is migrated)
+        await db.run(main.migrate_group_player_ids, group_id)
+        update_result = await db.execute(supabase.table("players").update({"name": new_nickname}).eq("group_id", group_id).eq("name", player_name))
         if not update_result.data or (isinstance(update_result.data, list) and len(update_result.data) == 0):
             return JSONResponse({"error": "Player not found in group."}, status_code=404)
-
-        # 5. Update all matches in the group where the old nickname appears
-        matches = supabase.table("matches").select("*").eq("group_id", group_id).execute().data
-        for match in matches:
-            import json
-            team1 = match.get("team1", [])
-            team2 = match.get("team2", [])
-            couples = match.get("couples", [])
-
-            if isinstance(team1, str):
-                try: team1 = json.loads(team1)
-                except Exception: team1 = []
-            if isinstance(team2, str):
-                try: team2 = json.loads(team2)
-                except Exception: team2 = []
-            if isinstance(couples, str):
-                try: couples = json.loads(couples)
-                except Exception: couples = []
-
-            new_team1 = [new_nickname if p == player_name else p for p in team1]
-            new_team2 = [new_nickname if p == player_name else p for p in team2]
-            new_couples = [[new_nickname if p == player_name else p for p in couple] for couple in couples]
-
-            if team1 != new_team1 or team2 != new_team2 or couples != new_couples:
-                supabase.table("matches").update({
-
-                    "team1": json.dumps(new_team1),
-                    "team2": json.dumps(new_team2),
-                    "couples": json.dumps(new_couples)
-                }).eq("id", match["id"]).execute()
+        data_version.bump(group_id)
 
         return {"message": "User linked to player and nicknames updated"}
     except Exception as e:
@@ -585,21 +788,25 @@ async def register_in_group(request: Request):
     nickname = data.get("nickname")
     try:
         # Insert into user_groups if not already present
-        existing = supabase.table("user_groups").select("*").eq("username", username).eq("group_id", group_id).execute().data
+        existing = (await db.execute(supabase.table("user_groups").select("*").eq("username", username).eq("group_id", group_id))).data
         if not existing:
-            supabase.table("user_groups").insert({"username": username, "group_id": group_id}).execute()
+            await db.execute(supabase.table("user_groups").insert({"username": username, "group_id": group_id}))
+            data_version.bump(group_id, tables=("user_groups",))
         # Optionally update nickname
         if nickname:
-            supabase.table("users").update({"nickname": nickname}).eq("username", username).execute()
+            await db.execute(supabase.table("users").update({"nickname": nickname}).eq("username", username))
+            # the user's player in each of their groups goes by the nickname
+            memberships = (await db.execute(supabase.table("user_groups").select("group_id").eq("username", username))).data or []
+            data_version.bump_many([m["group_id"] for m in memberships], tables=("user_groups",))
         return {"message": "User registered in group!"}
     except Exception as e:
         print("Error in /register_in_group:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/get_nickname")
-def get_nickname(username: str):
+async def get_nickname(username: str):
     try:
-        user = supabase.table("users").select("nickname").eq("username", username).execute()
+        user = await db.execute(supabase.table("users").select("nickname").eq("username", username))
         data = getattr(user, "data", None)
         if data and isinstance(data, list) and len(data) > 0 and "nickname" in data[0]:
             return {"nickname": data[0]["nickname"]}
@@ -609,62 +816,55 @@ def get_nickname(username: str):
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+# --- Bulk Import Endpoint ---
+@app.post("/import_matches")
+async def import_matches(request: Request, group_id: str, format: Optional[str] = None,
+                         create_players: bool = False, dry_run: bool = False):
+    # Body: CSV (with header) or NDJSON, streamed; see importer.py for the columns.
+    # Bad rows are reported per line; everything inserted gets one recompute.
+    fmt = (format or "").lower()
+    if not fmt:
+        fmt = "ndjson" if "json" in request.headers.get("content-type", "") else "csv"
+    if fmt not in ("csv", "ndjson"):
+        return JSONResponse({"error": f"Unknown format '{fmt}' (csv or ndjson)."}, status_code=400)
+    try:
+        report, changes = await importer.import_matches(group_id, request.stream(), fmt, create_players, dry_run)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        print("Error in /import_matches:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    report["dry_run"] = dry_run
+    if changes or report["players_created"]:
+        data_version.bump(group_id)
+    if changes:
+        report["ratings"] = "pending"
+        report["ratings_version"] = recompute.enqueue(group_id, changes)
+    return report
+
 # --- Last Games Endpoint ---
 @app.get("/last_games")
-def last_games(group_id: str, limit: int = 10):
+async def last_games(request: Request, response: Response, group_id: str, limit: int = 10):
+    not_modified = await _not_modified(request, response, group_id)
+    if not_modified:
+        return not_modified
     try:
-        matches = supabase.table("matches").select("*") \
-            .eq("group_id", group_id) \
-            .order("match_date", desc=True) \
-            .limit(limit).execute().data
-        players = supabase.table("players").select("id, name").eq("group_id", group_id).execute().data
-        id_to_name = {p["id"]: p["name"] for p in players}
+        snap = await snapshot.get(group_id)
+        names_by_id = snap.names_by_id()
 
         result = []
-        for m in matches:
-            # Parse team1/team2
-            team1 = m.get("team1", [])
-            team2 = m.get("team2", [])
-            import json
-            if isinstance(team1, str):
-                try:
-                    team1 = json.loads(team1)
-                except Exception:
-                    team1 = []
-            if isinstance(team2, str):
-                try:
-                    team2 = json.loads(team2)
-                except Exception:
-                    team2 = []
-
-            # Parse sets
-            sets = m.get("sets", [])
-            if isinstance(sets, str):
-                try:
-                    sets = json.loads(sets)
-                except Exception:
-                    sets = []
-
-            # Ensure sets is a list of [int, int]
-            sets = [s if isinstance(s, list) and len(s) == 2 else [0, 0] for s in sets]
-
-            score1 = sum(1 for s in sets if s[0] > s[1]) if sets else None
-            score2 = sum(1 for s in sets if s[1] > s[0]) if sets else None
-
-            # Format sets as "6-4, 3-6, 7-5"
-            sets_string = ', '.join(f"{s[0]}-{s[1]}" for s in sets) if sets else ""
-
-            team1_names = [id_to_name.get(pid, pid) for pid in team1]
-            team2_names = [id_to_name.get(pid, pid) for pid in team2]
-
+        for r in snap.newest_first(limit):
+            m = r.as_row()
+            item = _match_item(m, names_by_id)
             result.append({
-                "date": m.get("match_date"),
-                "team1": team1_names,
-                "team2": team2_names,
-                "score1": score1,
-                "score2": score2,
-                "sets": sets,
-                "sets_string": sets_string,
+                "date": item["date"],
+                "team1": item["team1"],
+                "team2": item["team2"],
+                "score1": item["score1"],
+                "score2": item["score2"],
+                "sets": item["sets"],
+                "sets_string": item["sets_string"],
                 "result": m.get("result", "")
             })
         return {"games": result}
@@ -673,131 +873,140 @@ def last_games(group_id: str, limit: int = 10):
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
-# --- all Games Endpoint ---
-@app.get("/matches")
-def get_matches(group_id: Optional[str] = Query(None)):
-    try:
-        query = supabase.table("matches").select("*")
-        if group_id:
-            query = query.eq("group_id", group_id)
-        # Ensure matches are ordered by match_date ascending (oldest to newest)
-        query = query.order("match_date", desc=False)
-        matches = query.execute().data
-
-        # Get player names for id->name mapping
-        players = supabase.table("players").select("id, name").eq("group_id", group_id).execute().data
-        id_to_name = {p["id"]: p["name"] for p in players}
-
-        result = []
-        for m in matches:
-            import json
-            team1 = m.get("team1", [])
-            team2 = m.get("team2", [])
-            if isinstance(team1, str):
-                try:
-                    team1 = json.loads(team1)
-                except Exception:
-                    team1 = []
-            if isinstance(team2, str):
-                try:
-                    team2 = json.loads(team2)
-                except Exception:
-                    team2 = []
-            sets = m.get("sets", [])
-            if isinstance(sets, str):
-                try:
-                    sets = json.loads(sets)
-                except Exception:
-                    sets = []
-            sets = [s if isinstance(s, list) and len(s) == 2 else [0, 0] for s in sets]
-            sets_string = ', '.join(f"{s[0]}-{s[1]}" for s in sets) if sets else ""
-            result.append({
-                "id": m.get("id"),
-                "date": m.get("match_date"),
-                "team1": [id_to_name.get(pid, pid) for pid in team1],
-                "team2": [id_to_name.get(pid, pid) for pid in team2],
-                "team1_raw": team1,  # raw names/IDs
-                "team2_raw": team2,
-                "sets": sets,
-                "sets_string": sets_string,
-                "score1": sum(1 for s in sets if s[0] > s[1]) if sets else None,
-                "score2": sum(1 for s in sets if s[1] > s[0]) if sets else None,
-            })
-        return {"matches": result}
-    except Exception as e:
-        print("Error in /matches:", e)
-        return JSONResponse({"error": str(e)}, status_code=500)
-    
 @app.get("/all_results")
-def all_results(group_id: str, limit: int = 100):
+async def all_results(request: Request, response: Response, group_id: str, limit: int = 100):
+    not_modified = await _not_modified(request, response, group_id)
+    if not_modified:
+        return not_modified
     try:
-        matches = supabase.table("matches").select("*") \
-            .eq("group_id", group_id) \
-            .order("match_date", desc=True) \
-            .limit(limit).execute().data
-        players = supabase.table("players").select("id, name").eq("group_id", group_id).execute().data
-        id_to_name = {p["id"]: p["name"] for p in players}
-        result = []
-        for m in matches:
-            import json
-            team1 = m.get("team1", [])
-            team2 = m.get("team2", [])
-            if isinstance(team1, str):
-                try: team1 = json.loads(team1)
-                except Exception: team1 = []
-            if isinstance(team2, str):
-                try: team2 = json.loads(team2)
-                except Exception: team2 = []
-            sets = m.get("sets", [])
-            if isinstance(sets, str):
-                try: sets = json.loads(sets)
-                except Exception: sets = []
-            sets = [s if isinstance(s, list) and len(s) == 2 else [0, 0] for s in sets]
-            sets_string = ', '.join(f"{s[0]}-{s[1]}" for s in sets) if sets else ""
-            result.append({
-                "id": m.get("id"),
-                "date": m.get("match_date"),
-                "team1": [id_to_name.get(pid, pid) for pid in team1],
-                "team2": [id_to_name.get(pid, pid) for pid in team2],
-                "team1_raw": team1,  # <-- raw names/IDs
-                "team2_raw": team2,
-                "sets": sets,
-                "sets_string": sets_string,
-                "score1": sum(1 for s in sets if s[0] > s[1]) if sets else None,
-                "score2": sum(1 for s in sets if s[1] > s[0]) if sets else None,
-            })
+        snap = await snapshot.get(group_id)
+        names_by_id = snap.names_by_id()
+        result = [_match_item(r.as_row(), names_by_id) for r in snap.newest_first(limit)]
         return {"games": result}
     except Exception as e:
         print("Error in /all_results:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
+# --- Export Endpoint ---
+EXPORT_PAGE = 500
+EXPORT_CSV_COLUMNS = ["id", "match_date", "team1_a", "team1_b", "team2_a", "team2_b",
+                      "sets", "score1", "score2", "mode"]
+
+def _export_csv_line(m, names_by_id):
+    item = _match_item(m, names_by_id)
+    team1 = (item["team1"] + ["", ""])[:2]
+    team2 = (item["team2"] + ["", ""])[:2]
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(
+        [item["id"], item["date"], *team1, *team2, item["sets_string"],
+         item["score1"], item["score2"], m.get("mode") or ""])
+    return buf.getvalue()
+
+async def _export_lines(group_id, fmt, names_by_id):
+    # Keyset paging on (match_date, id), oldest first: one page in memory at a time.
+    if fmt == "csv":
+        yield ",".join(EXPORT_CSV_COLUMNS) + "\n"
+    after = None
+    try:
+        while True:
+            query = supabase.table("matches").select("*").eq("group_id", group_id)
+            if after:
+                after_date, after_id = after
+                query = query.or_(f"match_date.gt.{after_date},and(match_date.eq.{after_date},id.gt.{after_id})")
+            query = query.order("match_date", desc=False).order("id", desc=False).limit(EXPORT_PAGE)
+            rows = (await db.execute(query)).data or []
+            for m in rows:
+                if fmt == "csv":
+                    yield _export_csv_line(m, names_by_id)
+                else:
+                    yield json.dumps(_match_item(m, names_by_id)) + "\n"
+            if len(rows) < EXPORT_PAGE:
+                return
+            after = (rows[-1].get("match_date"), rows[-1].get("id"))
+    except Exception as e:
+        # The headers (and a 200) are gone already. NDJSON ends with an error
+        # line; a CSV has no room for one that an importer would not take for
+        # data, so the error is re-raised and the chunked body is cut off
+        # without its final chunk: the client sees an incomplete response.
+        print("Error in /export_matches:", e)
+        if fmt == "ndjson":
+            yield json.dumps({"error": str(e)}) + "\n"
+        else:
+            raise
+
+@app.get("/export_matches")
+async def export_matches(group_id: str, format: str = "ndjson"):
+    """
+    A group's full match history, oldest first, streamed as NDJSON (one
+    /all_results item per line) or CSV (columns importable by /import_matches).
+    """
+    fmt = format.lower()
+    if fmt not in ("ndjson", "csv"):
+        return JSONResponse({"error": f"Unknown format '{format}' (ndjson or csv)."}, status_code=400)
+    try:
+        names_by_id = _names_by_id(await _group_players(group_id))
+    except Exception as e:
+        print("Error in /export_matches:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"matches-{group_id}.{fmt}"
+    return StreamingResponse(_export_lines(group_id, fmt, names_by_id), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 # --- edit Games Endpoint ---
 @app.post("/edit_result")
 async def edit_result(request: Request):
     data = await request.json()
     match_id = data.get("match_id")
     group_id = data.get("group_id")
-    sets = data.get("sets")
-    team1 = data.get("team1")
-    team2 = data.get("team2")
-    try:
-        supabase.table("matches").update({
-            "sets": sets,
-            "team1": team1,
-            "team2": team2
-        }).eq("id", match_id).execute()
-        update_ratings_for_group(group_id)
-        return {"message": "Result updated and points recalculated."}
+    if not any(field in data for field in ("sets", "team1", "team2")):
+        return JSONResponse({"error": "Nothing to update (sets, team1, team2)."}, status_code=400)
+    try:
+        players_res = await db.execute(supabase.table("players").select("id,name").eq("group_id", group_id))
+        aliases = main.player_aliases(players_res.data)
+        # only the fields the request carries: the others keep their stored values
+        update_data = {}
+        if "sets" in data:
+            update_data["sets"] = data["sets"]
+        for team in ("team1", "team2"):
+            if team in data:
+                update_data[team] = [main.player_ref(p, aliases) for p in data[team] or []]
+        changes, error = await db.run(_update_match_rows, group_id, "id", match_id, lambda idx, old: update_data)
+        if error is not None:
+            return {"error": error}
+        if not changes:
+            return JSONResponse({"error": "Match not found."}, status_code=404)
+        await db.run(main.sync_match_players, changes, aliases)
+        data_version.bump(group_id)
+        version = recompute.enqueue(group_id, changes)
+        return {"message": "Result updated; points are being recalculated.", "ratings": "pending", "ratings_version": version}
     except Exception as e:
         print("Error in /edit_result:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
     
+def _encode_cursor(match_date, match_id):
+    raw = json.dumps([match_date, match_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    match_date, match_id = json.loads(raw)
+    # values go into a PostgREST or=() filter: no separators allowed
+    if any(ch in str(match_date) + str(match_id) for ch in ",()"):
+        raise ValueError("bad cursor")
+    return match_date, match_id
+
+def _paged_item(m, names_by_id):
+    item = _match_item(m, names_by_id)
+    return {k: item[k] for k in ("id", "date", "team1", "team2", "sets", "sets_string", "score1", "score2")}
+
 @app.get("/matches_paged")
-def matches_paged(
+async def matches_paged(
     group_id: str,
     page: int = 1,
     limit: int = 10,
     player_name: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
 ):
     try:
         if page < 1:
@@ -805,71 +1014,43 @@ def matches_paged(
         if limit < 1 or limit > 50:
             limit = 10
 
-        # We filter in Python because team1/team2 are stored as JSON strings.
-        # For "all results for this player", we need total count of filtered set.
-        # Fetch a reasonable number (increase later if needed).
-        fetch_limit = 2000
-
-        resp = (
-            supabase.table("matches")
-            .select("*")
-            .eq("group_id", group_id)
-            .order("match_date", desc=True)
-            .limit(fetch_limit)
-            .execute()
-        )
-        all_matches = resp.data or []
-
-        needle = normalize_name(player_name) if player_name else ""
-
-        filtered = []
-        for m in all_matches:
-            team1 = safe_json_list(m.get("team1"))
-            team2 = safe_json_list(m.get("team2"))
-            sets = safe_json_list(m.get("sets"))
-
-            team1_norm = [normalize_name(x) for x in team1]
-            team2_norm = [normalize_name(x) for x in team2]
-
-            if needle:
-                if needle not in team1_norm and needle not in team2_norm:
-                    continue
-
-            # compute sets_string + score
-            sets_clean = []
-            for s in sets:
-                if isinstance(s, list) and len(s) == 2:
-                    try:
-                        sets_clean.append([int(s[0]), int(s[1])])
-                    except Exception:
-                        pass
-
-            sets_string = ", ".join(f"{s[0]}-{s[1]}" for s in sets_clean) if sets_clean else ""
-            score1 = sum(1 for s in sets_clean if s[0] > s[1]) if sets_clean else None
-            score2 = sum(1 for s in sets_clean if s[1] > s[0]) if sets_clean else None
-
-            filtered.append({
-                "id": m.get("id"),
-                "date": m.get("match_date"),
-                "team1": team1,  # keep original names
-                "team2": team2,
-                "sets": sets_clean,
-                "sets_string": sets_string,
-                "score1": score1,
-                "score2": score2,
-            })
-
-        total = len(filtered)
-        start = (page - 1) * limit
-        end = start + limit
-        page_items = filtered[start:end]
+        try:
+            after = _decode_cursor(cursor) if cursor else None
+        except Exception:
+            return JSONResponse({"error": "Invalid cursor."}, status_code=400)
+
+        snap = await snapshot.get(group_id)
+        names_by_id = snap.names_by_id()
+        aliases = main.player_aliases(snap.players)
+        needle = main.player_key(player_name, aliases) if player_name else ""
+
+        # Newest first by (match_date, id), continued from the cursor (or
+        # from the page offset); for a player, only the matches they played.
+        # total counts them all, whatever page or cursor.
+        if needle:
+            records = [r for r in snap.newest_first() if needle in {main.player_key(p, aliases) for p in r.refs()}]
+            total = len(records)
+            if after:
+                key = (after[0] or "", after[1])
+                records = records[next((i for i, r in enumerate(records) if r.order_key() < key), len(records)):]
+        else:
+            total = len(snap.matches)
+            records = snap.newest_first(before=after)
+        start = 0 if after else (page - 1) * limit
+        rows = records[start:start + limit + 1]  # one extra row tells us whether there is a next page
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        page_items = [_paged_item(r.as_row(), names_by_id) for r in rows]
+        next_cursor = _encode_cursor(rows[-1].match_date, rows[-1].id) if has_more and rows else None
 
         return {
             "matches": page_items,
             "page": page,
             "limit": limit,
             "total": total,
-            "has_more": end < total,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
         }
 
     except Exception as e:
@@ -884,18 +1065,246 @@ async def delete_result(request: Request):
     match_id = data.get("match_id")
     group_id = data.get("group_id")
     try:
-        supabase.table("matches").delete().eq("id", match_id).execute()
-        update_ratings_for_group(group_id)
-        return {"message": "Result deleted and points recalculated."}
+        changes = await db.run(_delete_match_row, group_id, match_id)
+        await db.run(main.sync_match_players, changes)
+        data_version.bump(group_id)
+        version = recompute.enqueue(group_id, changes)
+        return {"message": "Result deleted; points are being recalculated.", "ratings": "pending", "ratings_version": version}
     except Exception as e:
         print("Error in /delete_result:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.post("/recalculate_points")
-def recalculate_points(group_id: str):
+async def recalculate_points(group_id: str):
+    # Full replay: the repair path for anything the incremental mode missed
     try:
-        update_ratings_for_group(group_id)
-        return {"message": "Points recalculated successfully."}
+        await db.run(main.rebuild_match_players, group_id)
+        stats = await db.run(recompute.run_now, group_id)  # joins a full replay already running
+        return {"message": "Points recalculated successfully.", "stats": stats}
     except Exception as e:
         print("Error in /recalculate_points:", e)
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/verify_ratings")
+async def verify_ratings(group_id: str):
+    # Compares stored ratings with a full in-memory replay (no writes)
+    try:
+        mismatches = await db.run(main.verify_ratings_for_group, group_id)
+        if mismatches is None:
+            return JSONResponse({"error": "Could not load matches."}, status_code=500)
+        return {"consistent": not mismatches, "mismatches": mismatches}
+    except Exception as e:
+        print("Error in /verify_ratings:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/player_history")
+async def player_history(group_id: str, player_name: str, limit: int = main.LAST_N_MATCHES):
+    # A player's last-8 breakdown from the ledger (match_players): what each
+    # match gave them and the running total. Reads only, no recompute.
+    try:
+        limit = max(1, min(limit, 50))
+        result = await db.run(main.player_history, group_id, player_name, limit)
+        if result is None:
+            return JSONResponse({"error": "Player not found in group."}, status_code=404)
+        names = result["names"]
+        items, running = [], 0
+        for h in result["history"]:
+            m = result["matches"].get(h["match_id"], {})
+            own, other = ("team1", "team2") if h["team"] == "team1" else ("team2", "team1")
+            running += h["player_points"]
+            items.append({
+                "match_id": h["match_id"],
+                "date": h["match_date"],
+                "team": _names(safe_json_list(m.get(own)), names),
+                "opponents": _names(safe_json_list(m.get(other)), names),
+                "sets_string": _sets_string(_match_sets(m)),
+                "won": bool(h["won_match"]),
+                "team_points": h["team_points"],
+                "player_points": h["player_points"],
+                "sets_won": h["sets_won"],
+                "running_points": running,
+            })
+        return {
+            "player": result["name"],
+            "player_id": result["player_id"],
+            "matches": items,
+            "last_8": result["window"],
+            "stored": result["stored"],
+            "up_to_date": result["window"] == result["stored"],
+            "source": result["source"],
+        }
+    except Exception as e:
+        print("Error in /player_history:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/leaderboard")
+async def leaderboard_endpoint(
+    group_id: str,
+    kind: str = "player",
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = 10,
+    sort: str = "points",
+):
+    # Top players or couples over [from, to] (YYYY-MM-DD, both inclusive,
+    # either may be left out): this month, a season, all time
+    if kind not in leaderboard.KINDS:
+        return JSONResponse({"error": f"Unknown kind '{kind}'."}, status_code=400)
+    if sort not in leaderboard.SORTS:
+        return JSONResponse({"error": f"Unknown sort '{sort}'."}, status_code=400)
+    try:
+        # normalized: the board compares them with daily_stats dates as strings
+        date_from = date.fromisoformat(date_from).isoformat() if date_from else None
+        date_to = date.fromisoformat(date_to).isoformat() if date_to else None
+    except ValueError:
+        return JSONResponse({"error": "from and to must be dates (YYYY-MM-DD)."}, status_code=400)
+    try:
+        limit = max(1, min(limit, 100))
+        board, snap = await asyncio.gather(leaderboard.get(group_id), snapshot.get(group_id))
+        names = snap.names_by_id()
+        entries = []
+        for rank, ((p1, p2), (points, sets_won, played, won)) in enumerate(
+                board.top(kind, date_from, date_to, limit, sort), start=1):
+            entry = {"rank": rank, "total_points": points, "sets_won": sets_won,
+                     "matches_played": played, "matches_won": won}
+            if kind == "player":
+                entry["player"] = names.get(p1, p1)
+            else:
+                entry["players"] = _names([p1, p2], names)
+            entries.append(entry)
+        return {"group_id": group_id, "kind": kind, "from": date_from, "to": date_to, "sort": sort, "entries": entries}
+    except Exception as e:
+        print("Error in /leaderboard:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.post("/set_rating_mode")
+async def set_rating_mode(request: Request):
+    # {"group_id": ..., "mode": "points" | "skill", "k": optional Elo K}.
+    # Turning skill ratings on (or changing K) replays the group once;
+    # after that every new result updates its four players in O(1).
+    data = await request.json()
+    group_id = data.get("group_id")
+    mode = data.get("mode")
+    k = data.get("k")
+    if not group_id or mode not in skill.MODES:
+        return JSONResponse({"error": f"mode must be one of {', '.join(skill.MODES)}."}, status_code=400)
+    try:
+        k = float(k) if k is not None else None
+        if k is not None and not 0 < k <= 200:
+            raise ValueError(k)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "k must be a number in (0, 200]."}, status_code=400)
+    try:
+        io = await db.run(main.set_rating_mode, group_id, mode, k)
+        if io is None:
+            return JSONResponse({"error": "Could not load matches."}, status_code=500)
+        return {"message": f"Group rates by {mode}.", "mode": mode, "k": k if k is not None else skill.K, **io}
+    except Exception as e:
+        print("Error in /set_rating_mode:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/skill_ratings")
+async def skill_ratings(group_id: str):
+    # Players by skill rating, in groups that keep them (see /set_rating_mode)
+    try:
+        group_res, players_res = await db.gather(
+            supabase.table("groups").select("rating_mode,skill_k").eq("id", group_id),
+            supabase.table("players").select("name,skill_rating,skill_matches").eq("group_id", group_id),
+        )
+        settings = group_res.data[0] if group_res.data else {}
+        mode = settings.get("rating_mode") or "points"
+        players = []
+        if mode == "skill":
+            players = [{"name": p["name"],
+                        "skill_rating": round(p["skill_rating"] if p.get("skill_rating") is not None else skill.INITIAL, 1),
+                        "skill_matches": int(p.get("skill_matches") or 0)} for p in players_res.data or []]
+            players.sort(key=lambda p: (-p["skill_rating"], p["name"] or ""))
+        return {"group_id": group_id, "mode": mode, "k": settings.get("skill_k") or skill.K, "players": players}
+    except Exception as e:
+        print("Error in /skill_ratings:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/global_leaderboard")
+async def global_leaderboard(offset: int = 0, limit: int = 20, username: Optional[str] = None):
+    # Every user across all of their groups (sum of their player rows),
+    # a page at a time; with username, also that user's own entry
+    try:
+        offset, limit = max(0, offset), max(1, min(limit, 100))
+        body = await leaderboard.global_page(offset, limit)
+        body.update({"offset": offset, "limit": limit})
+        if username:
+            body["me"] = await leaderboard.global_rank(username)
+        return body
+    except Exception as e:
+        print("Error in /global_leaderboard:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/ratings_status")
+async def ratings_status(group_id: str, version: Optional[int] = None, wait: float = 0):
+    # Lets the UI wait for the recompute that covers its write:
+    # /ratings_status?group_id=...&version=<ratings_version>&wait=10
+    try:
+        if wait > 0 and version is not None:
+            await run_in_threadpool(recompute.wait, group_id, version, min(wait, 30))
+        return recompute.status(group_id, version)
+    except Exception as e:
+        print("Error in /ratings_status:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# --- Health ---
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process is up and serving
+    return {"status": "ok", "uptime_seconds": warmup.uptime()}
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: 503 until the warm-up has a client and open connections
+    body = {"ready": warmup.state["ready"], **warmup.state, "uptime_seconds": warmup.uptime()}
+    return JSONResponse(body, status_code=200 if warmup.state["ready"] else 503)
+
+@app.get("/cache_stats")
+async def cache_stats():
+    # Hit / miss / eviction counters of the group read cache, and the
+    # snapshot store's loads and memory use
+    return {**read_cache.stats(), "snapshots": snapshot.stats()}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text format: route latency, round-trips per route and table,
+    # recompute phases, plus the cache / snapshot / lock counters as gauges
+    gauges = {}
+    for prefix, stats in (("padel_read_cache", read_cache.stats()),
+                          ("padel_snapshot", snapshot.stats()),
+                          ("padel_leaderboard", leaderboard.stats()),
+                          ("padel_global_leaderboard", leaderboard.global_stats()),
+                          ("padel_recompute_lock", group_lock.stats())):
+        for name, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges[f"{prefix}_{name}"] = value
+    return Response(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+# --- Admin: stored request profiles (profiling.py) ---
+# Closed (403) while PROFILE_ADMIN_TOKEN is unset, even when sampling records
+# profiles; profiling.py warns about that at startup.
+def _is_admin(request: Request):
+    return profiling.check_token(request.headers.get("x-admin-token"))
+
+@app.get("/admin/profiles")
+async def admin_profiles(request: Request):
+    if not _is_admin(request):
+        return JSONResponse({"error": "Forbidden."}, status_code=403)
+    return {"profiles": await db.run(profiling.list_profiles)}
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_profile(profile_id: str, request: Request, format: str = "collapsed"):
+    # collapsed stacks (flamegraph.pl / speedscope), or the whole record with format=json
+    if not _is_admin(request):
+        return JSONResponse({"error": "Forbidden."}, status_code=403)
+    record = await db.run(profiling.load, profile_id)
+    if record is None:
+        return JSONResponse({"error": "Profile not found."}, status_code=404)
+    if format == "json":
+        return record
+    return Response(profiling.collapsed(record), media_type="text/plain",
+                    headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'})